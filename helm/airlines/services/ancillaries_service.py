@@ -2,9 +2,87 @@
 """Ancillaries Service - In-memory stateful API with meals and seat upgrades"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from service_client import ServiceError, client
+from typing import Dict
 import base_service
+import json
+import logging
+import os
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Flights service that owns the seat inventory, and the bookings service
+# holding each booking's flight and current seat
+FLIGHTS_SERVICE_URL = os.getenv('FLIGHTS_SERVICE_URL', 'http://flights-app:3000')
+BOOKINGS_SERVICE_URL = os.getenv('BOOKINGS_SERVICE_URL', 'http://bookings-app:3000')
+
+
+def get_booking(booking_id: str):
+    """Fetch a booking from the bookings service, bypassing the GET cache
+    since its seat changes with every upgrade.
+
+    Returns (200, booking), or an error status and body: 404 for an
+    unknown booking, 503 when the bookings service can't be reached.
+    """
+    url = f"{BOOKINGS_SERVICE_URL}/bookings/{urllib.parse.quote(booking_id, safe='')}"
+    try:
+        response = client.request('GET', url)
+        if response.status == 404:
+            return 404, {"error": f"Booking {booking_id} not found"}
+        if not response.ok:
+            return 503, {"error": f"Bookings service returned {response.status}"}
+        booking = response.json()
+    except (OSError, ValueError) as e:
+        return 503, {"error": f"Bookings service unavailable: {e}"}
+    if not isinstance(booking, dict):
+        return 503, {"error": "Bookings service returned no booking"}
+    return 200, booking
+
+
+def set_booking_seat(booking_id: str, seat: str):
+    """Record the new seat on the booking; failures are only logged"""
+    url = f"{BOOKINGS_SERVICE_URL}/bookings/{urllib.parse.quote(booking_id, safe='')}"
+    try:
+        response = client.request('PATCH', url, body=json.dumps({"seat_number": seat}).encode(),
+                                  headers={'Content-Type': 'application/json'})
+        if not response.ok:
+            logger.warning("Could not record seat %s on booking %s: %s", seat, booking_id, response.status)
+    except OSError as e:
+        logger.warning("Could not record seat %s on booking %s: %s", seat, booking_id, e)
+
+
+def seat_call(flight_id: str, action: str, payload: Dict):
+    """POST to the flights service seat inventory (confirm or release).
+
+    Returns (status, body) from the flights service, or 503 when it can't
+    be reached.
+    """
+    url = f"{FLIGHTS_SERVICE_URL}/flights/{urllib.parse.quote(flight_id, safe='')}/seats/{action}"
+    try:
+        resp = client.post_json(url, payload)
+    except OSError as e:
+        return 503, {"error": f"Seat inventory unavailable: {e}"}
+    try:
+        return resp.status, resp.json() or {}
+    except ValueError:
+        return resp.status, {"error": f"Seat inventory returned {resp.status}"}
+
+
+def confirm_seat(flight_id: str, seat: str, hold_id=None):
+    """Confirm a seat against the flights service inventory; a hold_id
+    must be a hold on that same seat"""
+    payload = {"seat": seat}
+    if hold_id:
+        payload["hold_id"] = hold_id
+    return seat_call(flight_id, "confirm", payload)
+
+
+def release_seat(flight_id: str, seat: str):
+    """Return a sold seat to the flights service inventory"""
+    return seat_call(flight_id, "release", {"seat": seat})
 
 def setup_ancillaries_routes():
     """Add ancillaries-specific routes"""
@@ -15,9 +93,10 @@ def setup_ancillaries_routes():
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
 
     @app.route('/ancillaries/meals', methods=['GET'])
     def get_meal_options():
@@ -46,7 +125,14 @@ def setup_ancillaries_routes():
 
     @app.route('/ancillaries/seat-upgrade', methods=['POST'])
     def upgrade_seat():
-        """Upgrade seat for a booking"""
+        """Upgrade seat for a booking.
+
+        The seat is confirmed against the flights service seat inventory
+        (optionally consuming a hold_id on that seat) and the upgrade is
+        rejected if the seat is taken or doesn't exist. The booking gives
+        the flight when flight_id is omitted; its previous seat is released
+        and the new one recorded on it.
+        """
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
         data = request.get_json(silent=True) or {}
@@ -54,11 +140,32 @@ def setup_ancillaries_routes():
         new_seat = data.get('new_seat')
         if not booking_id or not new_seat:
             return jsonify({"error": "booking_id and new_seat required"}), 400
+        status, booking = get_booking(booking_id)
+        if status != 200:
+            return jsonify(booking), status
+        flight_id = data.get('flight_id') or booking.get('flight_id')
+        if not flight_id:
+            return jsonify({"error": "flight_id required: booking has no flight"}), 400
+        status, body = confirm_seat(flight_id, new_seat, data.get('hold_id'))
+        if status != 200:
+            return jsonify(body), status
         result = {
             "booking_id": booking_id,
-            "new_seat": new_seat,
+            "flight_id": flight_id,
+            "new_seat": body.get("seat", new_seat),
+            "cabin": body.get("cabin"),
             "status": "upgraded",
         }
+
+        # Give the passenger's previous seat back, once the new one is theirs
+        old_seat = booking.get('seat_number')
+        if old_seat and booking.get('flight_id') == flight_id and old_seat.upper() != result["new_seat"]:
+            status, released = release_seat(flight_id, old_seat)
+            if status == 200:
+                result["released_seat"] = old_seat
+            else:
+                logger.warning("Could not release seat %s on %s: %s", old_seat, flight_id, released.get("error"))
+        set_booking_seat(booking_id, result["new_seat"])
         return jsonify(result), 201
 
 if __name__ == '__main__':
@@ -72,10 +179,8 @@ if __name__ == '__main__':
     create_rest_api('ancillaries')
 
     # Start the server
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info(f"Starting Ancillaries service on port 3000")
     logger.info(f"Endpoints: /ancillaries, /ancillaries/meals, /ancillaries/meal, /ancillaries/seat-upgrade")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -2,7 +2,7 @@
 """Baggage Service - In-memory stateful API with baggage tracking"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
 import base_service
 
@@ -15,17 +15,16 @@ def setup_baggage_routes():
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        # Search in the baggage map
-        raw = base_service.store.raw_data or {}
-        baggage_map = raw.get('baggage', {})
 
-        if filters:
-            results = [bag for bag in baggage_map.values()
-                      if all(bag.get(k) == v for k, v in filters.items())]
-        else:
-            results = list(baggage_map.values())
+        def _search():
+            # Search in the baggage map
+            baggage_map = base_service.store.collection('baggage')
+            if filters:
+                return [bag for bag in baggage_map.values()
+                        if all(bag.get(k) == v for k, v in filters.items())]
+            return list(baggage_map.values())
 
-        return jsonify(results), 200
+        return conditional_jsonify(base_service.store.collection_etag(), _search)
 
     @app.route('/baggage/add', methods=['POST'])
     def add_baggage():
@@ -38,26 +37,31 @@ def setup_baggage_routes():
         if not booking_id:
             return jsonify({"error": "booking_id required"}), 400
 
-        raw = base_service.store.raw_data or {}
-        booking_map = raw.setdefault('baggage/booking', {})
-        baggage_map = raw.setdefault('baggage', {})
+        store = base_service.store
+        booking_map = store.collection('baggage/booking')
+        baggage_map = store.collection('baggage')
 
         new_records = []
-        existing_for_booking = booking_map.setdefault(booking_id, [])
-        for _ in range(bags):
-            bag_tag = f"BT{booking_id}-{len(baggage_map) + 1}"
-            rec = {
-                "bag_tag": bag_tag,
-                "booking_id": booking_id,
-                "weight": data.get('weight', 20),
-                "status": "checked",
-                "location": data.get('location', "JFK"),
-            }
-            existing_for_booking.append(rec)
-            baggage_map[bag_tag] = rec
-            new_records.append(rec)
+        # Side collection values may be copies (shared store), so read,
+        # extend and write back under the store lock
+        with store.lock:
+            for_booking = list(booking_map.get(booking_id, []))
+            for _ in range(bags):
+                bag_tag = f"BT{booking_id}-{len(baggage_map) + 1}"
+                rec = {
+                    "bag_tag": bag_tag,
+                    "booking_id": booking_id,
+                    "weight": data.get('weight', 20),
+                    "status": "checked",
+                    "location": data.get('location', "JFK"),
+                }
+                for_booking.append(rec)
+                baggage_map[bag_tag] = rec
+                new_records.append(rec)
+                store.touch(bag_tag, "create", rec, collection='baggage')
+            booking_map[booking_id] = for_booking
+            store.touch(booking_id, "update", for_booking, collection='baggage/booking')
 
-        base_service.store.raw_data = raw
         return jsonify({"baggage": new_records}), 201
 
     @app.route('/baggage/track/<bag_tag>', methods=['GET'])
@@ -65,11 +69,10 @@ def setup_baggage_routes():
         """Track a specific bag by bag tag"""
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
-        raw = base_service.store.raw_data or {}
-        baggage_map = raw.get('baggage', {})
+        baggage_map = base_service.store.collection('baggage')
         rec = baggage_map.get(bag_tag)
         if rec:
-            return jsonify(rec), 200
+            return conditional_jsonify(base_service.store.record_etag(bag_tag, 'baggage'), lambda: rec)
         return jsonify({"error": "Not found"}), 404
 
     @app.route('/baggage/track/<bag_tag>', methods=['PUT'])
@@ -78,15 +81,15 @@ def setup_baggage_routes():
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
         data = request.get_json(silent=True) or {}
-        raw = base_service.store.raw_data or {}
-        baggage_map = raw.get('baggage', {})
-        rec = baggage_map.get(bag_tag)
-        if not rec:
-            return jsonify({"error": "Not found"}), 404
-        rec.update(data)
-        baggage_map[bag_tag] = rec
-        raw['baggage'] = baggage_map
-        base_service.store.raw_data = raw
+        store = base_service.store
+        baggage_map = store.collection('baggage')
+        with store.lock:
+            rec = baggage_map.get(bag_tag)
+            if not rec:
+                return jsonify({"error": "Not found"}), 404
+            rec = {**rec, **data}
+            baggage_map[bag_tag] = rec
+            store.touch(bag_tag, "update", rec, collection='baggage')
         return jsonify(rec), 200
 
     @app.route('/baggage/booking/<booking_id>', methods=['GET'])
@@ -94,10 +97,11 @@ def setup_baggage_routes():
         """Get all baggage for a booking"""
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
-        raw = base_service.store.raw_data or {}
-        booking_map = raw.get('baggage/booking', {})
-        bags = booking_map.get(booking_id, [])
-        return jsonify(bags), 200
+        booking_map = base_service.store.collection('baggage/booking')
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: booking_map.get(booking_id, []),
+        )
 
 if __name__ == '__main__':
     # Initialize the store
@@ -116,4 +120,4 @@ if __name__ == '__main__':
     logger.info(f"Endpoints: /baggage, /baggage/add, /baggage/track/<bag_tag>, /baggage/booking/<booking_id>")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -5,32 +5,292 @@ Generic base for all airline microservices
 Supports full CRUD operations with in-memory storage
 """
 
+import asyncio
+import atexit
+import copy
+import io
 import json
 import logging
-from typing import Dict, List, Optional
-from datetime import datetime
-from flask import Flask, request, jsonify
+import logging.handlers
+import queue
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timezone
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from flask import Flask, Response, g, request, jsonify, has_request_context
 from flask_cors import CORS
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+from service_client import ServiceError, client
+import gzip
+import hashlib
+import heapq
+import math
+import threading
+import time
 import uuid
 import random
 import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tracemalloc
+import types
+import urllib.parse
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when brotli isn't installed
+    brotli = None
+
+# Logging: LOG_FORMAT is "json" (structured) or "text". High-volume events
+# (access log lines, per-record store writes) are sampled 1 in
+# LOG_SAMPLE_EVERY per route, and store writes are rolled up into one
+# summary line every LOG_SUMMARY_INTERVAL seconds.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '100'))
+LOG_SUMMARY_INTERVAL = float(os.getenv('LOG_SUMMARY_INTERVAL', '10'))
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+
+    EXTRA_FIELDS = ("event", "route", "counts", "sampled")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Let 1 in every `every` records through per sample key.
+
+    Records opt in with extra={"sample_key": ...}; werkzeug access log
+    lines are keyed by method and route prefix. Everything else passes.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self.seen: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _access_key(record: logging.LogRecord) -> Optional[str]:
+        # werkzeug logs '%s - - [%s] %s' with '"GET /path HTTP/1.1" 200 -' last
+        if not isinstance(record.args, tuple) or len(record.args) < 3:
+            return None
+        parts = str(record.args[2]).lstrip('"').split(' ')
+        if len(parts) < 2:
+            return None
+        segments = parts[1].split('?', 1)[0].strip('/').split('/')
+        return f"{parts[0]} /" + '/'.join(segments[:1] + ['*'] * (len(segments) - 1))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1 or record.levelno > logging.INFO:
+            return True
+        key = getattr(record, 'sample_key', None)
+        if key is None and record.name == 'werkzeug':
+            key = self._access_key(record)
+        if key is None:
+            return True
+        with self.lock:
+            seen = self.seen.get(key, 0)
+            self.seen[key] = seen + 1
+        if seen % self.every:
+            return False
+        record.route = key
+        record.sampled = f"1/{self.every}"
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging():
+    """Route all logging through a queue drained by a background thread.
+
+    Request threads only run the sampling filter and enqueue the record;
+    message formatting and stream I/O happen on the listener thread.
+    """
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
+
+class WriteSummary:
+    """Counts store writes and logs one aggregated line per interval"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def record(self, resource: Optional[str], op: str, n: int = 1):
+        key = f"{resource}.{op}"
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + n
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="write-summary", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+        if counts:
+            logger.info("Store writes in last %ss: %s", self.interval, counts,
+                        extra={"event": "store.writes", "counts": counts})
+
+
+write_summary = WriteSummary(LOG_SUMMARY_INTERVAL)
+atexit.register(write_summary.flush)
+
 # Create Flask app
 app = Flask(__name__)
 CORS(app)
 
+# Change feed tuning: how many mutations are retained for /<resource>/changes,
+# the longest a long-poll may block, and the SSE keep-alive interval (seconds)
+CHANGE_LOG_SIZE = int(os.getenv('CHANGE_LOG_SIZE', '1000'))
+CHANGES_MAX_WAIT = float(os.getenv('CHANGES_MAX_WAIT', '30'))
+SSE_KEEPALIVE = float(os.getenv('SSE_KEEPALIVE', '15'))
+
+# Opt-in serialized response cache (0 disables it) and the smallest body
+# worth compressing
+RESPONSE_CACHE_MB = float(os.getenv('RESPONSE_CACHE_MB', '0'))
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+# Minimum seconds between stat() checks of a cached OpenAPI spec file
+SPEC_STAT_INTERVAL = float(os.getenv('SPEC_STAT_INTERVAL', '1'))
+
+# Store backend: "memory" (per process) or "sqlite", a database file under
+# STORE_PATH shared by every worker process on the pod. STORE_POLL_INTERVAL
+# is how often change-feed waiters look for writes made by other workers.
+STORE_BACKEND = os.getenv('STORE_BACKEND', 'memory').lower()
+STORE_PATH = os.getenv('STORE_PATH', '/data')
+STORE_POLL_INTERVAL = float(os.getenv('STORE_POLL_INTERVAL', '0.05'))
+
+# Replication: REPLICATION_ROLE is "leader", "follower" or "" (standalone).
+# A follower copies the leader at LEADER_URL through its change feed and
+# forwards writes there. It serves reads itself while it has heard from the
+# leader within REPLICA_MAX_STALENESS seconds, and forwards them otherwise.
+REPLICATION_ROLE = os.getenv('REPLICATION_ROLE', '').lower()
+LEADER_URL = os.getenv('LEADER_URL', '')
+REPLICA_MAX_STALENESS = float(os.getenv('REPLICA_MAX_STALENESS', '5'))
+REPLICA_FORWARD_TIMEOUT = float(os.getenv('REPLICA_FORWARD_TIMEOUT', '10'))
+
+# Search: how many fields per store may get a hash index, and how many
+# compiled query shapes are cached
+QUERY_MAX_INDEXES = int(os.getenv('QUERY_MAX_INDEXES', '8'))
+QUERY_PLAN_CACHE_SIZE = int(os.getenv('QUERY_PLAN_CACHE_SIZE', '256'))
+
+# Admission control, off by default: at most ADMISSION_MAX_CONCURRENT
+# requests run at once (0 disables), up to ADMISSION_QUEUE more wait
+# ADMISSION_QUEUE_TIMEOUT seconds for a slot, and the rest get 503.
+# RATE_LIMIT_RPS (0 disables) refills each client's bucket of
+# RATE_LIMIT_BURST tokens; clients are told apart by the first
+# RATE_LIMIT_KEY_HEADERS header present, else their address.
+# ADMISSION_PRIORITY_PATHS skip both, so probes stay fast.
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '0'))
+ADMISSION_QUEUE = int(os.getenv('ADMISSION_QUEUE', '128'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '2'))
+ADMISSION_PRIORITY_PATHS = set(filter(None, os.getenv('ADMISSION_PRIORITY_PATHS', '/health,/metrics').split(',')))
+RATE_LIMIT_RPS = float(os.getenv('RATE_LIMIT_RPS', '0'))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '0'))
+RATE_LIMIT_KEY_HEADERS = [h.strip() for h in os.getenv('RATE_LIMIT_KEY_HEADERS', 'X-API-Key,Authorization').split(',') if h.strip()]
+RATE_LIMIT_CLIENTS = int(os.getenv('RATE_LIMIT_CLIENTS', '10000'))
+# Reverse proxies in front of the service (Traefik) that append the address
+# they saw to X-Forwarded-For. A client's address is the entry the outermost
+# of them added; anything before it is client-supplied. 0 ignores the header.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+
+# Idempotency-Key on POST/PATCH: the first response per (client, method,
+# path, key) is kept for IDEMPOTENCY_TTL seconds (at most IDEMPOTENCY_MAX_KEYS
+# of them, per process) and replayed to retries; a retry arriving while the
+# first request runs waits up to IDEMPOTENCY_WAIT seconds for its result.
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '3600'))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '10000'))
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', '30'))
+
+# Memory accounting (/admin/memory): containers of more than MEMORY_SAMPLE
+# items are sized from a random sample of that many; MEMORY_TOP largest keys
+# per collection; MEMORY_TRACE_FRAMES frames kept per tracemalloc trace.
+MEMORY_SAMPLE = int(os.getenv('MEMORY_SAMPLE', '200'))
+MEMORY_TOP = int(os.getenv('MEMORY_TOP', '10'))
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', '1'))
+
 # In-memory storage
 class InMemoryStore:
+    # Upper bound on how long a change-feed wait can miss a write; None
+    # means every write wakes waiters directly
+    poll_interval: Optional[float] = None
+
     def __init__(self, data_file: str, id_field: str = "id", resource_name: Optional[str] = None):
         self.id_field = id_field
         self.resource_name = resource_name
         self.data: Dict[str, any] = {}
         self.raw_data: Dict[str, any] = {}
+        # Monotonic write counter. `version` is the collection version and
+        # `record_versions` holds the version of the last write per record;
+        # both feed the ETags used for conditional requests. Counters restart
+        # with the process, so ETags also carry a per-process `epoch`.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.record_versions: Dict[str, int] = {}
+        # Versions of entries in side collections (see collection()), per collection
+        self.collection_versions: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.RLock()
+        # Bounded mutation log; each entry's seq is the version it produced.
+        # `changed` wakes long-poll and SSE readers on every write.
+        self.changes: deque = deque(maxlen=CHANGE_LOG_SIZE)
+        self.changed = threading.Condition(self.lock)
+        self.subscribers: List[Callable[[Dict], None]] = []
         self.load_initial_data(data_file)
+        self.queries = QueryEngine(self)
     
     def load_initial_data(self, data_file: str):
         """Load initial data from JSON file"""
@@ -64,6 +324,163 @@ class InMemoryStore:
         # Default: UUID
         return str(uuid.uuid4())
     
+    def collection(self, name: str) -> MutableMapping:
+        """A service-specific side collection (bags by tag, history by recipient, ...).
+
+        Side collections start from the data file's raw_data entry of the
+        same name. Services write entries in place and announce each write
+        with touch(entry_id, op, entry, collection=name), which versions the
+        entry apart from a primary record with the same id.
+        """
+        with self.lock:
+            return self.raw_data.setdefault(name, {})
+
+    def _versions(self, collection: Optional[str]) -> Dict[str, int]:
+        if collection is None:
+            return self.record_versions
+        return self.collection_versions.setdefault(collection, {})
+
+    def touch(self, record_id: Optional[str] = None, op: str = "update", record: Any = None,
+              collection: Optional[str] = None) -> int:
+        """Bump the collection version (and the record's, if given).
+
+        Every bump is appended to the change log, passed to subscribers and
+        wakes change-feed readers. Service-specific routes that write a side
+        collection call this with its name, so conditional GETs and the
+        change feed see the change; such entries carry "collection".
+        """
+        with self.lock:
+            self.version += 1
+            if record_id is not None:
+                self._versions(collection)[record_id] = self.version
+            change = {
+                "seq": self.version,
+                "op": op,
+                "id": record_id,
+                "record": copy.copy(record),
+            }
+            if collection is not None:
+                change["collection"] = collection
+            self.changes.append(change)
+            self._notify(change)
+            self.changed.notify_all()
+            return self.version
+
+    def _notify(self, change: Dict):
+        for callback in self.subscribers:
+            try:
+                callback(change)
+            except Exception as e:
+                logger.error("Change subscriber %s failed: %s", callback, e)
+
+    def snapshot(self) -> Dict:
+        """Records, side collection entries and their versions as of one collection version"""
+        with self.lock:
+            return {
+                "epoch": self.epoch,
+                "seq": self.version,
+                "records": dict(self.data),
+                "versions": dict(self.record_versions),
+                "collections": {name: {"entries": dict(self.collection(name)), "versions": dict(versions)}
+                                for name, versions in self.collection_versions.items()},
+            }
+
+    def load_snapshot(self, snapshot: Dict):
+        """Replace the contents with a leader's snapshot (followers only).
+
+        The change log restarts at the snapshot's version and the store takes
+        on the leader's epoch, so ETags match the leader's. Subscribers hear
+        about every record or entry that differs from what they saw before.
+        """
+        with self.lock:
+            self.epoch = snapshot.get("epoch", self.epoch)
+            self.version = int(snapshot["seq"])
+            self.changes.clear()
+            self.record_versions = self._load_entries(self.data, snapshot["records"], snapshot["versions"])
+            for name, part in snapshot.get("collections", {}).items():
+                self.collection_versions[name] = self._load_entries(
+                    self.collection(name), part["entries"], part["versions"], name)
+            self.changed.notify_all()
+
+    def _load_entries(self, target, entries: Dict, versions: Dict, collection: Optional[str] = None) -> Dict[str, int]:
+        """Replace target's contents with entries, notifying subscribers of each difference"""
+        previous = dict(target)
+        target.clear()
+        target.update(entries)
+        tag = {"collection": collection} if collection is not None else {}
+        for entry_id in previous.keys() - entries.keys():
+            self._notify({"seq": self.version, "op": "delete", "id": entry_id, "record": None, **tag})
+        for entry_id, entry in entries.items():
+            if previous.get(entry_id) != entry:
+                self._notify({"seq": self.version, "op": "update", "id": entry_id, "record": entry, **tag})
+        return {entry_id: int(v) for entry_id, v in versions.items()}
+
+    def apply_replicated(self, change: Dict):
+        """Apply one entry of a leader's change log, keeping its sequence number.
+
+        Entries tagged with a side collection go to that collection, not to
+        the records; entries without an id only advance the version.
+        """
+        with self.lock:
+            record_id, collection = change["id"], change.get("collection")
+            if record_id is not None:
+                target = self.data if collection is None else self.collection(collection)
+                if change["op"] == "delete":
+                    target.pop(record_id, None)
+                elif change.get("record") is not None:
+                    target[record_id] = change["record"]
+                self._versions(collection)[record_id] = change["seq"]
+            self.version = change["seq"]
+            self.changes.append(change)
+            self._notify(change)
+            self.changed.notify_all()
+
+    def wait_for_version(self, version: int, timeout: float) -> bool:
+        """Block until the store has reached `version` or timeout elapses"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.version >= version, timeout)
+
+    def refresh(self):
+        """Catch up with writes made outside this process (none in memory)"""
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        """Call callback(change) for every write.
+
+        Callbacks run under the store lock, so they should only update
+        in-memory state or hand work off to another thread.
+        """
+        self.subscribers.append(callback)
+
+    def changes_since(self, since: int, epoch: Optional[str] = None):
+        """Return (changes after `since`, resync flag).
+
+        resync is True when `since` is older than the oldest retained entry,
+        ahead of the store, or from another epoch (the store restarted and
+        sequence numbers began again); the client must then re-fetch the
+        collection and continue from the current version.
+        """
+        if epoch is not None and epoch != self.epoch:
+            return [], True
+        with self.lock:
+            oldest = self.changes[0]["seq"] if self.changes else self.version + 1
+            if since > self.version or since < oldest - 1:
+                return [], True
+            return [c for c in self.changes if c["seq"] > since], False
+
+    def wait_for_change(self, since: int, timeout: float) -> bool:
+        """Block until the store moves past `since` or timeout elapses"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.version != since, timeout)
+
+    def collection_etag(self) -> str:
+        """ETag for any collection-level view (list, search)"""
+        return f"{self.epoch}-c{self.version}"
+
+    def record_etag(self, record_id: str, collection: Optional[str] = None) -> str:
+        """ETag for a single record (or side collection entry)"""
+        versions = self.record_versions if collection is None else self.collection_versions.get(collection, {})
+        return f"{self.epoch}-r{versions.get(record_id, 0)}"
+
     def get_all(self) -> Dict:
         """Get all records"""
         return self.data
@@ -78,60 +495,1136 @@ class InMemoryStore:
             record[self.id_field] = self._generate_id()
         
         record_id = record[self.id_field]
-        self.data[record_id] = record
-        logger.info(f"Created record: {record_id}")
+        with self.lock:
+            self.data[record_id] = record
+            self.touch(record_id, "create", record)
+        self._log_write("create", record_id)
         return record
     
     def update(self, record_id: str, updates: Dict) -> Optional[Dict]:
         """Update existing record"""
-        if record_id not in self.data:
-            return None
-        
-        self.data[record_id].update(updates)
-        logger.info(f"Updated record: {record_id}")
-        return self.data[record_id]
+        with self.lock:
+            if record_id not in self.data:
+                return None
+
+            record = {**self.data[record_id], **updates}
+            self.data[record_id] = record
+            self.touch(record_id, "update", record)
+        self._log_write("update", record_id)
+        return record
     
     def delete(self, record_id: str) -> bool:
         """Delete record"""
-        if record_id in self.data:
+        with self.lock:
+            if record_id not in self.data:
+                return False
             del self.data[record_id]
-            logger.info(f"Deleted record: {record_id}")
-            return True
-        return False
-    
-    def search(self, **filters) -> List[Dict]:
-        """Search records by filters"""
+            self.touch(record_id, "delete")
+        self._log_write("delete", record_id)
+        return True
+
+    def _log_write(self, op: str, record_id: str):
+        """Count a write for the periodic summary; per-record lines are DEBUG and sampled"""
+        write_summary.record(self.resource_name, op)
+        logger.debug("%s record: %s", op, record_id, extra={"sample_key": f"store.{op}"})
+
+    def bulk(self, operations: List[Dict]) -> List[Dict]:
+        """Apply create/upsert/patch/delete operations in one pass.
+
+        Each operation is {"op": ..., "id": ..., "record": {...}}. create
+        fails with 409 for an id that already exists; upsert replaces it. All of them
+        run under a single lock acquisition and one summary line is logged
+        instead of one per record. Returns a compact {"status", "id"} result
+        per operation, with "error" set on failures.
+        """
         results = []
-        for record in self.data.values():
-            match = True
-            for key, value in filters.items():
-                if key in record and record[key] != value:
-                    match = False
-                    break
-            if match:
-                results.append(record)
+        counts: Dict[str, int] = {}
+        with self.lock:
+            for operation in operations:
+                result = self._apply(operation)
+                results.append(result)
+                key = operation.get("op") if result["status"] < 400 else "failed"
+                counts[key] = counts.get(key, 0) + 1
+        for op, n in counts.items():
+            write_summary.record(self.resource_name, op, n)
+        logger.info("Bulk applied %d operations: %s", len(operations), counts)
         return results
 
+    def _apply(self, operation: Dict) -> Dict:
+        """Apply one bulk operation; caller holds the lock"""
+        if not isinstance(operation, dict):
+            return {"status": 400, "id": None, "error": "operation must be an object"}
+        op = operation.get("op")
+        record = operation.get("record") or {}
+        if not isinstance(record, dict):
+            return {"status": 400, "id": None, "error": "record must be an object"}
+        record_id = operation.get("id") or record.get(self.id_field)
+        if record_id is not None and not isinstance(record_id, str):
+            return {"status": 400, "id": None, "error": "id must be a string"}
+
+        if op == "create":
+            if not record:
+                return {"status": 400, "id": record_id, "error": "record required"}
+            if record_id and record_id in self.data:
+                return {"status": 409, "id": record_id, "error": "Already exists"}
+            record_id = record_id or self._generate_id()
+            record[self.id_field] = record_id
+            self.data[record_id] = record
+            self.touch(record_id, "create", record)
+            return {"status": 201, "id": record_id}
+        if not record_id:
+            return {"status": 400, "id": None, "error": "id required"}
+        if op == "upsert":
+            record[self.id_field] = record_id
+            existed = record_id in self.data
+            self.data[record_id] = record
+            self.touch(record_id, "update" if existed else "create", record)
+            return {"status": 200 if existed else 201, "id": record_id}
+        if op == "patch":
+            if record_id not in self.data:
+                return {"status": 404, "id": record_id, "error": "Not found"}
+            record = {**self.data[record_id], **record}
+            self.data[record_id] = record
+            self.touch(record_id, "update", record)
+            return {"status": 200, "id": record_id}
+        if op == "delete":
+            if record_id not in self.data:
+                return {"status": 404, "id": record_id, "error": "Not found"}
+            del self.data[record_id]
+            self.touch(record_id, "delete")
+            return {"status": 200, "id": record_id}
+        return {"status": 400, "id": record_id, "error": f"unknown op: {op}"}
+    
+    def search(self, **filters) -> List[Dict]:
+        """Records matching every filter (see QueryEngine for the syntax)"""
+        return self.queries.search(filters)
+
+
+class _SharedWriteLock:
+    """Re-entrant write lock for SharedStore.
+
+    The outermost acquire takes a thread lock and opens a BEGIN IMMEDIATE
+    transaction, which SQLite allows one connection at a time across all
+    processes; the outermost release commits, or rolls back on error.
+    """
+
+    def __init__(self, shared: "SharedStore"):
+        self.shared = shared
+        self.rlock = threading.RLock()
+        self.depth = 0
+
+    def __enter__(self):
+        self.rlock.acquire()
+        self.depth += 1
+        if self.depth == 1:
+            self.shared._conn().execute('BEGIN IMMEDIATE')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.depth -= 1
+        try:
+            if self.depth == 0:
+                self.shared._conn().execute('ROLLBACK' if exc_type else 'COMMIT')
+                if exc_type is None:
+                    with self.shared.changed:
+                        self.shared.changed.notify_all()
+        finally:
+            self.rlock.release()
+        return False
+
+
+class SharedRecords(MutableMapping):
+    """Dict-like view of the records table, or of one side collection in
+    the entries table; values are decoded per read, so changes to a value
+    must be written back with an assignment"""
+
+    def __init__(self, shared: "SharedStore", collection: Optional[str] = None):
+        self.shared = shared
+        self.collection = collection
+        if collection is None:
+            self.table, self.keys_sql, self.scope, self.params = 'records', 'id', '', ()
+        else:
+            self.table, self.keys_sql = 'entries', 'collection, id'
+            self.scope, self.params = 'collection = ? AND ', (collection,)
+
+    def _query(self, sql: str, *args):
+        return self.shared._conn().execute(sql, self.params + args)
+
+    def __getitem__(self, record_id):
+        row = self._query(f'SELECT body FROM {self.table} WHERE {self.scope}id = ?', record_id).fetchone()
+        if row is None:
+            raise KeyError(record_id)
+        return json.loads(row[0])
+
+    def __contains__(self, record_id):
+        return self._query(f'SELECT 1 FROM {self.table} WHERE {self.scope}id = ?', record_id).fetchone() is not None
+
+    def __setitem__(self, record_id, record):
+        with self.shared.lock:
+            marks = ', '.join('?' * (len(self.params) + 1))
+            self._query(
+                f'INSERT INTO {self.table} ({self.keys_sql}, body, version) VALUES ({marks}, ?, 0) '
+                f'ON CONFLICT({self.keys_sql}) DO UPDATE SET body = excluded.body',
+                record_id, json.dumps(record),
+            )
+
+    def __delitem__(self, record_id):
+        with self.shared.lock:
+            if self._query(f'DELETE FROM {self.table} WHERE {self.scope}id = ?', record_id).rowcount == 0:
+                raise KeyError(record_id)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self._query(f'SELECT COUNT(*) FROM {self.table} WHERE {self.scope}1').fetchone()[0]
+
+    # One query each instead of a lookup per key
+    def keys(self):
+        return [row[0] for row in self._query(f'SELECT id FROM {self.table} WHERE {self.scope}1 ORDER BY rowid')]
+
+    def values(self):
+        return [json.loads(row[0])
+                for row in self._query(f'SELECT body FROM {self.table} WHERE {self.scope}1 ORDER BY rowid')]
+
+    def items(self):
+        return [(row[0], json.loads(row[1]))
+                for row in self._query(f'SELECT id, body FROM {self.table} WHERE {self.scope}1 ORDER BY rowid')]
+
+
+class SharedStore(InMemoryStore):
+    """Store kept in an SQLite database shared by all worker processes.
+
+    The database runs in WAL mode: one writer at a time across processes
+    (see _SharedWriteLock), while readers in every process proceed in
+    parallel against the last committed state. Records, per-record
+    versions, the collection version and the change log all live in the
+    database, so ETags, conditional requests and /changes agree across
+    workers. Writes made by other workers reach this process's
+    subscribers through refresh(), which runs before each request.
+
+    Side collections (collection()) are kept and versioned in the entries
+    table, seeded from the data file the first time any worker uses them.
+    Other raw_data entries (templates, fare tables, ...) are read-only
+    configuration and stay per process.
+    """
+
+    poll_interval = STORE_POLL_INTERVAL
+
+    def __init__(self, data_file: str, id_field: str = "id", resource_name: Optional[str] = None,
+                 path: str = STORE_PATH):
+        self.id_field = id_field
+        self.resource_name = resource_name
+        self.path = path if path.endswith('.db') else os.path.join(path, f"{(resource_name or 'store').lower()}.db")
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.local = threading.local()
+        self.lock = _SharedWriteLock(self)
+        self.changed = threading.Condition()
+        self.subscribers: List[Callable[[Dict], None]] = []
+        self.refresh_lock = threading.Lock()
+        self.raw_data: Dict[str, any] = {}
+        self.data = {}
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, body TEXT NOT NULL, version INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS entries (collection TEXT NOT NULL, id TEXT NOT NULL, body TEXT NOT NULL,
+                                                version INTEGER NOT NULL, PRIMARY KEY (collection, id));
+            CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY, op TEXT NOT NULL, id TEXT,
+                                                record TEXT, origin TEXT NOT NULL, collection TEXT);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('seeded', 0), ('epoch', random());
+        """)
+        if 'collection' not in {row[1] for row in conn.execute('PRAGMA table_info(changes)')}:
+            conn.execute('ALTER TABLE changes ADD COLUMN collection TEXT')
+        # Versions persist with the database, so its epoch is fixed at creation
+        epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        self.epoch = f"{epoch & 0xffffffff:08x}"
+        self.load_initial_data(data_file)
+        self.seen = self.version
+        self.queries = QueryEngine(self)
+
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection (sqlite3 connections are per thread)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def load_initial_data(self, data_file: str):
+        """Seed the database from the JSON file, once per database"""
+        InMemoryStore.load_initial_data(self, data_file)
+        seed = self.data
+        self.data = SharedRecords(self)
+        for key, value in self.raw_data.items():
+            if value is seed:
+                self.raw_data[key] = self.data
+        with self.lock:
+            conn = self._conn()
+            if conn.execute("SELECT value FROM meta WHERE key = 'seeded'").fetchone()[0]:
+                logger.info(f"Using {len(self.data)} records already in {self.path}")
+                return
+            conn.executemany('INSERT OR REPLACE INTO records (id, body, version) VALUES (?, ?, 0)',
+                             ((record_id, json.dumps(record)) for record_id, record in seed.items()))
+            conn.execute("UPDATE meta SET value = 1 WHERE key = 'seeded'")
+            logger.info(f"Seeded {len(seed)} records into {self.path}")
+
+    def collection(self, name: str) -> MutableMapping:
+        """A side collection kept in the entries table (see InMemoryStore.collection)"""
+        shared = self.raw_data.get(name)
+        if isinstance(shared, SharedRecords):
+            return shared
+        with self.lock:
+            conn = self._conn()
+            seeded = f'seeded:{name}'
+            if conn.execute('SELECT 1 FROM meta WHERE key = ?', (seeded,)).fetchone() is None:
+                seed = self.raw_data.get(name)
+                if isinstance(seed, dict):
+                    conn.executemany('INSERT OR IGNORE INTO entries (collection, id, body, version) VALUES (?, ?, ?, 0)',
+                                     ((name, entry_id, json.dumps(entry)) for entry_id, entry in seed.items()))
+                conn.execute('INSERT INTO meta (key, value) VALUES (?, 1)', (seeded,))
+            shared = self.raw_data[name] = SharedRecords(self, name)
+            return shared
+
+    @property
+    def version(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def touch(self, record_id: Optional[str] = None, op: str = "update", record: Any = None,
+              collection: Optional[str] = None) -> int:
+        """Bump the shared version and append to the shared change log"""
+        with self.lock:
+            conn = self._conn()
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            version = self.version
+            if record_id is not None and collection is None:
+                conn.execute('UPDATE records SET version = ? WHERE id = ?', (version, record_id))
+            elif record_id is not None:
+                conn.execute('UPDATE entries SET version = ? WHERE collection = ? AND id = ?',
+                             (version, collection, record_id))
+            change = {
+                "seq": version,
+                "op": op,
+                "id": record_id,
+                "record": copy.copy(record),
+            }
+            if collection is not None:
+                change["collection"] = collection
+            conn.execute('INSERT INTO changes (seq, op, id, record, origin, collection) VALUES (?, ?, ?, ?, ?, ?)',
+                         (version, op, record_id,
+                          json.dumps(record) if record is not None else None, self.worker, collection))
+            conn.execute('DELETE FROM changes WHERE seq <= ?', (version - CHANGE_LOG_SIZE,))
+            self._notify(change)
+            return version
+
+    def _rows_since(self, since: int, until: int) -> List[Dict]:
+        rows = self._conn().execute(
+            'SELECT seq, op, id, record, origin, collection FROM changes WHERE seq > ? AND seq <= ? ORDER BY seq',
+            (since, until),
+        ).fetchall()
+        changes = []
+        for seq, op, record_id, record, origin, collection in rows:
+            change = {"seq": seq, "op": op, "id": record_id,
+                      "record": json.loads(record) if record is not None else None, "origin": origin}
+            if collection is not None:
+                change["collection"] = collection
+            changes.append(change)
+        return changes
+
+    def changes_since(self, since: int, epoch: Optional[str] = None):
+        if epoch is not None and epoch != self.epoch:
+            return [], True
+        version = self.version
+        rows = self._rows_since(since, version)
+        # Sequence numbers are contiguous, so a missing first entry means
+        # the log was trimmed past `since`
+        if since > version or (since < version and (not rows or rows[0]["seq"] != since + 1)):
+            return [], True
+        for row in rows:
+            del row["origin"]
+        return rows, False
+
+    def wait_for_change(self, since: int, timeout: float) -> bool:
+        """Block until the shared version moves past `since` or timeout elapses.
+
+        Local commits wake waiters at once; other workers' commits are
+        noticed within poll_interval.
+        """
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while self.version == since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(min(remaining, self.poll_interval))
+        return True
+
+    def snapshot(self) -> Dict:
+        """Records, side collection entries and their versions, read from
+        the database in one transaction"""
+        with self.lock:
+            conn = self._conn()
+            records, versions = {}, {}
+            for record_id, body, version in conn.execute('SELECT id, body, version FROM records ORDER BY rowid'):
+                records[record_id] = json.loads(body)
+                versions[record_id] = version
+            collections: Dict[str, Dict] = {}
+            for name, entry_id, body, version in conn.execute(
+                    'SELECT collection, id, body, version FROM entries ORDER BY rowid'):
+                part = collections.setdefault(name, {"entries": {}, "versions": {}})
+                part["entries"][entry_id] = json.loads(body)
+                part["versions"][entry_id] = version
+            return {"epoch": self.epoch, "seq": self.version, "records": records, "versions": versions,
+                    "collections": collections}
+
+    def record_etag(self, record_id: str, collection: Optional[str] = None) -> str:
+        if collection is None:
+            row = self._conn().execute('SELECT version FROM records WHERE id = ?', (record_id,)).fetchone()
+        else:
+            row = self._conn().execute('SELECT version FROM entries WHERE collection = ? AND id = ?',
+                                       (collection, record_id)).fetchone()
+        return f"{self.epoch}-r{row[0] if row else 0}"
+
+    def refresh(self):
+        """Pass writes committed by other workers to this process's subscribers"""
+        version = self.version
+        if version == self.seen or not self.refresh_lock.acquire(blocking=False):
+            return
+        try:
+            rows = self._rows_since(self.seen, version)
+            if rows and rows[0]["seq"] != self.seen + 1:
+                logger.warning("Missed %d shared changes; derived state may be stale",
+                               rows[0]["seq"] - self.seen - 1)
+            for row in rows:
+                if row.pop("origin") != self.worker:
+                    self._notify(row)
+            self.seen = version
+        finally:
+            self.refresh_lock.release()
+
+
+class QueryError(ValueError):
+    """A search filter that cannot be compiled (answered with 400)"""
+
+
+_MISSING = object()
+_NUMBER = (int, float)
+
+
+def _text(value) -> Optional[str]:
+    """Query-string form of a stored value, for fields without a known type"""
+    if value is _MISSING or value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _coerce(raw: str, kind: str):
+    """Convert a query-string value to a field's inferred type"""
+    if kind == "bool":
+        lowered = raw.lower()
+        if lowered in ("true", "1"):
+            return True
+        if lowered in ("false", "0"):
+            return False
+        raise ValueError(raw)
+    if kind == "int":
+        number = float(raw)
+        return int(number) if number.is_integer() else number
+    if kind == "float":
+        return float(raw)
+    return raw
+
+
+class QueryEngine:
+    """Compiles search filters into typed predicates over one store.
+
+    Filters are `field=value` (eq) or `field__<op>=value` with op one of
+    eq, in (comma-separated), prefix, gt, gte, lt, lte. Values are coerced
+    to the field's type as inferred from the records at load (and from
+    fields first seen on later writes), and a record missing the field
+    never matches.
+
+    Each query shape (fields and operators, not values) is compiled once
+    into a generated list comprehension and kept in an LRU cache. Fields
+    used with eq/in get a hash index, built on first use and kept current
+    from the store's change notifications; a query with indexed conditions
+    scans only the smallest candidate bucket.
+    """
+
+    OPERATORS = ("eq", "in", "prefix", "gt", "gte", "lt", "lte")
+    _COMPARE = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.schema: Dict[str, str] = {}
+        self.plans: "OrderedDict[tuple, Callable]" = OrderedDict()
+        # field -> value -> {record_id: None}, plus field -> record_id -> value
+        # to find a record's old bucket; dict buckets keep results ordered
+        self.indexes: Dict[str, Dict[Any, Dict[str, None]]] = {}
+        self.indexed: Dict[str, Dict[str, Any]] = {}
+        for record in list(store.data.values()):
+            self._learn(record)
+        store.subscribe(self._on_change)
+
+    @staticmethod
+    def _kind(value) -> Optional[str]:
+        if isinstance(value, bool):
+            return "bool"
+        if isinstance(value, int):
+            return "int"
+        if isinstance(value, float):
+            return "float"
+        if isinstance(value, str):
+            return "str"
+        return None
+
+    def _learn(self, record) -> bool:
+        """Fold a record's field types into the schema; True if it changed"""
+        if not isinstance(record, dict):
+            return False
+        changed = False
+        for field, value in record.items():
+            if value is None:
+                continue
+            kind = self._kind(value)
+            known = self.schema.get(field)
+            if known == kind or known == "any":
+                continue
+            if {known, kind} == {"int", "float"}:
+                kind = "float"
+            elif known is not None or kind is None:
+                kind = "any"
+            self.schema[field] = kind
+            changed = True
+        return changed
+
+    def _on_change(self, change: Dict):
+        record_id, record = change.get("id"), change.get("record")
+        # Side collection entries aren't records of the store
+        if record_id is None or "collection" in change:
+            return
+        with self.lock:
+            if self._learn(record):
+                self.plans.clear()
+            for field in self.indexes:
+                self._reindex(field, record_id, record)
+
+    def _reindex(self, field: str, record_id: str, record: Optional[Dict]):
+        buckets, values = self.indexes[field], self.indexed[field]
+        old = values.pop(record_id, _MISSING)
+        if old is not _MISSING:
+            bucket = buckets.get(old)
+            if bucket is not None:
+                bucket.pop(record_id, None)
+                if not bucket:
+                    del buckets[old]
+        value = record.get(field, _MISSING) if isinstance(record, dict) else _MISSING
+        if value is _MISSING or value is None:
+            return
+        try:
+            buckets.setdefault(value, {})[record_id] = None
+        except TypeError:  # lists/objects can't equal a query value anyway
+            return
+        values[record_id] = value
+
+    def _index(self, field: str) -> Optional[Dict[Any, Dict[str, None]]]:
+        """The field's index, built on first use (up to QUERY_MAX_INDEXES)"""
+        with self.lock:
+            index = self.indexes.get(field)
+            if index is not None or len(self.indexes) >= QUERY_MAX_INDEXES:
+                return index
+            self.indexes[field], self.indexed[field] = {}, {}
+            for record_id, record in list(self.store.data.items()):
+                self._reindex(field, record_id, record)
+            logger.info("Built %s index on %s (%d values)", self.store.resource_name, field,
+                        len(self.indexes[field]))
+            return self.indexes[field]
+
+    def _parse(self, filters: Dict[str, str]) -> List[tuple]:
+        """(field, op, raw value) for each filter, in a stable order"""
+        terms = []
+        for key, raw in sorted(filters.items()):
+            field, _, op = key.rpartition('__')
+            if not field or op not in self.OPERATORS:
+                field, op = key, "eq"
+            terms.append((field, op, raw))
+        return terms
+
+    def _value(self, field: str, op: str, raw: str, kind: str):
+        """Coerce a raw query value for one condition"""
+        try:
+            if op == "prefix":
+                return raw
+            if op == "in":
+                return tuple(_coerce(part, kind) if kind != "any" else part for part in raw.split(','))
+            if op in self._COMPARE:
+                if kind == "any":
+                    try:
+                        return float(raw)
+                    except ValueError:
+                        return raw
+                if kind == "bool":
+                    raise ValueError(raw)
+            return raw if kind == "any" else _coerce(raw, kind)
+        except ValueError:
+            raise QueryError(f"invalid value for {field}__{op}: {raw!r} (expected {kind})") from None
+
+    def _compile(self, shape: tuple) -> Callable:
+        """Generate `scan(records, v0, v1, ...)` for a query shape"""
+        conditions = []
+        for i, (field, op, kind) in enumerate(shape):
+            get = f"r.get({field!r}, _MISSING)"
+            if op in ("eq", "in"):
+                target = f"_text({get})" if kind == "any" else get
+                conditions.append(f"{target} {'==' if op == 'eq' else 'in'} v{i}")
+            elif op == "prefix":
+                conditions.append(f"(isinstance(x{i} := {get}, str) and x{i}.startswith(v{i}))")
+            else:
+                guard = "_NUMBER" if kind in ("int", "float") else "str" if kind == "str" else f"type(v{i})"
+                if kind == "any":
+                    guard = f"(_NUMBER if isinstance(v{i}, float) else str)"
+                conditions.append(f"(isinstance(x{i} := {get}, {guard}) and x{i} {self._COMPARE[op]} v{i})")
+        args = "".join(f", v{i}" for i in range(len(shape)))
+        source = (f"def scan(records{args}):\n"
+                  f"    return [r for r in records if {' and '.join(conditions) or 'True'}]\n")
+        namespace = {"_MISSING": _MISSING, "_NUMBER": _NUMBER, "_text": _text}
+        exec(compile(source, f"<query {shape}>", "exec"), namespace)
+        return namespace["scan"]
+
+    def plan(self, shape: tuple) -> Callable:
+        with self.lock:
+            scan = self.plans.get(shape)
+            if scan is not None:
+                self.plans.move_to_end(shape)
+                return scan
+        scan = self._compile(shape)
+        with self.lock:
+            self.plans[shape] = scan
+            while len(self.plans) > QUERY_PLAN_CACHE_SIZE:
+                self.plans.popitem(last=False)
+        return scan
+
+    def _bind(self, filters: Dict[str, str]):
+        """Query shape and coerced values for a set of filters"""
+        terms = self._parse(filters)
+        with self.lock:
+            kinds = [self.schema.get(field, "any") for field, _, _ in terms]
+        shape = tuple((field, op, kind) for (field, op, _), kind in zip(terms, kinds))
+        values = [self._value(field, op, raw, kind) for (field, op, raw), kind in zip(terms, kinds)]
+        return shape, values
+
+    def matcher(self, filters: Dict[str, str]) -> Callable[[List[Dict]], List[Dict]]:
+        """Compiled filters applied to records the caller supplies"""
+        shape, values = self._bind(filters)
+        scan = self.plan(shape)
+        return lambda records: scan(records, *values)
+
+    def search(self, filters: Dict[str, str]) -> List[Dict]:
+        shape, values = self._bind(filters)
+        scan = self.plan(shape)
+
+        # Narrow to the smallest index bucket among the eq/in conditions
+        candidates = None
+        for (field, op, kind), value in zip(shape, values):
+            if op not in ("eq", "in") or kind == "any":
+                continue
+            index = self._index(field)
+            if index is None:
+                continue
+            with self.lock:
+                if op == "eq":
+                    ids = list(index.get(value, ()))
+                else:
+                    ids = [record_id for v in dict.fromkeys(value) for record_id in index.get(v, ())]
+            if candidates is None or len(ids) < len(candidates):
+                candidates = ids
+        if candidates is None:
+            records = list(self.store.data.values())
+        else:
+            data = self.store.data
+            records = [r for r in map(data.get, candidates) if r is not None]
+        return scan(records, *values)
+
+
+class ResponseCache:
+    """LRU cache of serialized (and optionally compressed) response bodies.
+
+    Entries are keyed by request path + query string and content coding, and
+    carry the ETag they were built for. Since ETags are derived from the
+    store's epoch and versions, a write (or a restart) invalidates an entry
+    simply by changing the ETag the next lookup asks for; the stale body is
+    then replaced in place. Total
+    body size is kept under max_bytes by evicting least recently used
+    entries.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, etag: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, etag: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = (etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+response_cache: Optional[ResponseCache] = (
+    ResponseCache(int(RESPONSE_CACHE_MB * 1024 * 1024)) if RESPONSE_CACHE_MB > 0 else None
+)
+
+
+def _negotiate_encoding() -> Optional[str]:
+    """Pick the best content coding the client accepts (br, gzip or none)"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _cached_body(etag: str, producer: Callable[[], Any], encoding: Optional[str]):
+    """Return (body, encoding) from the response cache, building it on a miss.
+
+    Bodies smaller than COMPRESS_MIN_BYTES are served uncompressed.
+    """
+    key = (request.full_path, encoding)
+    body = response_cache.get(key, etag)
+    if body is not None:
+        return body, encoding
+
+    identity_key = (request.full_path, None)
+    raw = response_cache.get(identity_key, etag) if encoding else None
+    if raw is None:
+        raw = jsonify(producer()).get_data()
+        response_cache.put(identity_key, etag, raw)
+    if encoding is None or len(raw) < COMPRESS_MIN_BYTES:
+        return raw, None
+    body = _compress(raw, encoding)
+    response_cache.put(key, etag, body)
+    return body, encoding
+
+
+class SpecFileCache:
+    """In-memory cache of OpenAPI spec files mounted from ConfigMaps.
+
+    Each file is read once and re-read only when its stat signature
+    (inode, size, mtime) changes. Kubernetes updates ConfigMap mounts by
+    swapping a symlink, so os.stat() following the link sees a new inode
+    after an update. stat() itself runs at most once per SPEC_STAT_INTERVAL
+    per file.
+    """
+
+    def __init__(self, stat_interval: float):
+        self.stat_interval = stat_interval
+        self.entries: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[Dict]:
+        """Return {body, etag, last_modified} for path, or None if missing"""
+        now = time.monotonic()
+        entry = self.entries.get(path)
+        if entry and now - entry["checked"] < self.stat_interval:
+            return entry
+
+        with self.lock:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.entries.pop(path, None)
+                return None
+            signature = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            entry = self.entries.get(path)
+            if entry and entry["signature"] == signature:
+                entry["checked"] = now
+                return entry
+
+            with open(path, 'rb') as f:
+                body = f.read()
+            entry = {
+                "body": body,
+                "etag": hashlib.sha256(body).hexdigest()[:32],
+                "last_modified": datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc),
+                "signature": signature,
+                "checked": now,
+            }
+            self.entries[path] = entry
+            logger.info(f"Loaded OpenAPI spec {path} ({len(body)} bytes)")
+            return entry
+
+
+spec_cache = SpecFileCache(SPEC_STAT_INTERVAL)
+
+
+class StoreRouter:
+    """Stands in for `store` when one process hosts several services.
+
+    Every hosted service keeps its own store. Routes belong to the store
+    that was current while they were registered, and attribute reads and
+    writes go to the store of the route handling the current request, so
+    service code using `base_service.store` runs unchanged. The router is
+    falsy outside such a request.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, 'stores', {})
+        object.__setattr__(self, 'endpoints', {})
 
-# Initialize store (will be set by service-specific code)
+    def mount(self, name: str, service_store: InMemoryStore, endpoints):
+        self.stores[name] = service_store
+        for endpoint in endpoints:
+            self.endpoints[endpoint] = service_store
+
+    def current(self) -> Optional[InMemoryStore]:
+        if not has_request_context():
+            return None
+        return self.endpoints.get(request.endpoint)
+
+    def __getattr__(self, name):
+        target = self.current()
+        if target is None:
+            raise RuntimeError(f"No hosted service store for this request (reading {name})")
+        return getattr(target, name)
+
+    def __setattr__(self, name, value):
+        target = self.current()
+        if target is None:
+            raise RuntimeError(f"No hosted service store for this request (setting {name})")
+        setattr(target, name, value)
+
+    def __bool__(self):
+        return self.current() is not None
+
+
+# Initialize store (will be set by service-specific code, or a StoreRouter
+# under host_service.py)
 store: Optional[InMemoryStore] = None
 
+# Service-specific structures (search indexes, views, caches) reported by
+# /admin/memory, added by services with register_memory()
+memory_sources: Dict[str, Any] = {}
+
+
+def register_memory(name: str, obj: Any):
+    """Include obj's approximate size in /admin/memory under name"""
+    memory_sources[name] = obj
+
+
+# URL rules answered from state that lives only in the serving process
+# (rosters, plans, seat maps, caches) and is never replicated, so followers
+# forward them to the leader; added by services with register_leader_routes()
+leader_routes: set = set()
+
+
+def register_leader_routes(*rules: str):
+    """Have followers forward every request matching these URL rules to the leader"""
+    leader_routes.update(rules)
+
+
+# Where create_rest_api finds OpenAPI specs; host_service.py points it at
+# each hosted service's own directory
+SPEC_DIR = '/public'
+
+# Change feed routes registered by create_rest_api and the store behind
+# each, served natively by the asyncio runtime
+feed_paths: Dict[str, InMemoryStore] = {}
+
 def init_store(data_file: str, id_field: str, resource_name: str):
     """Initialize the data store"""
     global store, RESOURCE_NAME
-    store = InMemoryStore(data_file, id_field, resource_name)
+    backend = SharedStore if STORE_BACKEND == 'sqlite' else InMemoryStore
+    store = backend(data_file, id_field, resource_name)
     RESOURCE_NAME = resource_name
     logger.info(f"Initialized {resource_name} service with {len(store.data)} records")
 
+def conditional_jsonify(etag: str, producer: Callable[[], Any], status: int = 200):
+    """Serialize producer() as JSON tagged with etag, or answer 304.
+
+    producer is only called when the client's If-None-Match does not match,
+    so unchanged polls skip both the lookup and the serialization. When the
+    response cache is enabled, the serialized (and compressed) body is
+    reused until the ETag changes.
+    """
+    if response_cache is None:
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(producer())
+            response.status_code = status
+        response.set_etag(etag)
+        return response
+
+    encoding = _negotiate_encoding()
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        body, encoding = _cached_body(etag, producer, encoding)
+        response = app.response_class(body, status=status, mimetype=app.json.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Compressed variants share the version-derived tag, so mark it weak
+    response.set_etag(etag, weak=encoding is not None)
+    return response
+
+
+def precondition_failed(etag: str) -> bool:
+    """True when the request carries an If-Match that does not match etag.
+
+    Compressed responses carry the weak form of the same version-derived
+    tag, so a weak If-Match naming the current version matches too.
+    """
+    return bool(request.if_match) and not request.if_match.contains_weak(etag)
+
+
+def _sse_event(event: str, payload: Dict, event_id: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame"""
+    frame = f"event: {event}\n"
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    return frame + f"data: {json.dumps(payload)}\n\n"
+
+
+def _feed_position(feed_store: InMemoryStore, since: str, epoch: Optional[str], last_event_id: str):
+    """(since, epoch) for a change-feed request.
+
+    ?since and ?epoch take precedence; otherwise an SSE Last-Event-ID of
+    the form <epoch>:<seq> resumes a stream. Without either the feed starts
+    at the current version. Raises ValueError for a non-integer since.
+    """
+    if since == '' and last_event_id:
+        epoch, _, since = last_event_id.rpartition(':')
+    since = int(since) if since != '' else feed_store.version
+    return since, epoch or None
+
+
+def _stream_changes(feed_store: InMemoryStore, since: int, epoch: Optional[str]):
+    """Generate SSE frames for every change after `since` until resync"""
+    yield "retry: 2000\n\n"
+    while True:
+        changes, resync = feed_store.changes_since(since, epoch)
+        if resync:
+            yield _sse_event("resync", {"epoch": feed_store.epoch, "seq": feed_store.version},
+                             f"{feed_store.epoch}:{feed_store.version}")
+            return
+        epoch = feed_store.epoch
+        for change in changes:
+            since = change["seq"]
+            yield _sse_event("change", change, f"{epoch}:{since}")
+        if not feed_store.wait_for_change(since, SSE_KEEPALIVE):
+            yield ": keep-alive\n\n"
+
+
+@app.before_request
+def _refresh_store():
+    """Let the store catch up with writes from other worker processes"""
+    if store:
+        store.refresh()
+
+
+@app.errorhandler(QueryError)
+def _bad_query(e):
+    return jsonify({"error": str(e)}), 400
+
+
+def overload_response(status: int, message: str, retry_after: float):
+    """(status, headers, body) for a request turned away by admission control"""
+    body = (json.dumps({"error": message, "status": status}, separators=(',', ':')) + '\n').encode()
+    headers = [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body))),
+        ('Retry-After', str(max(1, math.ceil(retry_after)))),
+        ('Access-Control-Allow-Origin', '*'),
+    ]
+    return status, headers, body
+
+
+class AdmissionControl:
+    """WSGI middleware that bounds work instead of queueing it without limit.
+
+    Each client (API key header, else the X-Forwarded-For entry added by the
+    outermost trusted proxy, else peer address) has a token bucket refilled at RATE_LIMIT_RPS; an empty bucket
+    is answered 429 with the time until the next token. Admitted requests
+    then need one of ADMISSION_MAX_CONCURRENT slots, waiting at most
+    ADMISSION_QUEUE_TIMEOUT among at most ADMISSION_QUEUE waiters, else 503.
+    Priority paths (/health) and change feeds, which are long-lived by
+    design, bypass both.
+    """
+
+    def __init__(self, wsgi_app, max_concurrent: int, queue_size: int, queue_timeout: float,
+                 rate: float, burst: float):
+        self.wsgi_app = wsgi_app
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.slots = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.lock = threading.Lock()
+        self.buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self.rejected = {"rate_limited": 0, "busy": 0}
+
+    @staticmethod
+    def client_key(environ: Dict) -> str:
+        for header in RATE_LIMIT_KEY_HEADERS:
+            value = environ.get('HTTP_' + header.upper().replace('-', '_'))
+            if value:
+                # Never keep credentials around, only a digest
+                return 'key:' + hashlib.sha256(value.encode()).hexdigest()[:16]
+        forwarded = environ.get('HTTP_X_FORWARDED_FOR')
+        if forwarded and TRUSTED_PROXY_HOPS > 0:
+            hops = [hop.strip() for hop in forwarded.split(',')]
+            if len(hops) >= TRUSTED_PROXY_HOPS and hops[-TRUSTED_PROXY_HOPS]:
+                return hops[-TRUSTED_PROXY_HOPS]
+        return environ.get('REMOTE_ADDR', '')
+
+    def _take_token(self, key: str) -> float:
+        """Spend a token from key's bucket; returns 0, or seconds until one is available"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            self.buckets[key] = (tokens - 1 if not wait else tokens, now)
+            while len(self.buckets) > RATE_LIMIT_CLIENTS:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def _acquire(self) -> bool:
+        with self.slots:
+            if self.in_flight < self.max_concurrent:
+                self.in_flight += 1
+                return True
+            if self.waiting >= self.queue_size:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self.slots.wait_for(lambda: self.in_flight < self.max_concurrent, self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            if admitted:
+                self.in_flight += 1
+            return admitted
+
+    def _release(self):
+        with self.slots:
+            self.in_flight -= 1
+            self.slots.notify()
+
+    def count(self, reason: str):
+        with self.lock:
+            self.rejected[reason] += 1
+
+    def _reject(self, start_response, reason: str, status: int, message: str, retry_after: float):
+        self.count(reason)
+        status, headers, body = overload_response(status, message, retry_after)
+        start_response(f"{status} {HTTPStatus(status).phrase}", headers)
+        return [body]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path in ADMISSION_PRIORITY_PATHS or path in feed_paths:
+            return self.wsgi_app(environ, start_response)
+        if self.rate > 0:
+            wait = self._take_token(self.client_key(environ))
+            if wait:
+                return self._reject(start_response, "rate_limited", 429, "Too many requests", wait)
+        if self.max_concurrent <= 0:
+            return self.wsgi_app(environ, start_response)
+        if not self._acquire():
+            return self._reject(start_response, "busy", 503, "Server busy", self.queue_timeout)
+        try:
+            # Hold the slot until the server has consumed the response body
+            return ClosingIterator(self.wsgi_app(environ, start_response), self._release)
+        except BaseException:
+            self._release()
+            raise
+
+    def status(self) -> Dict:
+        with self.slots:
+            status = {"in_flight": self.in_flight, "queued": self.waiting,
+                      "max_concurrent": self.max_concurrent, "queue_size": self.queue_size}
+        with self.lock:
+            status.update(rejected=dict(self.rejected), clients=len(self.buckets))
+        return status
+
+
+admission: Optional[AdmissionControl] = None
+if ADMISSION_MAX_CONCURRENT > 0 or RATE_LIMIT_RPS > 0:
+    admission = AdmissionControl(app.wsgi_app, ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+                                 RATE_LIMIT_RPS, RATE_LIMIT_BURST or RATE_LIMIT_RPS * 2)
+    app.wsgi_app = admission
+
+
 # Generic routes
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "records": len(store.data) if store else 0}), 200
+    if isinstance(store, StoreRouter):
+        services = {name: len(hosted.data) for name, hosted in store.stores.items()}
+        status = {"status": "healthy", "records": sum(services.values()), "services": services}
+    else:
+        status = {"status": "healthy", "records": len(store.data) if store else 0}
+    if replicator is not None:
+        status["replication"] = replicator.status()
+    if admission is not None:
+        status["admission"] = admission.status()
+    status["idempotency"] = idempotency.status()
+    return jsonify(status), 200
 
-def create_rest_api(resource_path: str, versions=None):
+def create_rest_api(resource_path: str, versions=None, read_only: bool = False):
     """Create RESTful API routes for a resource.
 
+    read_only=True registers only the read routes (list, get, search,
+    changes, snapshot), for derived views maintained by the service
+    itself; writes to the resource are then answered with 405.
+
     OpenAPI spec serving:
       - Non-versioned APIs (versions=None, the default): spec is served at
         /{resource_path}/openapi.yaml from /public/openapi.yaml.
@@ -145,11 +1638,28 @@ def create_rest_api(resource_path: str, versions=None):
     path that doesn't collide with other APIs on the same uplink.
     """
 
+    # Bound now: with several services in one process (host_service.py)
+    # these globals move on to the next service after registration
+    resource_name = RESOURCE_NAME
+    spec_dir = SPEC_DIR
+
+    def route(rule: str, **options):
+        """app.route with endpoints named per resource, so resources can share an app"""
+        if read_only and set(options.get('methods', ['GET'])) - {'GET', 'HEAD', 'OPTIONS'}:
+            return lambda view: view
+
+        def decorator(view):
+            return app.route(rule, endpoint=f'{resource_path}_{view.__name__}', **options)(view)
+        return decorator
+
     def _serve_spec(openapi_path):
-        if os.path.exists(openapi_path):
-            with open(openapi_path, 'r') as f:
-                return f.read(), 200, {'Content-Type': 'application/x-yaml'}
-        return "OpenAPI spec not found", 404
+        spec = spec_cache.get(openapi_path)
+        if spec is None:
+            return "OpenAPI spec not found", 404
+        response = app.response_class(spec["body"], status=200, content_type='application/x-yaml')
+        response.set_etag(spec["etag"])
+        response.last_modified = spec["last_modified"]
+        return response.make_conditional(request)
 
     if versions:
         # One Flask route per version reading its own ConfigMap-mounted file.
@@ -157,7 +1667,7 @@ def create_rest_api(resource_path: str, versions=None):
         for v in versions:
             def _make_openapi(version=v):
                 def openapi_version():
-                    return _serve_spec(f'/public/{version}/openapi.yaml')
+                    return _serve_spec(f'{spec_dir}/{version}/openapi.yaml')
                 return openapi_version
             app.add_url_rule(
                 f'/{resource_path}/{v}/openapi.yaml',
@@ -166,65 +1676,110 @@ def create_rest_api(resource_path: str, versions=None):
                 methods=['GET'],
             )
     else:
-        @app.route(f'/{resource_path}/openapi.yaml', methods=['GET'])
+        @route(f'/{resource_path}/openapi.yaml', methods=['GET'])
         def openapi():
-            return _serve_spec(os.getenv('OPENAPI_FILE', '/public/openapi.yaml'))
+            return _serve_spec(os.getenv('OPENAPI_FILE', f'{spec_dir}/openapi.yaml'))
 
-    @app.route(f'/{resource_path}', methods=['GET'])
+    @route(f'/{resource_path}', methods=['GET'])
     def list_all():
         """List all records"""
         # Support query parameters for filtering
         filters = request.args.to_dict()
 
         if filters:
-            results = store.search(**filters)
-            return jsonify(results), 200
+            return conditional_jsonify(store.collection_etag(), lambda: store.search(**filters))
 
         # Return array of all records
-        return jsonify(list(store.data.values())), 200
+        return conditional_jsonify(store.collection_etag(), lambda: list(store.data.values()))
     
-    @app.route(f'/{resource_path}/<record_id>', methods=['GET'])
+    @route(f'/{resource_path}/<record_id>', methods=['GET'])
     def get_one(record_id):
         """Get single record"""
         record = store.get_by_id(record_id)
         if record:
             # Return single record object directly
-            return jsonify(record), 200
+            return conditional_jsonify(store.record_etag(record_id), lambda: record)
         return jsonify({"error": "Not found", "status": 404}), 404
     
-    @app.route(f'/{resource_path}', methods=['POST'])
+    @route(f'/{resource_path}', methods=['POST'])
     def create():
         """Create new record"""
         data = request.get_json(silent=True) or {}
         if not data:
             return jsonify({"error": "No data provided"}), 400
-        
-        record = store.create(data)
+        if not isinstance(data, dict):
+            return jsonify({"error": "record must be an object"}), 400
+        if data.get(store.id_field) is not None and not isinstance(data[store.id_field], str):
+            return jsonify({"error": f"{store.id_field} must be a string"}), 400
+
+        with store.lock:
+            if data.get(store.id_field) and store.get_by_id(data[store.id_field]):
+                return jsonify({"error": "Already exists", "status": 409}), 409
+            record = store.create(data)
         return jsonify(record), 201
     
-    @app.route(f'/{resource_path}/<record_id>', methods=['PUT', 'PATCH'])
+    @route(f'/{resource_path}/_bulk', methods=['POST'])
+    def bulk():
+        """Apply many create/upsert/patch/delete operations in one request.
+
+        Accepts a JSON array of operations (or {"operations": [...]}) or
+        NDJSON with one operation per line.
+        """
+        if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+            try:
+                operations = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+            except ValueError as e:
+                return jsonify({"error": f"Invalid NDJSON: {e}"}), 400
+        else:
+            body = request.get_json(silent=True)
+            operations = body.get("operations") if isinstance(body, dict) else body
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "No operations provided"}), 400
+
+        if resource_name == "Bookings":
+            # Bookings are cancelled rather than deleted, as in DELETE below
+            operations = [
+                {"op": "patch", "id": o.get("id"), "record": {"status": "cancelled"}}
+                if isinstance(o, dict) and o.get("op") == "delete" else o
+                for o in operations
+            ]
+
+        results = store.bulk(operations)
+        errors = sum(1 for r in results if r["status"] >= 400)
+        return jsonify({"applied": len(results) - errors, "errors": errors, "results": results}), 200
+
+    @route(f'/{resource_path}/<record_id>', methods=['PUT', 'PATCH'])
     def update(record_id):
         """Update existing record"""
         data = request.get_json(silent=True)
         if data is None:
             data = {}
 
-        # If record doesn't exist, still return 404
-        existing = store.get_by_id(record_id)
-        if not existing:
-            return jsonify({"error": "Not found"}), 404
+        # Hold the store lock so the If-Match check and the write are atomic
+        with store.lock:
+            # If record doesn't exist, still return 404
+            existing = store.get_by_id(record_id)
+            if not existing:
+                return jsonify({"error": "Not found"}), 404
+
+            if precondition_failed(store.record_etag(record_id)):
+                return jsonify({"error": "Precondition failed", "status": 412}), 412
 
-        # If no updates provided, act as a no-op update and return the current record
-        if not data:
-            return jsonify({"status": "updated", "data": existing}), 200
+            # If no updates provided, act as a no-op update and return the current record
+            if not data:
+                record = existing
+            else:
+                record = store.update(record_id, data)
+            etag = store.record_etag(record_id)
 
-        record = store.update(record_id, data)
-        return jsonify({"status": "updated", "data": record}), 200
+        response = jsonify({"status": "updated", "data": record})
+        response.set_etag(etag)
+        return response, 200
     
-    @app.route(f'/{resource_path}/<record_id>', methods=['DELETE'])
+    @route(f'/{resource_path}/<record_id>', methods=['DELETE'])
     def delete(record_id):
         """Delete record"""
-        if RESOURCE_NAME == "Bookings":
+        if resource_name == "Bookings":
             # Bookings API expects 204 No Content on successful cancel
             existing = store.get_by_id(record_id)
             if existing:
@@ -235,13 +1790,817 @@ def create_rest_api(resource_path: str, versions=None):
             return jsonify({"status": "deleted"}), 200
         return jsonify({"error": "Not found"}), 404
     
+    feed_paths[f'/{resource_path}/changes'] = store
+
+    @route(f'/{resource_path}/_snapshot', methods=['GET'])
+    def snapshot():
+        """All records with their versions at one store version (for followers)"""
+        return jsonify(store.snapshot()), 200
+
+    @route(f'/{resource_path}/changes', methods=['GET'])
+    def changes():
+        """Change feed: deltas after ?since=<seq>.
+
+        Returns immediately when changes are pending, otherwise long-polls for
+        up to ?wait=<seconds>. With Accept: text/event-stream (or ?stream=sse)
+        the feed is streamed as Server-Sent Events, resuming from
+        Last-Event-ID when the browser reconnects. Every response carries the
+        store's epoch; clients pass it back as ?epoch= so a restart of the
+        store is noticed. Clients whose `since` has fallen out of the change
+        log, or whose epoch is stale, get a resync signal instead of deltas.
+        """
+        try:
+            since, epoch = _feed_position(store, request.args.get('since', ''), request.args.get('epoch'),
+                                          request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            return jsonify({"error": "since must be an integer"}), 400
+
+        if (request.args.get('stream') == 'sse'
+                or request.accept_mimetypes.best == 'text/event-stream'):
+            return Response(
+                _stream_changes(store, since, epoch),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+            )
+
+        try:
+            wait = min(float(request.args.get('wait', 0)), CHANGES_MAX_WAIT)
+        except ValueError:
+            return jsonify({"error": "wait must be a number"}), 400
+
+        changes, resync = store.changes_since(since, epoch)
+        if not changes and not resync and wait > 0:
+            store.wait_for_change(since, wait)
+            changes, resync = store.changes_since(since, epoch)
+        if resync:
+            return jsonify({"epoch": store.epoch, "seq": store.version, "resync": True, "changes": []}), 200
+        seq = changes[-1]["seq"] if changes else since
+        return jsonify({"epoch": store.epoch, "seq": seq, "resync": False, "changes": changes}), 200
+
     # Special search endpoint
-    @app.route(f'/{resource_path}/search', methods=['GET'])
+    @route(f'/{resource_path}/search', methods=['GET'])
     def search():
         """Search with query parameters"""
         filters = request.args.to_dict()
-        results = store.search(**filters)
-        return jsonify(results), 200
+        return conditional_jsonify(store.collection_etag(), lambda: store.search(**filters))
+
+
+
+class Replicator(threading.Thread):
+    """Keeps a follower's store in step with the leader's change log.
+
+    Starts from the leader's /_snapshot, then long-polls /changes and
+    applies each entry with the leader's sequence numbers. Versions and
+    ETags therefore match the leader's, and a follower's own /changes
+    feed can be consumed like the leader's. The follower polls with the
+    leader's epoch, so a resync from the leader, including one caused by a
+    leader restart, triggers a new snapshot.
+    """
+
+    def __init__(self, feed_store: InMemoryStore, leader_url: str, resource_path: str):
+        super().__init__(name="replicator", daemon=True)
+        self.store = feed_store
+        self.base_url = f"{leader_url.rstrip('/')}/{resource_path}"
+        self.wait = max(0.5, min(CHANGES_MAX_WAIT, REPLICA_MAX_STALENESS / 2))
+        self.synced = False
+        self.last_contact: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def _get(self, path: str, timeout: float) -> Any:
+        url = self.base_url + path
+        response = client.request('GET', url, timeout=timeout)
+        if not response.ok:
+            raise ServiceError(url, response)
+        return response.json()
+
+    def lag(self) -> float:
+        """Seconds since the follower last confirmed it had the leader's state"""
+        return time.monotonic() - self.last_contact if self.last_contact is not None else float('inf')
+
+    def run(self):
+        backoff = 1.0
+        while True:
+            try:
+                if not self.synced:
+                    contact = time.monotonic()
+                    self.store.load_snapshot(self._get('/_snapshot', 60))
+                    self.synced = True
+                    logger.info("Replica loaded snapshot at seq %d from %s", self.store.version, self.base_url)
+                else:
+                    contact = time.monotonic()
+                    feed = self._get(f'/changes?since={self.store.version}&epoch={self.store.epoch}'
+                                     f'&wait={self.wait}', self.wait + 10)
+                    restarted = feed.get("epoch") != self.store.epoch
+                    if restarted:
+                        logger.warning("Leader %s restarted (epoch %s, was %s); re-snapshotting",
+                                       self.base_url, feed.get("epoch"), self.store.epoch)
+                    if restarted or feed.get("resync"):
+                        self.synced = False
+                        continue
+                    for change in feed["changes"]:
+                        self.store.apply_replicated(change)
+                self.last_contact = contact
+                self.last_error = None
+                backoff = 1.0
+            except (ServiceError, OSError, ValueError, KeyError) as e:
+                self.last_error = str(e)
+                logger.warning("Replication from %s failed: %s", self.base_url, e)
+                time.sleep(backoff)
+                # Retry at least once per staleness window so a returning
+                # leader is picked up before reads start being forwarded
+                backoff = min(backoff * 2, max(1.0, REPLICA_MAX_STALENESS))
+
+    def status(self) -> Dict:
+        lag = self.lag()
+        return {"role": "follower", "leader": self.base_url, "seq": self.store.version,
+                "lag_seconds": round(lag, 3) if lag != float('inf') else None, "last_error": self.last_error}
+
+
+replicator: Optional[Replicator] = None
+
+# Hop-by-hop and per-connection headers not copied between leader and client
+_UNFORWARDED = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host', 'date', 'server'}
+
+
+def start_replication():
+    """Start following LEADER_URL when this process is a follower"""
+    global replicator
+    if REPLICATION_ROLE != 'follower' or replicator is not None:
+        return
+    if not LEADER_URL or not feed_paths:
+        raise RuntimeError("REPLICATION_ROLE=follower needs LEADER_URL and a REST resource")
+    if isinstance(store, SharedStore):
+        raise RuntimeError("Replication needs STORE_BACKEND=memory")
+    if isinstance(store, StoreRouter):
+        raise RuntimeError("Replication follows a single service; not available with HOSTED_SERVICES")
+    replicator = Replicator(store, LEADER_URL, next(iter(feed_paths)).split('/')[1])
+    replicator.start()
+
+
+def _forward_to_leader():
+    """Send the current request to the leader and relay its response"""
+    url = LEADER_URL.rstrip('/') + request.path
+    if request.query_string:
+        url += '?' + request.query_string.decode('latin-1')
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in _UNFORWARDED}
+    try:
+        upstream = client.request(request.method, url, body=request.get_data() or None,
+                                  headers=headers, timeout=REPLICA_FORWARD_TIMEOUT)
+    except OSError as e:
+        return jsonify({"error": f"Leader unavailable: {e}"}), 503
+    response = app.response_class(upstream.body, status=upstream.status)
+    for name, value in upstream.headers.items():
+        if name not in _UNFORWARDED:
+            response.headers[name] = value
+    # Read-your-writes: don't answer until this replica has the write
+    version = upstream.headers.get('x-store-version')
+    if request.method not in ('GET', 'HEAD') and version and version.isdigit():
+        store.wait_for_version(int(version), REPLICA_MAX_STALENESS)
+    return response
+
+
+@app.before_request
+def _route_for_replica():
+    """On followers, forward writes, reads while stale and reads of
+    process-local state (leader_routes) to the leader"""
+    if replicator is None:
+        return None
+    if request.path == '/health' or request.path in feed_paths or request.path.endswith('/_snapshot'):
+        return None
+    if request.url_rule is not None and request.url_rule.rule in leader_routes:
+        return _forward_to_leader()
+    if request.method in ('GET', 'HEAD', 'OPTIONS') and replicator.synced and replicator.lag() <= REPLICA_MAX_STALENESS:
+        return None
+    return _forward_to_leader()
+
+
+@app.after_request
+def _stamp_store_version(response):
+    """Tell followers which store version a response reflects"""
+    if REPLICATION_ROLE and store:
+        response.headers['X-Store-Version'] = str(store.version)
+    return response
+
+
+class IdempotentRequest:
+    """One Idempotency-Key: pending until its first request finishes"""
+
+    __slots__ = ('fingerprint', 'done', 'response', 'expires')
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        # (status, headers, body) once finished; None if it failed and may be retried
+        self.response: Optional[tuple] = None
+        self.expires = time.monotonic() + IDEMPOTENCY_TTL
+
+
+class IdempotencyCache:
+    """Responses by idempotency key, bounded by count and TTL.
+
+    Entries are kept in insertion order, so expired ones are dropped from
+    the front and, past max_keys, the oldest go first. Server errors are
+    not kept: the entry is released so a retry runs the request again.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.entries: "OrderedDict[tuple, IdempotentRequest]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"executed": 0, "replayed": 0, "waited": 0, "conflicts": 0}
+
+    def claim(self, key: tuple, fingerprint: str):
+        """(entry, True) when the caller should run the request, else (existing entry, False)"""
+        now = time.monotonic()
+        with self.lock:
+            while self.entries:
+                oldest = next(iter(self.entries.values()))
+                if oldest.expires > now and len(self.entries) < self.max_keys:
+                    break
+                self.entries.popitem(last=False)
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires > now:
+                return entry, False
+            entry = self.entries[key] = IdempotentRequest(fingerprint)
+            self.stats["executed"] += 1
+            return entry, True
+
+    def finish(self, key: tuple, entry: IdempotentRequest, response: Optional[tuple]):
+        with self.lock:
+            entry.response = response
+            if response is None and self.entries.get(key) is entry:
+                del self.entries[key]
+        entry.done.set()
+
+    def count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def status(self) -> Dict:
+        with self.lock:
+            return {"keys": len(self.entries), **self.stats}
+
+
+idempotency = IdempotencyCache(IDEMPOTENCY_MAX_KEYS)
+
+
+def _idempotency_error(status: int, message: str):
+    return jsonify({"error": message, "status": status}), status
+
+
+@app.before_request
+def _idempotent_replay():
+    """Answer retried POST/PATCH requests carrying an Idempotency-Key from the first response"""
+    token = request.headers.get('Idempotency-Key')
+    if not token or request.method not in ('POST', 'PATCH'):
+        return None
+    if len(token) > 255:
+        return _idempotency_error(400, "Idempotency-Key is too long")
+    key = (AdmissionControl.client_key(request.environ), request.method, request.path, token)
+    fingerprint = hashlib.sha256(request.query_string + b'?' + request.get_data()).hexdigest()
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        entry, owner = idempotency.claim(key, fingerprint)
+        if owner:
+            g.idempotency = (key, entry)
+            return None
+        if entry.fingerprint != fingerprint:
+            idempotency.count("conflicts")
+            return _idempotency_error(422, "Idempotency-Key was already used with a different request")
+        if not entry.done.is_set():
+            idempotency.count("waited")
+            if not entry.done.wait(max(0.0, deadline - time.monotonic())):
+                idempotency.count("conflicts")
+                return _idempotency_error(409, "A request with this Idempotency-Key is still in progress")
+        if entry.response is None:
+            # The first attempt failed; run this one instead
+            continue
+        idempotency.count("replayed")
+        status, headers, body = entry.response
+        response = app.response_class(body, status=status, headers=headers)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+
+@app.after_request
+def _idempotent_store(response):
+    """Keep the first response for an Idempotency-Key; release the key on server errors"""
+    claimed = g.pop('idempotency', None)
+    if claimed is not None:
+        key, entry = claimed
+        if response.status_code >= 500 or response.direct_passthrough or response.is_streamed:
+            idempotency.finish(key, entry, None)
+        else:
+            headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ('set-cookie', 'date')]
+            idempotency.finish(key, entry, (response.status_code, headers, response.get_data()))
+    return response
+
+
+@app.teardown_request
+def _idempotent_release(exc):
+    """Never leave a key pending when the request died before after_request"""
+    claimed = g.pop('idempotency', None)
+    if claimed is not None:
+        idempotency.finish(*claimed, None)
+
+
+# Objects deep_size does not follow: code, classes, threads, the app and
+# stores (reported on their own)
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+           threading.Thread, Flask, InMemoryStore)
+
+
+def deep_size(obj, sample: int = MEMORY_SAMPLE) -> int:
+    """Approximate bytes reachable from obj.
+
+    Containers with more than `sample` items are measured on a random
+    sample of them and scaled up, so the cost is bounded whatever the size
+    of the store. Objects reached twice within one measurement are counted
+    once.
+    """
+    seen = set()
+    rng = random.Random(0)
+
+    def size(o) -> float:
+        if id(o) in seen or isinstance(o, _OPAQUE):
+            return 0
+        seen.add(id(o))
+        total = sys.getsizeof(o)
+        if isinstance(o, (str, bytes, bytearray, int, float, bool)) or o is None:
+            return total
+        if isinstance(o, dict):
+            # list() copies in one step, so concurrent writers can't break the walk
+            items = list(o.items())
+            n = len(items)
+            if n > sample:
+                items = rng.sample(items, sample)
+            return total + n / max(1, min(n, sample)) * sum(size(k) + size(v) for k, v in items)
+        if isinstance(o, (list, tuple, set, frozenset, deque)):
+            items = list(o)
+            n = len(items)
+            if n > sample:
+                items = rng.sample(items, sample)
+            return total + n / max(1, min(n, sample)) * sum(size(v) for v in items)
+        attributes = getattr(o, '__dict__', None)
+        if attributes is not None:
+            total += size(attributes)
+        for cls in type(o).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if isinstance(slot, str) and hasattr(o, slot):
+                    total += size(getattr(o, slot))
+        return total
+
+    return int(size(obj))
+
+
+def _items(value) -> Optional[int]:
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _largest(collection, top: int) -> List[Dict]:
+    """The top keys of a mapping, ranked by item count (or shallow size), with deep sizes"""
+    if not isinstance(collection, dict) or not collection:
+        return []
+    biggest = heapq.nlargest(top, list(collection.items()), key=lambda kv: (
+        len(kv[1]) if isinstance(kv[1], (dict, list, set, deque)) else sys.getsizeof(kv[1])))
+    return [{"key": str(key), "items": _items(value), "bytes": deep_size(value)} for key, value in biggest]
+
+
+def _collection_memory(value, top: int) -> Dict:
+    return {"items": _items(value), "bytes": deep_size(value), "largest": _largest(value, top)}
+
+
+def _store_memory(s: InMemoryStore, top: int) -> Dict:
+    """Record counts and approximate sizes of one store's collections and query indexes"""
+    report: Dict[str, Any] = {"resource": s.resource_name, "records": len(s.data), "version": s.version}
+    collections = {}
+    if isinstance(s, SharedStore):
+        # Records, versions and the change log live in SQLite
+        report["backend"] = "sqlite"
+        report["db_bytes"] = sum(os.path.getsize(s.path + suffix) for suffix in ('', '-wal', '-shm')
+                                 if os.path.exists(s.path + suffix))
+    else:
+        report["backend"] = "memory"
+        collections["data"] = s.data
+        collections["record_versions"] = s.record_versions
+        collections["collection_versions"] = s.collection_versions
+        collections["changes"] = s.changes
+    for key, value in (s.raw_data or {}).items():
+        # The primary collection is loaded from raw_data and shares its dict;
+        # shared side collections are part of db_bytes
+        if value is not s.data and not isinstance(value, SharedRecords):
+            collections[f"raw_data.{key}"] = value
+    report["collections"] = {name: _collection_memory(value, top) for name, value in collections.items()}
+
+    queries = s.queries
+    with queries.lock:
+        report["indexes"] = {
+            "plans": len(queries.plans),
+            "fields": {field: {"values": len(index), "bytes": deep_size(index)}
+                       for field, index in queries.indexes.items()},
+            "reverse_bytes": deep_size(queries.indexed),
+        }
+    return report
+
+
+def _process_memory() -> Dict:
+    """Resident and peak resident memory (MB) from /proc; empty where unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return {"rss_mb": int(fields['VmRSS'].split()[0]) / 1024, "peak_rss_mb": int(fields['VmHWM'].split()[0]) / 1024}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+_trace_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def _tracemalloc_report(action: Optional[str], top: int) -> Optional[Dict]:
+    """Start/stop allocation tracing and diff the current snapshot against the baseline"""
+    global _trace_baseline
+    if action == 'start' and not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+        _trace_baseline = None
+    elif action == 'stop':
+        tracemalloc.stop()
+        _trace_baseline = None
+        return {"tracing": False}
+    if not tracemalloc.is_tracing():
+        return None
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    current, peak = tracemalloc.get_traced_memory()
+    report = {"tracing": True, "traced_bytes": current, "peak_bytes": peak}
+    if _trace_baseline is not None:
+        report["growth"] = [{
+            "where": str(stat.traceback[0]),
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+        } for stat in snapshot.compare_to(_trace_baseline, 'lineno')[:top]]
+    if _trace_baseline is None or action in ('start', 'reset'):
+        _trace_baseline = snapshot
+    return report
+
+
+@app.route('/admin/memory', methods=['GET'])
+def memory_report():
+    """Where this process's memory goes.
+
+    Per store: record counts and approximate deep sizes of every collection
+    (sampled, see MEMORY_SAMPLE), their largest keys and the query indexes.
+    Also the response cache, spec cache, idempotency cache, service
+    client and the structures services registered with register_memory().
+    ?trace=start begins tracemalloc and records a baseline; later calls
+    report the biggest allocation growth since the baseline (?trace=reset
+    moves it, ?trace=stop ends tracing).
+    """
+    try:
+        top = max(1, int(request.args.get('top', MEMORY_TOP)))
+    except ValueError:
+        return jsonify({"error": "top must be an integer"}), 400
+    action = request.args.get('trace')
+    if action not in (None, 'start', 'reset', 'stop'):
+        return jsonify({"error": "trace must be start, reset or stop"}), 400
+
+    started = time.perf_counter()
+    stores = store.stores if isinstance(store, StoreRouter) else ({RESOURCE_NAME: store} if store else {})
+    report: Dict[str, Any] = {
+        "process": _process_memory(),
+        "stores": {name: _store_memory(s, top) for name, s in stores.items()},
+        "caches": {
+            "response_cache": response_cache.stats() if response_cache else None,
+            "spec_cache": {"entries": len(spec_cache.entries), "bytes": deep_size(spec_cache.entries)},
+            "idempotency": {**idempotency.status(), "bytes": deep_size(idempotency.entries)},
+            "service_client": {"cached": len(client.cache), "bytes": deep_size(client.cache)},
+        },
+        "services": {name: {"bytes": deep_size(obj)} for name, obj in memory_sources.items()},
+    }
+    tracing = _tracemalloc_report(action, top)
+    if tracing is not None:
+        report["tracemalloc"] = tracing
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return jsonify(report), 200
+
+
+# Runtime: RUNTIME=flask (default) runs the Flask dev server, one thread per
+# connection. RUNTIME=asyncio serves the same app from an asyncio server.
+# There, idle keep-alive connections, change-feed long-polls and SSE streams
+# cost no thread, and only requests being handled take one of ASYNC_WORKERS
+# threads.
+RUNTIME = os.getenv('RUNTIME', 'flask').lower()
+ASYNC_WORKERS = int(os.getenv('ASYNC_WORKERS', '32'))
+ASYNC_IDLE_TIMEOUT = float(os.getenv('ASYNC_IDLE_TIMEOUT', '75'))
+ASYNC_MAX_BODY_MB = float(os.getenv('ASYNC_MAX_BODY_MB', '64'))
+
+# Worker processes sharing one listening socket. More than one needs
+# STORE_BACKEND=sqlite, otherwise each worker has its own copy of the data.
+WORKERS = int(os.getenv('WORKERS', '1'))
+
+# Same logger and line format as the Flask dev server, so access lines are
+# sampled the same way in both runtimes
+access_logger = logging.getLogger('werkzeug')
+
+
+class AsyncRuntime:
+    """HTTP/1.1 server on asyncio in front of the Flask WSGI app.
+
+    Change feeds (/<resource>/changes) are answered on the event loop: a
+    long-poll or SSE client waits on an asyncio.Event that store writes set
+    from whatever thread they run on. Every other request is handed to the
+    unchanged Flask app on a small thread pool, so service-specific routes
+    behave exactly as in the default runtime.
+    """
+
+    def __init__(self, wsgi_app, feeds: Dict[str, InMemoryStore], workers: int):
+        self.wsgi_app = wsgi_app
+        self.feeds = feeds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wsgi")
+        # Probes get their own threads so a saturated pool can't fail them
+        self.priority_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="wsgi-priority")
+        # Requests handed to the pool but not finished; past the admission
+        # queue they are refused here rather than piling up in the executor
+        self.pending = 0
+        self.max_pending = workers + ADMISSION_QUEUE if ADMISSION_MAX_CONCURRENT > 0 else 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # One event per store, keyed by id(store)
+        self.changed: Dict[int, asyncio.Event] = {}
+        self.connections = 0
+
+    async def serve(self, host: str, port: int, sock: Optional[socket.socket] = None):
+        self.loop = asyncio.get_running_loop()
+        for feed_store in {id(s): s for s in self.feeds.values()}.values():
+            key = id(feed_store)
+            self.changed[key] = asyncio.Event()
+            feed_store.subscribe(lambda change, key=key: self.loop.call_soon_threadsafe(self._wake, key))
+        if sock is not None:
+            server = await asyncio.start_server(self._connection, sock=sock, backlog=4096)
+        else:
+            server = await asyncio.start_server(self._connection, host, port, backlog=4096)
+        logger.info("Asyncio runtime listening on %s:%s with %d WSGI workers", host, port, ASYNC_WORKERS)
+        async with server:
+            await server.serve_forever()
+
+    def _wake(self, key: int):
+        # Waiters hold the current event; swap in a fresh one for the next round
+        event, self.changed[key] = self.changed[key], asyncio.Event()
+        event.set()
+
+    async def _wait_for_change(self, feed_store: InMemoryStore, since: int, timeout: float) -> bool:
+        deadline = self.loop.time() + timeout
+        while feed_store.version == since:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                # Writes by other worker processes don't wake us; poll for them
+                await asyncio.wait_for(self.changed[id(feed_store)].wait(),
+                                       min(remaining, feed_store.poll_interval or remaining))
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), ASYNC_IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self._respond(writer, 400, [], b'', False)
+                    return
+                headers = [tuple(part.strip() for part in line.split(':', 1)) for line in lines[1:] if ':' in line]
+                fields = {name.lower(): value for name, value in headers}
+
+                if 'chunked' in fields.get('transfer-encoding', '').lower():
+                    try:
+                        body = await self._read_chunked(reader)
+                    except ValueError:
+                        await self._respond(writer, 400, [], b'', False)
+                        return
+                else:
+                    length = fields.get('content-length') or '0'
+                    if not length.isdigit():
+                        await self._respond(writer, 400, [], b'', False)
+                        return
+                    length = int(length)
+                    if length > ASYNC_MAX_BODY_MB * 1024 * 1024:
+                        await self._respond(writer, 413, [], b'', False)
+                        return
+                    body = await reader.readexactly(length) if length else b''
+
+                connection = fields.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                path, _, query = target.partition('?')
+
+                if method == 'GET' and path in feed_paths:
+                    status, keep_alive = await self._changes(self.feeds[path], writer, query, fields, keep_alive)
+                elif path in ADMISSION_PRIORITY_PATHS:
+                    status, response_headers, response_body = await self.loop.run_in_executor(
+                        self.priority_executor, self._call_wsgi, method, path, query, version, headers, body, peer)
+                    await self._respond(writer, status, response_headers, response_body, keep_alive,
+                                        head=method == 'HEAD')
+                elif self.max_pending and self.pending >= self.max_pending:
+                    admission.count("busy")
+                    status, response_headers, response_body = overload_response(
+                        503, "Server busy", ADMISSION_QUEUE_TIMEOUT)
+                    await self._respond(writer, status, response_headers, response_body, keep_alive)
+                else:
+                    self.pending += 1
+                    try:
+                        status, response_headers, response_body = await self.loop.run_in_executor(
+                            self.executor, self._call_wsgi, method, path, query, version, headers, body, peer)
+                    finally:
+                        self.pending -= 1
+                    await self._respond(writer, status, response_headers, response_body, keep_alive,
+                                        head=method == 'HEAD')
+                access_logger.info('%s - - [%s] %s', peer[0], time.strftime('%d/%b/%Y %H:%M:%S'),
+                                   f'"{method} {target} {version}" {status} -')
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            return
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                await reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, headers: List[tuple], body: bytes,
+                       keep_alive: bool, length: bool = True, head: bool = False):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines += [f"{name}: {value}" for name, value in headers
+                  if name.lower() not in ('connection', 'content-length', 'transfer-encoding')]
+        if length:
+            # A HEAD reply has no body but the length the GET body would have,
+            # which the app reports in its own Content-Length
+            size = len(body)
+            if head:
+                size = next((value for name, value in headers if name.lower() == 'content-length'), size)
+            lines.append(f"Content-Length: {size}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (b'' if head else body))
+        await writer.drain()
+
+    def _call_wsgi(self, method: str, path: str, query: str, version: str,
+                   headers: List[tuple], body: bytes, peer: tuple):
+        """Run one request through the Flask app (on a worker thread)"""
+        host, _, port = dict((k.lower(), v) for k, v in headers).get('host', 'localhost').partition(':')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib.parse.unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': host,
+            'SERVER_PORT': port or '80',
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ[key] = value
+            elif key not in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+                # The body has already been de-chunked
+                key = 'HTTP_' + key
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = response_headers
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            response_body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], response_body
+
+    async def _changes(self, feed_store: InMemoryStore, writer: asyncio.StreamWriter, query: str,
+                       fields: Dict[str, str], keep_alive: bool):
+        """/<resource>/changes on the event loop; same contract as the Flask route"""
+        args = {k: v[-1] for k, v in urllib.parse.parse_qs(query, keep_blank_values=True).items()}
+        json_headers = [('Content-Type', app.json.mimetype), ('Access-Control-Allow-Origin', '*')]
+
+        async def reply(status: int, payload: Dict):
+            body = (app.json.dumps(payload, separators=(',', ':')) + '\n').encode()
+            await self._respond(writer, status, json_headers, body, keep_alive)
+            return status, keep_alive
+
+        try:
+            since, epoch = _feed_position(feed_store, args.get('since', ''), args.get('epoch'),
+                                          fields.get('last-event-id', ''))
+        except ValueError:
+            return await reply(400, {"error": "since must be an integer"})
+
+        if args.get('stream') == 'sse' or fields.get('accept', '').startswith('text/event-stream'):
+            await self._respond(writer, 200, [
+                ('Content-Type', 'text/event-stream; charset=utf-8'),
+                ('Cache-Control', 'no-cache'),
+                ('X-Accel-Buffering', 'no'),
+                ('Access-Control-Allow-Origin', '*'),
+            ], b'retry: 2000\n\n', False, length=False)
+            while True:
+                changes, resync = feed_store.changes_since(since, epoch)
+                if resync:
+                    writer.write(_sse_event("resync", {"epoch": feed_store.epoch, "seq": feed_store.version},
+                                            f"{feed_store.epoch}:{feed_store.version}").encode())
+                    await writer.drain()
+                    return 200, False
+                epoch = feed_store.epoch
+                if changes:
+                    since = changes[-1]["seq"]
+                    writer.write(''.join(_sse_event("change", c, f"{epoch}:{c['seq']}") for c in changes).encode())
+                elif not await self._wait_for_change(feed_store, since, SSE_KEEPALIVE):
+                    writer.write(b": keep-alive\n\n")
+                await writer.drain()
+
+        try:
+            wait = min(float(args.get('wait', 0)), CHANGES_MAX_WAIT)
+        except ValueError:
+            return await reply(400, {"error": "wait must be a number"})
+
+        changes, resync = feed_store.changes_since(since, epoch)
+        if not changes and not resync and wait > 0:
+            await self._wait_for_change(feed_store, since, wait)
+            changes, resync = feed_store.changes_since(since, epoch)
+        if resync:
+            return await reply(200, {"epoch": feed_store.epoch, "seq": feed_store.version, "resync": True,
+                                     "changes": []})
+        seq = changes[-1]["seq"] if changes else since
+        return await reply(200, {"epoch": feed_store.epoch, "seq": seq, "resync": False, "changes": changes})
+
+
+def serve(port: int = 3000, host: str = '0.0.0.0'):
+    """Serve the app with the runtime selected by RUNTIME.
+
+    With WORKERS > 1 the first process binds the port and starts
+    WORKERS - 1 copies of itself that inherit the listening socket
+    (SERVE_FD), so the kernel spreads connections across all of them.
+    """
+    start_replication()
+    sock = None
+    if os.getenv('SERVE_FD'):
+        sock = socket.socket(fileno=int(os.environ['SERVE_FD']))
+    elif WORKERS > 1:
+        if not isinstance(store, SharedStore):
+            logger.warning("WORKERS=%d with the %s store: each worker has its own copy of the data",
+                           WORKERS, STORE_BACKEND)
+        sock = socket.create_server((host, port), backlog=4096)
+        sock.set_inheritable(True)
+        children = [
+            subprocess.Popen([sys.executable] + sys.argv, env={**os.environ, 'SERVE_FD': str(sock.fileno())},
+                             pass_fds=[sock.fileno()])
+            for _ in range(WORKERS - 1)
+        ]
+
+        def stop(signum, frame):
+            for child in children:
+                child.terminate()
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, stop)
+        logger.info("Started %d worker processes on port %s", WORKERS, port)
+
+    if RUNTIME == 'asyncio':
+        asyncio.run(AsyncRuntime(app, feed_paths, ASYNC_WORKERS).serve(host, port, sock))
+    elif sock is not None:
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        app.run(host=host, port=port, debug=False)
 
 
 def run_service(resource_name: str, resource_path: str, id_field: str, data_file: str = "/api/api.json", port: int = 3000):
@@ -253,7 +2612,7 @@ def run_service(resource_name: str, resource_path: str, id_field: str, data_file
     logger.info(f"Endpoints: /{resource_path}, /{resource_path}/<id>, /{resource_path}/search")
     logger.info(f"Loaded {len(store.data)} initial records")
     
-    app.run(host='0.0.0.0', port=port, debug=False)
+    serve(port=port)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Compare the Flask and asyncio runtimes of base_service
+
+Starts a generic service in each RUNTIME, parks --idle change-feed
+long-polls on it (the connections that pin a thread apiece under Flask),
+then measures GET throughput and latency while they are held open, along
+with the server's thread count and resident memory.
+
+Usage:
+  python benchmark_runtime.py --data ../files/data/flights.json \
+      --resource flights --id-field flight_id --idle 1000
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_service(runtime: str, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        RUNTIME=runtime,
+        SERVICE_NAME='Benchmark',
+        RESOURCE_PATH=args.resource,
+        ID_FIELD=args.id_field,
+        DATA_FILE=os.path.abspath(args.data),
+        PORT=str(args.port),
+        LOG_LEVEL='WARNING',
+        CHANGES_MAX_WAIT='600',
+    )
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'base_service.py')], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/health", timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{runtime} service did not start on port {args.port}")
+
+
+def process_stats(pid: int) -> dict:
+    """Threads and RSS (MB) from /proc; empty where unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return {"threads": int(fields['Threads']), "rss_mb": int(fields['VmRSS'].split()[0]) / 1024}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+async def read_response(reader: asyncio.StreamReader) -> bool:
+    """Read one response; returns whether the server keeps the connection"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    fields = {}
+    for line in head.decode('latin-1').split('\r\n')[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            fields[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(fields.get('content-length', 0)))
+    return fields.get('connection', '').lower() != 'close'
+
+
+async def hold_idle(port: int, path: str, count: int):
+    """Open long-polls that stay parked until the server is stopped"""
+    conns = []
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"GET {path}/changes?wait=600 HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        conns.append(writer)
+    return conns
+
+
+async def load(port: int, path: str, total: int, concurrency: int):
+    latencies = []
+    remaining = [total]
+
+    async def worker():
+        reader = writer = None
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            started = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            await writer.drain()
+            keep = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if not keep:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+async def run_mode(runtime: str, args) -> dict:
+    proc = start_service(runtime, args)
+    path = f"/{args.resource}"
+    try:
+        idle = await hold_idle(args.port, path, args.idle)
+        await asyncio.sleep(1)
+        held = process_stats(proc.pid)
+        elapsed, latencies = await load(args.port, f"{path}/search", args.requests, args.concurrency)
+        for writer in idle:
+            writer.close()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "runtime": runtime,
+        "req_per_s": len(latencies) / elapsed,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        **held,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--data', default=os.path.join(HERE, '..', 'files', 'data', 'flights.json'))
+    parser.add_argument('--resource', default='flights')
+    parser.add_argument('--id-field', default='flight_id')
+    parser.add_argument('--port', type=int, default=3900)
+    parser.add_argument('--idle', type=int, default=500, help='parked long-poll connections')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--modes', default='flask,asyncio')
+    args = parser.parse_args()
+
+    print(f"{args.idle} idle long-polls, {args.requests} GET {args.resource}/search at concurrency {args.concurrency}")
+    print(f"{'runtime':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'threads':>10}{'rss MB':>10}")
+    for runtime in args.modes.split(','):
+        r = asyncio.run(run_mode(runtime, args))
+        print(f"{r['runtime']:<10}{r['req_per_s']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r.get('threads', '-'):>10}{r.get('rss_mb', 0):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,241 @@
 """Check-in Service - In-memory stateful API with boarding pass"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+from xml.sax.saxutils import escape
 import base_service
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Boarding pass cache bound (entries) and generation worker pool size
+BOARDING_PASS_CACHE_SIZE = int(os.getenv('BOARDING_PASS_CACHE_SIZE', '10000'))
+BOARDING_PASS_WORKERS = int(os.getenv('BOARDING_PASS_WORKERS', '4'))
+
+# IATA compartment codes by cabin name
+COMPARTMENT_CODES = {"first": "F", "business": "J", "premium_economy": "W", "economy": "Y"}
+
+# Fields that appear on the pass; a write that leaves them untouched keeps
+# the existing artifacts
+PASS_FIELDS = ("passenger_name", "flight_id", "seat", "gate", "terminal", "status",
+               "cabin", "cabin_class", "origin", "destination", "route", "departure_time",
+               "checked_in_at", "boarding_group")
+
+
+def _ascii_upper(value: str) -> str:
+    """Fold accents and keep the characters BCBP allows"""
+    folded = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+    return re.sub(r'[^A-Z0-9/ ]', '', folded.upper())
+
+
+def _route(record: Dict):
+    """Return (origin, destination) from explicit fields or a "JFK → CDG" route"""
+    origin, destination = record.get('origin'), record.get('destination')
+    if not (origin and destination) and record.get('route'):
+        codes = re.findall(r'\b[A-Z]{3}\b', record['route'])
+        if len(codes) >= 2:
+            origin, destination = codes[0], codes[1]
+    return (origin or '').upper()[:3], (destination or '').upper()[:3]
+
+
+def encode_bcbp(record: Dict, sequence: int) -> str:
+    """Encode the 60-character mandatory section of an IATA BCBP (M1, one leg)"""
+    name_parts = _ascii_upper(record.get('passenger_name', '')).split()
+    name = f"{name_parts[-1]}/{' '.join(name_parts[:-1])}" if len(name_parts) > 1 else ''.join(name_parts)
+    pnr = re.sub(r'[^A-Z0-9]', '', str(record.get('booking_id', '')).upper())[-7:]
+    origin, destination = _route(record)
+    flight = re.match(r'([A-Z0-9]{2})\W*(\d{1,4})([A-Z]?)', str(record.get('flight_id', '')).upper())
+    carrier, number = (flight.group(1), f"{int(flight.group(2)):04d}{flight.group(3)}") if flight else ('', '')
+
+    julian = '   '
+    for field in ('departure_time', 'checked_in_at'):
+        try:
+            julian = f"{datetime.fromisoformat(record[field].replace('Z', '+00:00')).timetuple().tm_yday:03d}"
+            break
+        except (KeyError, AttributeError, ValueError):
+            continue
+
+    cabin = str(record.get('cabin') or record.get('cabin_class') or 'economy').lower().replace(' ', '_')
+    seat = re.match(r'(\d{1,3})([A-Z])', str(record.get('seat', '')).upper())
+    seat = f"{int(seat.group(1)):03d}{seat.group(2)}" if seat else ''
+
+    return (
+        "M1"
+        + f"{name[:20]:<20}"
+        + "E"
+        + f"{pnr:<7}"
+        + f"{origin:<3}"
+        + f"{destination:<3}"
+        + f"{carrier:<3}"
+        + f"{number:<5}"
+        + julian
+        + COMPARTMENT_CODES.get(cabin, 'Y')
+        + f"{seat:>4}"
+        + f"{sequence:04d} "
+        + "1"
+        + "00"
+    )
+
+
+def render_svg(record: Dict, bcbp: str) -> str:
+    """Render a printable boarding pass as SVG.
+
+    The barcode strip draws the BCBP bytes as bars so passes are visually
+    distinct; it is not a scannable PDF417 symbol, but the BCBP string is
+    printed underneath and returned in the JSON payload for real encoders.
+    """
+    origin, destination = _route(record)
+    bars = []
+    x = 20
+    for byte in bcbp.encode('ascii'):
+        for bit in range(8):
+            if byte & (0x80 >> bit):
+                bars.append(f'<rect x="{x}" y="150" width="1" height="50"/>')
+            x += 1
+    rows = [
+        ("PASSENGER", record.get('passenger_name', ''), 20, 60),
+        ("FLIGHT", record.get('flight_id', ''), 260, 60),
+        ("FROM", origin, 20, 110),
+        ("TO", destination, 120, 110),
+        ("SEAT", record.get('seat', ''), 260, 110),
+        ("GATE", record.get('gate', ''), 360, 110),
+        ("GROUP", record.get('boarding_group', ''), 460, 110),
+    ]
+    labels = ''.join(
+        f'<text x="{x}" y="{y - 16}" font-size="10" fill="#666">{label}</text>'
+        f'<text x="{x}" y="{y}" font-size="16">{escape(str(value or ""))}</text>'
+        for label, value, x, y in rows
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{max(x + 20, 560)}" height="240" '
+        f'font-family="monospace">'
+        f'<rect width="100%" height="100%" fill="#fff" stroke="#222"/>'
+        f'<text x="20" y="24" font-size="14" font-weight="bold">BOARDING PASS</text>'
+        f'{labels}<g fill="#000">{"".join(bars)}</g>'
+        f'<text x="20" y="220" font-size="10">{escape(bcbp)}</text></svg>'
+    )
+
+
+class BoardingPassEngine:
+    """Builds boarding pass artifacts once per check-in state change.
+
+    Passes live in a size-bounded LRU cache keyed by booking and tagged with
+    the check-in record's ETag. Store writes that touch a field printed on
+    the pass (seat, gate, status, ...) schedule a rebuild on the worker
+    pool; other writes just retag the cached pass.
+    """
+
+    def __init__(self, store, max_entries: int, workers: int):
+        self.store = store
+        self.max_entries = max_entries
+        self.passes: "OrderedDict[str, Dict]" = OrderedDict()
+        self.sequences: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="boarding-pass")
+        self.builds = 0
+        store.subscribe(self._on_change)
+
+    @staticmethod
+    def _fingerprint(record: Dict) -> tuple:
+        return tuple(record.get(field) for field in PASS_FIELDS)
+
+    def _sequence(self, record: Dict) -> int:
+        """Stable check-in sequence number per flight, assigned on first build"""
+        per_flight = self.sequences.setdefault(record.get('flight_id', ''), {})
+        return per_flight.setdefault(record.get('booking_id', ''), len(per_flight) + 1)
+
+    def build(self, booking_id: str) -> Optional[Dict]:
+        """Build (or refresh) the pass for a booking from the current record"""
+        with self.store.lock:
+            record = self.store.get_by_id(booking_id)
+            if record is None:
+                return None
+            record = dict(record)
+            etag = self.store.record_etag(booking_id)
+        fingerprint = self._fingerprint(record)
+
+        with self.lock:
+            cached = self.passes.get(booking_id)
+            if cached and cached["fingerprint"] == fingerprint:
+                cached["etag"] = etag
+                self.passes.move_to_end(booking_id)
+                return cached
+            sequence = self._sequence(record)
+
+        bcbp = encode_bcbp(record, sequence)
+        boarding_pass = {
+            "booking_id": booking_id,
+            "etag": etag,
+            "fingerprint": fingerprint,
+            "payload": {**record, "boarding_pass": {"format": "IATA-BCBP", "bcbp": bcbp, "sequence": sequence}},
+            "svg": render_svg(record, bcbp),
+        }
+        with self.lock:
+            self.passes[booking_id] = boarding_pass
+            self.passes.move_to_end(booking_id)
+            while len(self.passes) > self.max_entries:
+                self.passes.popitem(last=False)
+            self.builds += 1
+        return boarding_pass
+
+    def get(self, booking_id: str) -> Optional[Dict]:
+        """Return the cached pass, building it only if missing or stale"""
+        with self.lock:
+            cached = self.passes.get(booking_id)
+            if cached and cached["etag"] == self.store.record_etag(booking_id):
+                self.passes.move_to_end(booking_id)
+                return cached
+        return self.build(booking_id)
+
+    def prebuild_flight(self, flight_id: str) -> int:
+        """Generate passes for every checked-in booking on a flight in parallel"""
+        booking_ids = [
+            booking_id for booking_id, record in list(self.store.data.items())
+            if record.get('flight_id') == flight_id and record.get('status') != 'pending'
+        ]
+        list(self.pool.map(self.build, booking_ids))
+        return len(booking_ids)
+
+    def _on_change(self, change: Dict):
+        booking_id = change.get("id")
+        if booking_id is None:
+            return
+        if change["op"] == "delete":
+            with self.lock:
+                self.passes.pop(booking_id, None)
+            return
+        record = change.get("record") or {}
+        with self.lock:
+            cached = self.passes.get(booking_id)
+        if cached is not None or record.get('status') not in (None, 'pending'):
+            self.pool.submit(self.build, booking_id)
+
+
+boarding_passes: Optional[BoardingPassEngine] = None
+
 
 def setup_checkin_routes():
     """Add check-in specific routes"""
+    global boarding_passes
+    if base_service.WORKERS > 1:
+        # Check-in sequence numbers are assigned per process
+        logger.warning("Boarding passes are per process; boarding pass endpoints disabled with WORKERS=%d",
+                       base_service.WORKERS)
+    else:
+        boarding_passes = BoardingPassEngine(base_service.store, BOARDING_PASS_CACHE_SIZE, BOARDING_PASS_WORKERS)
+        base_service.register_memory('checkin.boarding_passes', boarding_passes)
+    # Pass sequence numbers are not replicated, so followers ask the leader
+    base_service.register_leader_routes('/checkin/<booking_id>/boarding-pass')
+
     @app.route('/checkin/search', methods=['GET'])
     def search_checkin():
         """Search check-ins by any field"""
@@ -15,19 +244,41 @@ def setup_checkin_routes():
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
 
     @app.route('/checkin/<booking_id>/boarding-pass', methods=['GET'])
     def get_boarding_pass(booking_id):
-        """Get boarding pass for a booking"""
+        """Get boarding pass for a booking (JSON with BCBP, or ?format=svg)"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if boarding_passes is None:
+            return jsonify({"error": "Boarding passes unavailable with multiple workers"}), 503
+        boarding_pass = boarding_passes.get(booking_id)
+        if not boarding_pass:
+            return jsonify({"error": "Not found"}), 404
+
+        if request.args.get('format') == 'svg':
+            response = app.response_class(boarding_pass["svg"], mimetype='image/svg+xml')
+            response.set_etag(boarding_pass["etag"] + "-svg")
+            return response.make_conditional(request)
+        return conditional_jsonify(boarding_pass["etag"], lambda: boarding_pass["payload"])
+
+    @app.route('/checkin/boarding-passes/prebuild', methods=['POST'])
+    def prebuild_boarding_passes():
+        """Generate boarding passes for a whole flight before boarding opens"""
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
-        record = base_service.store.get_by_id(booking_id)
-        if record:
-            return jsonify(record), 200
-        return jsonify({"error": "Not found"}), 404
+        if boarding_passes is None:
+            return jsonify({"error": "Boarding passes unavailable with multiple workers"}), 503
+        data = request.get_json(silent=True) or {}
+        flight_id = data.get('flight_id') or request.args.get('flight_id')
+        if not flight_id:
+            return jsonify({"error": "flight_id required"}), 400
+        count = boarding_passes.prebuild_flight(flight_id)
+        return jsonify({"flight_id": flight_id, "generated": count}), 200
 
 if __name__ == '__main__':
     # Initialize the store
@@ -40,10 +291,8 @@ if __name__ == '__main__':
     create_rest_api('checkin', versions=['v1', 'v2'])
 
     # Start the server
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info(f"Starting Check-in service on port 3000")
     logger.info(f"Endpoints: /checkin, /checkin/<booking_id>, /checkin/<booking_id>/boarding-pass")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -2,30 +2,348 @@
 """Crew Service - In-memory stateful API for crew management"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from service_client import ServiceError, client
+from typing import Dict, List, Optional, Tuple
 import base_service
+import logging
+import os
+import threading
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Flights service used to resolve a flight_id into its duty window
+FLIGHTS_SERVICE_URL = os.getenv('FLIGHTS_SERVICE_URL', 'http://flights-app:3000')
+
+# Duty-time limits (hours) and how long duty extends around a flight (minutes)
+MAX_DUTY_PERIOD = float(os.getenv('CREW_MAX_DUTY_HOURS', '14'))
+MIN_REST = float(os.getenv('CREW_MIN_REST_HOURS', '10'))
+MAX_DUTY_ROLLING = float(os.getenv('CREW_MAX_ROLLING_HOURS', '60'))
+ROLLING_WINDOW = float(os.getenv('CREW_ROLLING_WINDOW_HOURS', '168'))
+REPORT_BEFORE = int(os.getenv('CREW_REPORT_BEFORE_MINUTES', '60'))
+RELEASE_AFTER = int(os.getenv('CREW_RELEASE_AFTER_MINUTES', '30'))
+
+HOUR = 3600.0
+
+
+def _parse_time(value) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def duty_window(departure_time, arrival_time) -> Optional[Tuple[float, float]]:
+    """Duty period for a flight: report before departure, release after arrival"""
+    departure, arrival = _parse_time(departure_time), _parse_time(arrival_time)
+    if departure is None or arrival is None or arrival <= departure:
+        return None
+    return departure - REPORT_BEFORE * 60, arrival + RELEASE_AFTER * 60
+
+
+def flight_window(params: Dict):
+    """Duty window from explicit departure/arrival times or a flight_id.
+
+    Returns (status, window_or_error): explicit times win; otherwise the
+    flight is fetched from the flights service (404 if unknown, 503 if it
+    can't be reached).
+    """
+    if params.get('departure_time') or params.get('arrival_time'):
+        window = duty_window(params.get('departure_time'), params.get('arrival_time'))
+        if window is None:
+            return 400, {"error": "departure_time and arrival_time must be valid and in order"}
+        return 200, window
+    flight_id = params.get('flight_id')
+    if not flight_id:
+        return 400, {"error": "flight_id or departure_time and arrival_time required"}
+    url = f"{FLIGHTS_SERVICE_URL}/flights/{urllib.parse.quote(flight_id, safe='')}"
+    try:
+        flight = client.get_json(url)
+    except ServiceError as e:
+        if e.response.status == 404:
+            return 404, {"error": f"Flight {flight_id} not found"}
+        return 503, {"error": f"Flights service returned {e.response.status}"}
+    except (OSError, ValueError) as e:
+        return 503, {"error": f"Flights service unavailable: {e}"}
+    window = duty_window(flight.get('departure_time'), flight.get('arrival_time'))
+    if window is None:
+        return 400, {"error": f"Flight {flight_id} has no valid departure_time/arrival_time"}
+    return 200, window
+
+
+class CrewDuties:
+    """One crew member's duties as sorted (start, end, flight_id) intervals.
+
+    `ends` mirrors the end times and `prefix` holds cumulative duty seconds,
+    so overlap/rest checks are bisects and rolling duty totals are two
+    prefix-sum lookups. Both are rebuilt from the insertion point on change.
+    Duties never overlap (not even forced ones), which keeps `ends` sorted.
+    `by_flight` maps flight_id to its interval so removal is a bisect too.
+    """
+
+    def __init__(self):
+        self.duties: List[Tuple[float, float, str]] = []
+        self.ends: List[float] = []
+        self.prefix: List[float] = [0.0]
+        self.by_flight: Dict[str, Tuple[float, float, str]] = {}
+
+    def _reindex(self, start_at: int):
+        del self.ends[start_at:]
+        del self.prefix[start_at + 1:]
+        for start, end, _ in self.duties[start_at:]:
+            self.ends.append(end)
+            self.prefix.append(self.prefix[-1] + (end - start))
+
+    def add(self, start: float, end: float, flight_id: str):
+        self.remove(flight_id)
+        duty = (start, end, flight_id)
+        i = bisect_left(self.duties, duty)
+        self.duties.insert(i, duty)
+        self.by_flight[flight_id] = duty
+        self._reindex(i)
+
+    def remove(self, flight_id: str) -> bool:
+        duty = self.by_flight.pop(flight_id, None)
+        if duty is None:
+            return False
+        i = bisect_left(self.duties, duty)
+        del self.duties[i]
+        self._reindex(i)
+        return True
+
+    def overlapping(self, start: float, end: float, flight_id: str) -> Optional[str]:
+        """The flight of a duty other than flight_id overlapping [start, end], if any"""
+        j = max(bisect_left(self.duties, (start,)) - 1, 0)
+        while j < len(self.duties) and self.duties[j][0] < end:
+            if self.duties[j][1] > start and self.duties[j][2] != flight_id:
+                return self.duties[j][2]
+            j += 1
+        return None
+
+    def duty_between(self, lo: float, hi: float) -> float:
+        """Seconds on duty within [lo, hi]"""
+        # Duties ending after lo, up to those starting before hi
+        first = bisect_right(self.ends, lo)
+        last = bisect_left(self.duties, (hi,))
+        if first >= last:
+            return 0.0
+        total = self.prefix[last] - self.prefix[first]
+        # Clip the partial duties at either edge of the window
+        total -= max(0.0, lo - self.duties[first][0])
+        total -= max(0.0, self.duties[last - 1][1] - hi)
+        return total
+
+    def violations(self, start: float, end: float) -> List[str]:
+        """Rule violations if a duty [start, end] were added"""
+        problems = []
+        if end - start > MAX_DUTY_PERIOD * HOUR:
+            problems.append(f"duty period {(end - start) / HOUR:.1f}h exceeds {MAX_DUTY_PERIOD:g}h")
+        rest = MIN_REST * HOUR
+        i = bisect_left(self.duties, (start,))
+        if i > 0 and self.duties[i - 1][1] + rest > start:
+            prev = self.duties[i - 1]
+            problems.append(f"conflicts with or lacks {MIN_REST:g}h rest after {prev[2]}")
+        if i < len(self.duties) and end + rest > self.duties[i][0]:
+            problems.append(f"conflicts with or lacks {MIN_REST:g}h rest before {self.duties[i][2]}")
+        # Any rolling window containing the new duty peaks at a window ending
+        # at the new duty's end or at a later duty's end; check both
+        window = ROLLING_WINDOW * HOUR
+        limit = MAX_DUTY_ROLLING * HOUR
+        added = end - start
+        later = bisect_left(self.duties, (end + window,), lo=i)
+        for window_end in [end] + self.ends[i:later]:
+            lo = window_end - window
+            extra = max(0.0, min(end, window_end) - max(start, lo))
+            if self.duty_between(lo, window_end) + extra > limit:
+                problems.append(f"exceeds {MAX_DUTY_ROLLING:g}h duty in {ROLLING_WINDOW:g}h")
+                break
+        return problems
+
+    def summary(self, now: float) -> Dict:
+        window = ROLLING_WINDOW * HOUR
+        return {
+            "duties": [{"flight_id": f, "duty_start": _iso(s), "duty_end": _iso(e)} for s, e, f in self.duties],
+            "rolling_duty_hours": round(self.duty_between(now - window, now) / HOUR, 2),
+            "next_rolling_duty_hours": round(self.duty_between(now, now + window) / HOUR, 2),
+        }
+
+
+class CrewRoster:
+    """Duty rosters for all crew plus a role index over the crew store"""
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.rosters: Dict[str, CrewDuties] = {}
+        self.by_role: Dict[str, set] = {}
+        for crew_id, record in list(store.data.items()):
+            self._index(crew_id, record)
+        store.subscribe(self._on_change)
+
+    def _index(self, crew_id: str, record: Optional[Dict]):
+        for members in self.by_role.values():
+            members.discard(crew_id)
+        if record is not None:
+            self.by_role.setdefault(str(record.get('role', '')).lower(), set()).add(crew_id)
+
+    def _on_change(self, change: Dict):
+        crew_id = change.get("id")
+        if crew_id is None:
+            return
+        with self.lock:
+            self._index(crew_id, change.get("record"))
+            if change["op"] == "delete":
+                self.rosters.pop(crew_id, None)
+
+    def assign(self, crew_id: str, flight_id: str, start: float, end: float,
+               force: bool = False) -> Tuple[bool, List[str]]:
+        """Add a duty unless it breaks the rules; force overrides every rule
+        except overlapping another duty. Returns (added, violations)."""
+        with self.lock:
+            duties = self.rosters.setdefault(crew_id, CrewDuties())
+            clash = duties.overlapping(start, end, flight_id)
+            if clash:
+                return False, [f"overlaps duty for {clash}"]
+            problems = duties.violations(start, end)
+            if problems and not force:
+                return False, problems
+            duties.add(start, end, flight_id)
+            return True, problems
+
+    def unassign(self, crew_id: str, flight_id: str) -> bool:
+        with self.lock:
+            duties = self.rosters.get(crew_id)
+            return bool(duties and duties.remove(flight_id))
+
+    def available(self, start: float, end: float, role: Optional[str], base: Optional[str]) -> List[Dict]:
+        """Crew who can legally take a duty [start, end]"""
+        window = ROLLING_WINDOW * HOUR
+        with self.lock:
+            if role:
+                candidates = list(self.by_role.get(role.lower(), ()))
+            else:
+                candidates = [c for members in self.by_role.values() for c in members]
+            results = []
+            for crew_id in sorted(candidates):
+                record = self.store.get_by_id(crew_id)
+                if record is None or record.get('status', 'active') != 'active':
+                    continue
+                if base and record.get('base') != base:
+                    continue
+                duties = self.rosters.get(crew_id)
+                if duties and duties.violations(start, end):
+                    continue
+                used = duties.duty_between(end - window, end) if duties else 0.0
+                results.append({
+                    **record,
+                    "rolling_duty_hours": round((used + end - start) / HOUR, 2),
+                    "remaining_duty_hours": round((MAX_DUTY_ROLLING * HOUR - used - (end - start)) / HOUR, 2),
+                })
+            return results
+
+
+crew_roster: Optional[CrewRoster] = None
 
 
 def setup_crew_routes():
     """Add crew-specific routes"""
+    global crew_roster
+    if base_service.WORKERS > 1:
+        logger.warning("Crew roster is per process; roster endpoints disabled with WORKERS=%d",
+                       base_service.WORKERS)
+    else:
+        crew_roster = CrewRoster(base_service.store)
+        base_service.register_memory('crew.roster', crew_roster)
+    # Rosters are not replicated, so followers ask the leader
+    base_service.register_leader_routes('/crew/available', '/crew/roster/<crew_id>')
+
     @app.route('/crew/search', methods=['GET'])
     def search_crew():
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
+
+    @app.route('/crew/available', methods=['GET'])
+    def available_crew():
+        """Crew legal and free for a flight (flight_id, or departure_time and arrival_time; role, base)"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if crew_roster is None:
+            return jsonify({"error": "Crew roster unavailable with multiple workers"}), 503
+        status, window = flight_window(request.args)
+        if status != 200:
+            return jsonify(window), status
+        results = crew_roster.available(*window, request.args.get('role'), request.args.get('base'))
         return jsonify(results), 200
 
+    @app.route('/crew/roster', methods=['POST'])
+    def assign_crew():
+        """Assign a crew member to a flight after checking duty/rest limits"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if crew_roster is None:
+            return jsonify({"error": "Crew roster unavailable with multiple workers"}), 503
+        data = request.get_json(silent=True) or {}
+        crew_id, flight_id = data.get('crew_id'), data.get('flight_id')
+        if not crew_id or not flight_id:
+            return jsonify({"error": "crew_id and flight_id required"}), 400
+        if base_service.store.get_by_id(crew_id) is None:
+            return jsonify({"error": "Not found"}), 404
+        status, window = flight_window(data)
+        if status != 200:
+            return jsonify(window), status
+        added, problems = crew_roster.assign(crew_id, flight_id, *window, force=bool(data.get('force')))
+        if not added:
+            return jsonify({"error": "Assignment not legal", "violations": problems}), 409
+        return jsonify({"crew_id": crew_id, "flight_id": flight_id, "duty_start": _iso(window[0]),
+                        "duty_end": _iso(window[1]), "violations": problems}), 201
+
+    @app.route('/crew/roster/<crew_id>', methods=['GET'])
+    def get_roster(crew_id):
+        """Duties and rolling duty totals for a crew member"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if crew_roster is None:
+            return jsonify({"error": "Crew roster unavailable with multiple workers"}), 503
+        if base_service.store.get_by_id(crew_id) is None:
+            return jsonify({"error": "Not found"}), 404
+        duties = crew_roster.rosters.get(crew_id) or CrewDuties()
+        now = _parse_time(request.args.get('at')) or datetime.now(timezone.utc).timestamp()
+        with crew_roster.lock:
+            return jsonify({"crew_id": crew_id, **duties.summary(now)}), 200
+
+    @app.route('/crew/roster/<crew_id>/<flight_id>', methods=['DELETE'])
+    def unassign_crew(crew_id, flight_id):
+        """Remove a crew member from a flight"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if crew_roster is None:
+            return jsonify({"error": "Crew roster unavailable with multiple workers"}), 503
+        if crew_roster.unassign(crew_id, flight_id):
+            return jsonify({"status": "deleted"}), 200
+        return jsonify({"error": "Not found"}), 404
+
 
 if __name__ == '__main__':
     init_store('/api/api.json', 'crew_id', 'Crew')
     setup_crew_routes()
     create_rest_api('crew')
 
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info("Starting Crew service on port 3000")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
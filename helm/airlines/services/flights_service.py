@@ -2,12 +2,288 @@
 """Flights Service - In-memory stateful API with search"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from service_client import client
+from typing import Dict, List, Optional, Tuple
 import base_service
+import heapq
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Seconds a seat hold lasts unless the request asks for less
+SEAT_HOLD_TTL = float(os.getenv('SEAT_HOLD_TTL', '600'))
+
+# Sibling services joined into the flight status view, and how long the
+# view waits for the slowest of them
+GATES_SERVICE_URL = os.getenv('GATES_SERVICE_URL', 'http://gates-app:3000')
+CREW_SERVICE_URL = os.getenv('CREW_SERVICE_URL', 'http://crew-app:3000')
+PRICING_SERVICE_URL = os.getenv('PRICING_SERVICE_URL', 'http://pricing-app:3000')
+STATUS_VIEW_TIMEOUT = float(os.getenv('STATUS_VIEW_TIMEOUT', '2'))
+
+# Cabin layouts as (cabin, first_row, last_row, seat letters)
+CABIN_LAYOUTS = {
+    "narrowbody": [
+        ("business", 1, 4, "ACDF"),
+        ("economy", 5, 30, "ABCDEF"),
+    ],
+    "widebody": [
+        ("first", 1, 2, "AEFK"),
+        ("business", 3, 10, "ACDGHK"),
+        ("premium_economy", 11, 15, "ABCEFGJK"),
+        ("economy", 16, 45, "ABCDEFGHJK"),
+    ],
+    "superjumbo": [
+        ("first", 1, 3, "AEFK"),
+        ("business", 4, 14, "ACDGHK"),
+        ("premium_economy", 15, 20, "ABCEFGJK"),
+        ("economy", 21, 60, "ABCDEFGHJK"),
+    ],
+}
+
+
+def layout_for(aircraft: str) -> List[Tuple[str, int, int, str]]:
+    """Pick a cabin layout from the aircraft type"""
+    aircraft = (aircraft or '').upper()
+    if aircraft.startswith('A380'):
+        return CABIN_LAYOUTS["superjumbo"]
+    if re.match(r'A3(19|20|21)|B73|B75', aircraft):
+        return CABIN_LAYOUTS["narrowbody"]
+    return CABIN_LAYOUTS["widebody"]
+
+
+class Cabin:
+    """Seat numbering for one cabin; seat index = row offset * width + letter"""
+
+    def __init__(self, name: str, first_row: int, last_row: int, letters: str):
+        self.name = name
+        self.first_row = first_row
+        self.last_row = last_row
+        self.letters = letters
+        self.size = (last_row - first_row + 1) * len(letters)
+        self.full = (1 << self.size) - 1
+
+    def index(self, seat: str) -> Optional[int]:
+        match = re.fullmatch(r'(\d{1,3})([A-Z])', seat.upper())
+        if not match:
+            return None
+        row, letter = int(match.group(1)), match.group(2)
+        if not self.first_row <= row <= self.last_row or letter not in self.letters:
+            return None
+        return (row - self.first_row) * len(self.letters) + self.letters.index(letter)
+
+    def seat(self, index: int) -> str:
+        row, col = divmod(index, len(self.letters))
+        return f"{self.first_row + row}{self.letters[col]}"
+
+
+class FlightSeats:
+    """Seat inventory for one flight: a sold and a held bitset per cabin.
+
+    Holds expire after their TTL and are swept lazily on every operation.
+    Only confirm/release change the number of sold seats, and only those
+    write seats_available back to the flight record.
+    """
+
+    def __init__(self, flight_id: str, aircraft: str, seats_available: int):
+        self.flight_id = flight_id
+        self.aircraft = aircraft
+        self.cabins = [Cabin(*layout) for layout in layout_for(aircraft)]
+        self.capacity = sum(cabin.size for cabin in self.cabins)
+        self.sold: Dict[str, int] = {cabin.name: 0 for cabin in self.cabins}
+        self.held: Dict[str, int] = {cabin.name: 0 for cabin in self.cabins}
+        self.holds: Dict[str, Tuple[str, int, float]] = {}
+        self.expiries: List[Tuple[float, str]] = []
+        self.version = 0
+        self.lock = threading.RLock()
+        self._seed(max(0, min(int(seats_available or 0), self.capacity)))
+
+    def _seed(self, seats_available: int):
+        """Mark capacity - seats_available seats as sold, reproducibly per flight"""
+        rng = random.Random(self.flight_id)
+        all_seats = [(cabin, i) for cabin in self.cabins for i in range(cabin.size)]
+        for cabin, i in rng.sample(all_seats, self.capacity - seats_available):
+            self.sold[cabin.name] |= 1 << i
+
+    @property
+    def available(self) -> int:
+        return self.capacity - sum(bits.bit_count() for bits in self.sold.values())
+
+    def locate(self, seat: str) -> Optional[Tuple[Cabin, int]]:
+        for cabin in self.cabins:
+            index = cabin.index(seat)
+            if index is not None:
+                return cabin, index
+        return None
+
+    def _expire(self, now: float):
+        while self.expiries and self.expiries[0][0] <= now:
+            expires, hold_id = heapq.heappop(self.expiries)
+            hold = self.holds.get(hold_id)
+            if hold and hold[2] == expires:
+                self._drop_hold(hold_id)
+
+    def _drop_hold(self, hold_id: str):
+        cabin_name, index, _ = self.holds.pop(hold_id)
+        self.held[cabin_name] &= ~(1 << index)
+        self.version += 1
+
+    def hold(self, seat: str, ttl: float) -> Tuple[int, Dict]:
+        located = self.locate(seat)
+        if located is None:
+            return 400, {"error": f"Seat {seat} does not exist on {self.aircraft}"}
+        cabin, index = located
+        bit = 1 << index
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            if (self.sold[cabin.name] | self.held[cabin.name]) & bit:
+                return 409, {"error": f"Seat {seat} is not available"}
+            hold_id = uuid.uuid4().hex
+            expires = now + ttl
+            self.held[cabin.name] |= bit
+            self.holds[hold_id] = (cabin.name, index, expires)
+            heapq.heappush(self.expiries, (expires, hold_id))
+            self.version += 1
+        return 201, {"hold_id": hold_id, "flight_id": self.flight_id, "seat": cabin.seat(index),
+                     "cabin": cabin.name, "expires_in": ttl}
+
+    def confirm(self, seat: Optional[str], hold_id: Optional[str]) -> Tuple[int, Dict]:
+        """Sell a held seat (by hold_id, which must match seat if both are
+        given) or a free seat directly (by seat)"""
+        with self.lock:
+            self._expire(time.monotonic())
+            if hold_id:
+                if hold_id not in self.holds:
+                    return 409, {"error": "Hold not found or expired"}
+                cabin_name, index, _ = self.holds[hold_id]
+                cabin = next(c for c in self.cabins if c.name == cabin_name)
+                if seat and self.locate(seat) != (cabin, index):
+                    return 409, {"error": f"Hold {hold_id} is for seat {cabin.seat(index)}, not {seat}"}
+                self._drop_hold(hold_id)
+            else:
+                located = self.locate(seat or '')
+                if located is None:
+                    return 400, {"error": f"Seat {seat} does not exist on {self.aircraft}"}
+                cabin, index = located
+                if (self.sold[cabin.name] | self.held[cabin.name]) & (1 << index):
+                    return 409, {"error": f"Seat {seat} is not available"}
+            self.sold[cabin.name] |= 1 << index
+            self.version += 1
+            return 200, {"flight_id": self.flight_id, "seat": cabin.seat(index), "cabin": cabin.name,
+                         "status": "confirmed", "seats_available": self.available}
+
+    def release(self, seat: Optional[str], hold_id: Optional[str]) -> Tuple[int, Dict]:
+        """Drop a hold, or return a sold seat to inventory"""
+        with self.lock:
+            self._expire(time.monotonic())
+            if hold_id:
+                if hold_id not in self.holds:
+                    return 404, {"error": "Hold not found or expired"}
+                self._drop_hold(hold_id)
+                return 200, {"flight_id": self.flight_id, "status": "released", "seats_available": self.available}
+            located = self.locate(seat or '')
+            if located is None:
+                return 400, {"error": f"Seat {seat} does not exist on {self.aircraft}"}
+            cabin, index = located
+            if not self.sold[cabin.name] & (1 << index):
+                return 409, {"error": f"Seat {seat} is not sold"}
+            self.sold[cabin.name] &= ~(1 << index)
+            self.version += 1
+            return 200, {"flight_id": self.flight_id, "seat": seat.upper(), "status": "released",
+                         "seats_available": self.available}
+
+    def seat_map(self) -> Dict:
+        """Row-major occupancy per cabin: '.' free, 'H' held, 'X' sold"""
+        with self.lock:
+            self._expire(time.monotonic())
+            sold, held = dict(self.sold), dict(self.held)
+        cabins = []
+        for cabin in self.cabins:
+            sold_bits = format(sold[cabin.name], f'0{cabin.size}b')[::-1]
+            held_bits = format(held[cabin.name], f'0{cabin.size}b')[::-1]
+            cabins.append({
+                "cabin": cabin.name,
+                "rows": [cabin.first_row, cabin.last_row],
+                "letters": cabin.letters,
+                "capacity": cabin.size,
+                "available": cabin.size - (sold[cabin.name] | held[cabin.name]).bit_count(),
+                "map": ''.join('X' if s == '1' else 'H' if h == '1' else '.' for s, h in zip(sold_bits, held_bits)),
+            })
+        return {"flight_id": self.flight_id, "aircraft": self.aircraft, "capacity": self.capacity,
+                "seats_available": self.available, "cabins": cabins}
+
+
+class SeatInventory:
+    """Per-flight seat inventories, created lazily from the flight records.
+
+    Seat bitsets and holds live in this process only, so the seat endpoints
+    are refused (503) when the service runs several worker processes:
+    each worker would sell from its own copy of the inventory.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.flights: Dict[str, FlightSeats] = {}
+        self.lock = threading.Lock()
+        store.subscribe(self._on_change)
+
+    def get(self, flight_id: str) -> Optional[FlightSeats]:
+        seats = self.flights.get(flight_id)
+        if seats is not None:
+            return seats
+        record = self.store.get_by_id(flight_id)
+        if record is None:
+            return None
+        with self.lock:
+            if flight_id not in self.flights:
+                self.flights[flight_id] = FlightSeats(flight_id, record.get('aircraft', ''),
+                                                      record.get('seats_available', 0))
+            return self.flights[flight_id]
+
+    def sync(self, seats: FlightSeats):
+        """Write the sold-seat count back to the flight record.
+
+        Callers hold seats.lock so concurrent syncs can't write a stale count.
+        """
+        self.store.update(seats.flight_id, {"seats_available": seats.available})
+
+    def _on_change(self, change: Dict):
+        # Drop inventories whose flight was deleted, re-equipped or had
+        # seats_available edited directly; they are rebuilt on next access
+        seats = self.flights.get(change.get("id"))
+        if seats is None:
+            return
+        record = change.get("record")
+        if (change["op"] == "delete" or record is None
+                or record.get('aircraft', '') != seats.aircraft
+                or record.get('seats_available') != seats.available):
+            self.flights.pop(change["id"], None)
+
+
+seat_inventory: Optional[SeatInventory] = None
+
 
 def setup_flights_routes():
     """Add flights-specific routes"""
+    global seat_inventory
+    if base_service.WORKERS > 1:
+        logger.warning("Seat inventory is per process; seat endpoints disabled with WORKERS=%d",
+                       base_service.WORKERS)
+    else:
+        seat_inventory = SeatInventory(base_service.store)
+        base_service.register_memory('flights.seat_inventory', seat_inventory)
+    # Seat bitsets are not replicated, so followers ask the leader
+    base_service.register_leader_routes('/flights/<flight_id>/seats')
+
     @app.route('/flights/search', methods=['GET'])
     def search_flights():
         """Search flights by origin, destination, date, status, etc."""
@@ -16,11 +292,15 @@ def setup_flights_routes():
 
         # Get query parameters
         filters = request.args.to_dict()
+        # `date` (YYYY-MM-DD) is the departure day, not a record field
+        if 'date' in filters:
+            filters['departure_time__prefix'] = filters.pop('date')
 
         # Search using the store's search method
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
 
     @app.route('/flights/internal-status', methods=['GET'])
     def internal_status():
@@ -33,6 +313,108 @@ def setup_flights_routes():
             "total_flights": len(base_service.store.data)
         }), 200
 
+    @app.route('/flights/<flight_id>/seats', methods=['GET'])
+    def get_seat_map(flight_id):
+        """Seat map for a flight, served from the seat bitsets"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if seat_inventory is None:
+            return jsonify({"error": "Seat inventory unavailable with multiple workers"}), 503
+        seats = seat_inventory.get(flight_id)
+        if seats is None:
+            return jsonify({"error": "Not found"}), 404
+        return conditional_jsonify(f"{base_service.store.epoch}-s{id(seats)}-{seats.version}", seats.seat_map)
+
+    @app.route('/flights/<flight_id>/seats/hold', methods=['POST'])
+    def hold_seat(flight_id):
+        """Hold a seat for SEAT_HOLD_TTL seconds (or a shorter ttl)"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if seat_inventory is None:
+            return jsonify({"error": "Seat inventory unavailable with multiple workers"}), 503
+        seats = seat_inventory.get(flight_id)
+        if seats is None:
+            return jsonify({"error": "Not found"}), 404
+        data = request.get_json(silent=True) or {}
+        if not data.get('seat'):
+            return jsonify({"error": "seat required"}), 400
+        try:
+            ttl = min(float(data.get('ttl', SEAT_HOLD_TTL)), SEAT_HOLD_TTL)
+        except (TypeError, ValueError):
+            return jsonify({"error": "ttl must be a number"}), 400
+        status, body = seats.hold(str(data['seat']), ttl)
+        return jsonify(body), status
+
+    @app.route('/flights/<flight_id>/seats/confirm', methods=['POST'])
+    def confirm_seat(flight_id):
+        """Confirm a held seat (hold_id) or sell a free seat directly (seat)"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if seat_inventory is None:
+            return jsonify({"error": "Seat inventory unavailable with multiple workers"}), 503
+        seats = seat_inventory.get(flight_id)
+        if seats is None:
+            return jsonify({"error": "Not found"}), 404
+        data = request.get_json(silent=True) or {}
+        if not data.get('hold_id') and not data.get('seat'):
+            return jsonify({"error": "hold_id or seat required"}), 400
+        with seats.lock:
+            status, body = seats.confirm(data.get('seat'), data.get('hold_id'))
+            if status == 200:
+                seat_inventory.sync(seats)
+        return jsonify(body), status
+
+    @app.route('/flights/<flight_id>/seats/release', methods=['POST'])
+    def release_seat(flight_id):
+        """Release a hold (hold_id) or return a sold seat (seat)"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if seat_inventory is None:
+            return jsonify({"error": "Seat inventory unavailable with multiple workers"}), 503
+        seats = seat_inventory.get(flight_id)
+        if seats is None:
+            return jsonify({"error": "Not found"}), 404
+        data = request.get_json(silent=True) or {}
+        if not data.get('hold_id') and not data.get('seat'):
+            return jsonify({"error": "hold_id or seat required"}), 400
+        with seats.lock:
+            status, body = seats.release(data.get('seat'), data.get('hold_id'))
+            if status == 200 and not data.get('hold_id'):
+                seat_inventory.sync(seats)
+        return jsonify(body), status
+
+    @app.route('/flights/<flight_id>/status-view', methods=['GET'])
+    def get_status_view(flight_id):
+        """Flight with its gate, crew and fares, fetched from those services in parallel.
+
+        Upstreams that fail or exceed STATUS_VIEW_TIMEOUT are reported under
+        "errors" and their section is null, so the view is always returned
+        within roughly one timeout.
+        """
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        flight = base_service.store.get_by_id(flight_id)
+        if flight is None:
+            return jsonify({"error": "Not found"}), 404
+
+        query = urllib.parse.urlencode({"flight_id": flight_id})
+        quoted = urllib.parse.quote(flight_id, safe='')
+        results = client.fan_out({
+            "gate": lambda: client.get_json(f"{GATES_SERVICE_URL}/gates/search?{query}", STATUS_VIEW_TIMEOUT),
+            "crew": lambda: client.get_json(f"{CREW_SERVICE_URL}/crew/search?{query}", STATUS_VIEW_TIMEOUT),
+            "pricing": lambda: client.get_json(f"{PRICING_SERVICE_URL}/pricing/{quoted}", STATUS_VIEW_TIMEOUT),
+        }, timeout=STATUS_VIEW_TIMEOUT)
+
+        view = {"flight": flight, "gate": None, "crew": None, "pricing": None, "errors": {}}
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                view["errors"][name] = str(result) or type(result).__name__
+            elif name == "gate":
+                view["gate"] = result[0] if result else None
+            else:
+                view[name] = result
+        return jsonify(view), 200
+
 if __name__ == '__main__':
     # Initialize the store
     init_store('/api/api.json', 'flight_id', 'Flights')
@@ -44,10 +426,8 @@ if __name__ == '__main__':
     create_rest_api('flights', versions=['v1', 'v2'])
 
     # Start the server
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info(f"Starting Flights service on port 3000")
-    logger.info(f"Endpoints: /flights, /flights/<id>, /flights/search")
+    logger.info(f"Endpoints: /flights, /flights/<id>, /flights/search, /flights/<id>/seats")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -2,20 +2,297 @@
 """Gates Service - In-memory stateful API for gate assignments"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 import base_service
+import heapq
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Gate occupancy around a turn when only one side of it is known, and the
+# default clearance between consecutive turns at a gate (minutes)
+DEPARTURE_LEAD = int(os.getenv('GATE_DEPARTURE_LEAD', '60'))
+ARRIVAL_DWELL = int(os.getenv('GATE_ARRIVAL_DWELL', '45'))
+GATE_BUFFER = int(os.getenv('GATE_BUFFER', '10'))
+
+# Gates in these states are never assigned
+UNUSABLE_GATE_STATES = ("maintenance", "out-of-service")
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def aircraft_class(aircraft: str) -> str:
+    """narrowbody or widebody, from the aircraft type"""
+    return "narrowbody" if re.match(r'A3(19|20|21)|A22|B73|B75|E1|CRJ', (aircraft or '').upper()) else "widebody"
+
+
+def turn_interval(flight: Dict) -> Optional[Tuple[float, float]]:
+    """Gate occupancy (epoch seconds) for a turn.
+
+    A turn with both times occupies the gate from arrival to departure; a
+    departure alone starts DEPARTURE_LEAD minutes early and an arrival alone
+    dwells ARRIVAL_DWELL minutes.
+    """
+    arrival = _parse_time(flight.get('arrival_time'))
+    departure = _parse_time(flight.get('departure_time'))
+    if arrival and departure and departure <= arrival:
+        # A flight record's own departure/arrival pair, not a turn at this
+        # airport: the gate is used for the departure
+        arrival = None
+    start = arrival or (departure - timedelta(minutes=DEPARTURE_LEAD) if departure else None)
+    end = departure or (arrival + timedelta(minutes=ARRIVAL_DWELL) if arrival else None)
+    if start is None or end is None:
+        return None
+    return start.timestamp(), end.timestamp()
+
+
+class GatePlanner:
+    """Conflict-free gate assignment by interval partitioning.
+
+    A full plan sweeps the turns in start order and keeps, per
+    (terminal, gate class) partition, a min-heap of gates keyed by the time
+    they free up, so each turn is placed in O(log gates). Narrowbody turns
+    fall back to widebody gates when their own class is full. Each gate
+    also keeps a sorted interval list, which lets a single flight's time
+    change be repaired in place: the turn is re-checked against its own
+    gate with a bisect, and only moved to another compatible gate if it
+    now overlaps.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffer = GATE_BUFFER * 60
+        self.gates: Dict[str, Dict] = {}
+        self.schedule: Dict[str, List[Tuple[float, float, str]]] = {}
+        self.flights: Dict[str, Dict] = {}
+        self.turns: Dict[str, Dict] = {}
+        self.unassigned: Dict[str, str] = {}
+        self.partitions: Dict[tuple, List[Tuple[float, str]]] = {}
+        self.version = 0
+
+    def _partitions(self, turn: Dict) -> List[tuple]:
+        """(terminal, gate class) partitions a turn may use, preferred first"""
+        classes = [turn["class"]] + (["widebody"] if turn["class"] != "widebody" else [])
+        terminals = sorted({key[0] for key in self.partitions if turn["terminal"] in (None, key[0])})
+        return [(t, c) for c in classes for t in terminals if (t, c) in self.partitions]
+
+    def _candidates(self, turn: Dict) -> List[str]:
+        """Compatible gates for a turn, same-class gates first"""
+        same, larger = [], []
+        for gate_id, gate in self.gates.items():
+            if turn["terminal"] and str(gate.get('terminal')) != turn["terminal"]:
+                continue
+            gate_class = gate.get('aircraft_class', 'widebody')
+            if gate_class == turn["class"]:
+                same.append(gate_id)
+            elif gate_class == "widebody":
+                larger.append(gate_id)
+        return same + larger
+
+    def _fits(self, gate_id: str, start: float, end: float) -> bool:
+        intervals = self.schedule[gate_id]
+        i = bisect_left(intervals, (start,))
+        if i > 0 and intervals[i - 1][1] + self.buffer > start:
+            return False
+        return i == len(intervals) or end + self.buffer <= intervals[i][0]
+
+    def _place(self, flight_id: str, gate_id: str):
+        turn = self.turns[flight_id]
+        turn["gate_id"] = gate_id
+        insort(self.schedule[gate_id], (turn["start"], turn["end"], flight_id))
+        self.unassigned.pop(flight_id, None)
+
+    def _remove(self, flight_id: str):
+        turn = self.turns[flight_id]
+        gate_id = turn.pop("gate_id", None)
+        if gate_id is not None:
+            self.schedule[gate_id].remove((turn["start"], turn["end"], flight_id))
+
+    @staticmethod
+    def _turn(flight: Dict) -> Optional[Dict]:
+        interval = turn_interval(flight)
+        if interval is None:
+            return None
+        return {
+            "flight_id": flight['flight_id'],
+            "terminal": str(flight['terminal']) if flight.get('terminal') else None,
+            "class": aircraft_class(flight.get('aircraft', '')),
+            "start": interval[0],
+            "end": interval[1],
+        }
+
+    def plan(self, gates: List[Dict], flights: List[Dict], buffer_minutes: int) -> Dict:
+        """Compute a full assignment for the given flights"""
+        with self.lock:
+            self.buffer = buffer_minutes * 60
+            self.gates = {g['gate_id']: g for g in gates if g.get('status') not in UNUSABLE_GATE_STATES}
+            self.schedule = {gate_id: [] for gate_id in self.gates}
+            self.turns, self.unassigned = {}, {}
+            self.flights = {f['flight_id']: dict(f) for f in flights if isinstance(f, dict) and f.get('flight_id')}
+            for flight in flights:
+                if not isinstance(flight, dict):
+                    continue
+                turn = self._turn(flight) if flight.get('flight_id') else None
+                if turn is None:
+                    self.unassigned[str(flight.get('flight_id'))] = "missing flight_id or times"
+                    continue
+                self.turns[turn["flight_id"]] = turn
+
+            # Disjoint gate partitions, each a heap of (free_at, gate_id)
+            self.partitions = {}
+            for gate_id, gate in self.gates.items():
+                key = (str(gate.get('terminal')), gate.get('aircraft_class', 'widebody'))
+                self.partitions.setdefault(key, []).append((float('-inf'), gate_id))
+
+            for turn in sorted(self.turns.values(), key=lambda t: t["start"]):
+                partitions = self._partitions(turn)
+                if not partitions:
+                    self.unassigned[turn["flight_id"]] = "no compatible gate"
+                    continue
+                heap = next((self.partitions[key] for key in partitions
+                             if self.partitions[key][0][0] + self.buffer <= turn["start"]), None)
+                if heap is None:
+                    self.unassigned[turn["flight_id"]] = "all compatible gates occupied"
+                    continue
+                gate_id = heap[0][1]
+                heapq.heapreplace(heap, (turn["end"], gate_id))
+                self._place(turn["flight_id"], gate_id)
+            self.version += 1
+            return self._result()
+
+    def reschedule(self, flight: Dict) -> Optional[Dict]:
+        """Apply one flight's new times without recomputing the whole plan"""
+        with self.lock:
+            flight_id = flight['flight_id']
+            if flight_id not in self.flights:
+                return None
+            previous = self.turns.get(flight_id, {}).get("gate_id")
+            if flight_id in self.turns:
+                self._remove(flight_id)
+                del self.turns[flight_id]
+            merged = self.flights[flight_id] = {**self.flights[flight_id], **flight}
+            turn = self._turn(merged)
+            if turn is None:
+                self.unassigned[flight_id] = "missing flight_id or times"
+                self.version += 1
+                return {"flight_id": flight_id, "gate_id": None, "moved": previous is not None}
+            self.turns[flight_id] = turn
+
+            candidates = self._candidates(turn)
+            if previous in candidates:
+                candidates.remove(previous)
+                candidates.insert(0, previous)
+            gate_id = next((g for g in candidates if self._fits(g, turn["start"], turn["end"])), None)
+            if gate_id is None:
+                self.unassigned[flight_id] = "all compatible gates occupied"
+            else:
+                self._place(flight_id, gate_id)
+            self.version += 1
+            return {**self._assignment(turn), "moved": gate_id != previous, "previous_gate_id": previous}
+
+    @staticmethod
+    def _iso(ts: float) -> str:
+        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def _assignment(self, turn: Dict) -> Dict:
+        gate_id = turn.get("gate_id")
+        return {
+            "flight_id": turn["flight_id"],
+            "gate_id": gate_id,
+            "terminal": self.gates[gate_id].get('terminal') if gate_id else turn["terminal"],
+            "start": self._iso(turn["start"]),
+            "end": self._iso(turn["end"]),
+        }
+
+    def _result(self) -> Dict:
+        return {
+            "assignments": [self._assignment(t) for t in self.turns.values() if t.get("gate_id")],
+            "unassigned": [{"flight_id": f, "reason": r} for f, r in self.unassigned.items()],
+            "gates_used": sum(1 for intervals in self.schedule.values() if intervals),
+            "buffer_minutes": self.buffer // 60,
+        }
+
+    def result(self) -> Dict:
+        with self.lock:
+            return self._result()
+
+
+gate_planner: Optional[GatePlanner] = None
 
 
 def setup_gates_routes():
     """Add gates-specific routes"""
+    global gate_planner
+    if base_service.WORKERS > 1:
+        logger.warning("Gate plan is per process; gate assignment endpoints disabled with WORKERS=%d",
+                       base_service.WORKERS)
+    else:
+        gate_planner = GatePlanner()
+    # The gate plan is not replicated, so followers ask the leader
+    base_service.register_leader_routes('/gates/assign')
     @app.route('/gates/search', methods=['GET'])
     def search_gates():
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
+
+    @app.route('/gates/assign', methods=['POST'])
+    def assign_gates():
+        """Compute a conflict-free gate assignment for a window of flights.
+
+        Body: {"flights": [{flight_id, arrival_time, departure_time,
+        aircraft, terminal}, ...], "buffer_minutes": 10}
+        """
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        if gate_planner is None:
+            return jsonify({"error": "Gate plan unavailable with multiple workers"}), 503
+        data = request.get_json(silent=True) or {}
+        flights = data.get('flights')
+        if not isinstance(flights, list) or not flights:
+            return jsonify({"error": "flights required"}), 400
+        try:
+            buffer_minutes = int(data.get('buffer_minutes', GATE_BUFFER))
+        except (TypeError, ValueError):
+            return jsonify({"error": "buffer_minutes must be an integer"}), 400
+        gates = list(base_service.store.data.values())
+        return jsonify(gate_planner.plan(gates, flights, buffer_minutes)), 200
+
+    @app.route('/gates/assign', methods=['GET'])
+    def get_gate_assignment():
+        """Return the current gate plan"""
+        if gate_planner is None:
+            return jsonify({"error": "Gate plan unavailable with multiple workers"}), 503
+        return conditional_jsonify(f"{base_service.store.epoch}-g{gate_planner.version}", gate_planner.result)
+
+    @app.route('/gates/assign/<flight_id>', methods=['PATCH'])
+    def reschedule_flight(flight_id):
+        """Re-slot one flight after a time change, keeping its gate if possible"""
+        if gate_planner is None:
+            return jsonify({"error": "Gate plan unavailable with multiple workers"}), 503
+        data = request.get_json(silent=True) or {}
+        result = gate_planner.reschedule({**data, "flight_id": flight_id})
+        if result is None:
+            return jsonify({"error": "Flight not in current plan"}), 404
+        return jsonify(result), 200
 
 
 if __name__ == '__main__':
@@ -23,9 +300,7 @@ if __name__ == '__main__':
     setup_gates_routes()
     create_rest_api('gates')
 
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info("Starting Gates service on port 3000")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Multi-service host - several airline services in one process
+
+Mounts the stores and service-specific routes of the services named in
+HOSTED_SERVICES (comma-separated, or "all") side by side on one Flask app,
+so a small environment can run the whole airline from a single process
+instead of one pod per service. Each service gets its own store, loaded
+from HOST_DATA_DIR/<service>.json, and serves its OpenAPI specs from
+HOST_SPEC_DIR/<service>/. Calls between hosted services go over loopback
+unless their *_SERVICE_URL is set explicitly.
+
+Usage:
+  HOSTED_SERVICES=flights,gates,crew HOST_DATA_DIR=../files/data python host_service.py
+"""
+import sys
+sys.path.append('/app')
+import base_service
+from base_service import app, init_store, create_rest_api, serve, StoreRouter
+import importlib
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Service name (module <name>_service.py and resource path) ->
+# (id field, resource name, API versions), as in each service's __main__
+SERVICES = {
+    "ancillaries": ("ancillary_id", "Ancillaries", None),
+    "baggage": ("bag_tag", "Baggage", ["v1", "v2"]),
+    "bookings": ("booking_id", "Bookings", ["v1", "v2"]),
+    "checkin": ("booking_id", "Checkin", ["v1", "v2"]),
+    "crew": ("crew_id", "Crew", None),
+    "flights": ("flight_id", "Flights", ["v1", "v2"]),
+    "gates": ("gate_id", "Gates", None),
+    "itineraries": ("booking_id", "Itineraries", None),
+    "loyalty": ("member_id", "Loyalty", None),
+    "notifications": ("notification_id", "Notifications", None),
+    "passengers": ("passenger_id", "Passengers", ["v1", "v2"]),
+    "pricing": ("flight_id", "Pricing", ["v1", "v2"]),
+    "tickets": ("ticket_id", "Tickets", None),
+}
+
+# Services whose REST resource is a derived, read-only view
+READ_ONLY_SERVICES = {"itineraries"}
+
+HOSTED_SERVICES = os.getenv('HOSTED_SERVICES', 'all')
+HOST_DATA_DIR = os.getenv('HOST_DATA_DIR', '/api')
+HOST_SPEC_DIR = os.getenv('HOST_SPEC_DIR', '/public')
+PORT = int(os.getenv('PORT', '3000'))
+
+
+def hosted_names(selection: str):
+    if selection.strip().lower() == 'all':
+        return list(SERVICES)
+    names = [name.strip().lower() for name in selection.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SERVICES]
+    if unknown or not names:
+        raise SystemExit(f"HOSTED_SERVICES: unknown {unknown or selection!r}; choose from {', '.join(SERVICES)}")
+    return names
+
+
+def loopback(urls: str, names) -> str:
+    """Point http://<name>-app:3000 URLs of hosted services at this process"""
+    return re.sub(r'http://([a-z]+)-app:3000',
+                  lambda m: f'http://127.0.0.1:{PORT}' if m.group(1) in names else m.group(0), urls)
+
+
+def host(names) -> StoreRouter:
+    """Register every named service and return the router over their stores"""
+    for name in names:
+        os.environ.setdefault(f'{name.upper()}_SERVICE_URL', f'http://127.0.0.1:{PORT}')
+
+    router = StoreRouter()
+    for name in names:
+        started = time.perf_counter()
+        module = importlib.import_module(f'{name}_service')
+        if name == 'itineraries' and 'ITINERARY_SOURCES' not in os.environ:
+            module.ITINERARY_SOURCES = loopback(module.ITINERARY_SOURCES, names)
+
+        id_field, resource_name, versions = SERVICES[name]
+        before = set(app.view_functions)
+        init_store(os.path.join(HOST_DATA_DIR, f'{name}.json'), id_field, resource_name)
+        base_service.SPEC_DIR = os.path.join(HOST_SPEC_DIR, name)
+        getattr(module, f'setup_{name}_routes')()
+        create_rest_api(name, versions=versions, read_only=name in READ_ONLY_SERVICES)
+        router.mount(name, base_service.store, set(app.view_functions) - before)
+        logger.info("Hosted %s: %d records in %.0f ms", resource_name, len(base_service.store.data),
+                    (time.perf_counter() - started) * 1000)
+
+    base_service.store = router
+    return router
+
+
+if __name__ == '__main__':
+    names = hosted_names(HOSTED_SERVICES)
+    host(names)
+    logger.info("Starting %d services on port %s: %s", len(names), PORT, ', '.join(names))
+    serve(port=PORT)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Itineraries Service - Denormalized read model of a passenger's trip
+
+Joins bookings, tickets, check-in, baggage and loyalty into one record per
+booking. The view is fed from each upstream service's change feed
+(/<resource>/changes) or from a local NDJSON replay file, and kept up to
+date incrementally so /itineraries/<booking_id> is a single lookup.
+"""
+import sys
+sys.path.append('/app')
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
+from flask import jsonify
+from service_client import ServiceError, client
+from typing import Dict, Optional
+import base_service
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Upstream services as source=url pairs, and an optional replay file that
+# replaces them (one {"source", "op", "id", "record"} object per line)
+ITINERARY_SOURCES = os.getenv(
+    'ITINERARY_SOURCES',
+    'bookings=http://bookings-app:3000,tickets=http://tickets-app:3000,'
+    'checkin=http://checkin-app:3000,baggage=http://baggage-app:3000,'
+    'loyalty=http://loyalty-app:3000',
+)
+ITINERARY_REPLAY_FILE = os.getenv('ITINERARY_REPLAY_FILE', '')
+CHANGES_WAIT = float(os.getenv('ITINERARY_CHANGES_WAIT', '25'))
+
+# Record key used by each source
+SOURCE_KEYS = {
+    "bookings": "booking_id",
+    "tickets": "ticket_id",
+    "checkin": "booking_id",
+    "baggage": "bag_tag",
+    "loyalty": "member_id",
+}
+
+
+class ItineraryView:
+    """Incrementally maintained itineraries keyed by booking and passenger.
+
+    Itineraries live in the service's InMemoryStore so they get ETags and a
+    change feed like any other resource. Reverse maps remember which
+    itinerary each upstream record contributed to, so updates and deletes
+    touch only the affected itinerary.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.RLock()
+        self.by_passenger: Dict[str, set] = {}
+        self.loyalty: Dict[str, Dict] = {}
+        self.contributions: Dict[tuple, str] = {}
+
+    def _itinerary(self, booking_id: str) -> Dict:
+        itinerary = self.store.data.get(booking_id)
+        if itinerary is None:
+            itinerary = {
+                "booking_id": booking_id,
+                "passenger_id": None,
+                "booking": None,
+                "tickets": {},
+                "checkin": None,
+                "baggage": {},
+                "loyalty": None,
+            }
+        return itinerary
+
+    def _save(self, itinerary: Dict):
+        booking_id = itinerary["booking_id"]
+        with self.store.lock:
+            self.store.data[booking_id] = itinerary
+            self.store.touch(booking_id, "update", itinerary)
+
+    def _set_passenger(self, itinerary: Dict, passenger_id: Optional[str]):
+        old = itinerary.get("passenger_id")
+        if old == passenger_id or not passenger_id:
+            return
+        if old:
+            self.by_passenger.get(old, set()).discard(itinerary["booking_id"])
+        self.by_passenger.setdefault(passenger_id, set()).add(itinerary["booking_id"])
+        itinerary["passenger_id"] = passenger_id
+        itinerary["loyalty"] = self.loyalty.get(passenger_id)
+
+    def apply(self, source: str, op: str, record_id: Optional[str], record: Optional[Dict]):
+        """Fold one upstream change into the view"""
+        if source not in SOURCE_KEYS:
+            return
+        with self.lock:
+            if source == "loyalty":
+                self._apply_loyalty(op, record_id, record)
+                return
+
+            key = (source, record_id)
+            previous = self.contributions.get(key)
+            booking_id = (record or {}).get('booking_id') or previous
+            if op == "delete" or record is None:
+                booking_id = previous
+            if not booking_id:
+                return
+
+            # Record moved to another booking: drop it from the old one
+            if previous and previous != booking_id:
+                self._detach(source, record_id, previous)
+
+            itinerary = dict(self._itinerary(booking_id))
+            if op == "delete" or record is None:
+                self._detach(source, record_id, booking_id)
+                return
+            if source == "bookings":
+                itinerary["booking"] = record
+                self._set_passenger(itinerary, record.get('passenger_id'))
+            elif source == "checkin":
+                itinerary["checkin"] = record
+                self._set_passenger(itinerary, record.get('passenger_id'))
+            elif source == "tickets":
+                itinerary["tickets"] = {**itinerary["tickets"], record_id: record}
+                self._set_passenger(itinerary, record.get('passenger_id'))
+            elif source == "baggage":
+                itinerary["baggage"] = {**itinerary["baggage"], record_id: record}
+            self.contributions[key] = booking_id
+            self._save(itinerary)
+
+    def _detach(self, source: str, record_id: str, booking_id: str):
+        self.contributions.pop((source, record_id), None)
+        itinerary = self.store.data.get(booking_id)
+        if itinerary is None:
+            return
+        itinerary = dict(itinerary)
+        if source in ("bookings", "checkin"):
+            itinerary["booking" if source == "bookings" else "checkin"] = None
+        else:
+            field = "tickets" if source == "tickets" else "baggage"
+            itinerary[field] = {k: v for k, v in itinerary[field].items() if k != record_id}
+        self._save(itinerary)
+
+    def _apply_loyalty(self, op: str, member_id: Optional[str], record: Optional[Dict]):
+        previous = self.contributions.pop(("loyalty", member_id), None)
+        passenger_id = None if op == "delete" or record is None else record.get('passenger_id')
+        if previous and previous != passenger_id:
+            self.loyalty.pop(previous, None)
+        if passenger_id:
+            self.loyalty[passenger_id] = record
+            self.contributions[("loyalty", member_id)] = passenger_id
+        for pid in {previous, passenger_id} - {None}:
+            for booking_id in self.by_passenger.get(pid, ()):
+                itinerary = dict(self._itinerary(booking_id))
+                itinerary["loyalty"] = self.loyalty.get(pid)
+                self._save(itinerary)
+
+    def reset_source(self, source: str, records: Dict[str, Dict]):
+        """Replace everything a source contributed with a full snapshot"""
+        with self.lock:
+            stale = [rid for (src, rid) in list(self.contributions) if src == source and rid not in records]
+            for record_id in stale:
+                self.apply(source, "delete", record_id, None)
+            for record_id, record in records.items():
+                self.apply(source, "update", record_id, record)
+
+    def for_passenger(self, passenger_id: str):
+        with self.lock:
+            booking_ids = sorted(self.by_passenger.get(passenger_id, ()))
+        return [self.store.data[b] for b in booking_ids if b in self.store.data]
+
+
+class ChangeFeedFollower(threading.Thread):
+    """Long-polls one upstream /<resource>/changes feed into the view.
+
+    Starts from a full snapshot and resnapshots whenever the upstream
+    signals resync (its change log no longer covers our position, or it
+    restarted under a new epoch).
+    """
+
+    def __init__(self, view: ItineraryView, source: str, base_url: str):
+        super().__init__(name=f"itinerary-{source}", daemon=True)
+        self.view = view
+        self.source = source
+        self.base_url = base_url.rstrip('/')
+        self.seq: Optional[int] = None
+        self.epoch: Optional[str] = None
+        self.applied = 0
+        self.last_error: Optional[str] = None
+
+    def _get(self, path: str, timeout: float):
+        # Feed positions change constantly, so bypass the client's GET cache
+        url = f"{self.base_url}/{self.source}{path}"
+        response = client.request('GET', url, timeout=timeout)
+        if not response.ok:
+            raise ServiceError(url, response)
+        return response.json()
+
+    def _snapshot(self):
+        # Take the position first so nothing between it and the list is lost;
+        # replaying a change the snapshot already has is harmless
+        position = self._get('/changes', 10)
+        seq = position["seq"]
+        records = self._get('', 30)
+        key = SOURCE_KEYS[self.source]
+        self.view.reset_source(self.source, {r.get(key): r for r in records if r.get(key)})
+        self.seq, self.epoch = seq, position.get("epoch")
+        logger.info("Itinerary source %s snapshot: %d records at seq %d", self.source, len(records), seq)
+
+    def run(self):
+        backoff = 1.0
+        while True:
+            try:
+                if self.seq is None:
+                    self._snapshot()
+                query = urllib.parse.urlencode({"since": self.seq, "epoch": self.epoch or '', "wait": CHANGES_WAIT})
+                feed = self._get(f'/changes?{query}', CHANGES_WAIT + 10)
+                if feed.get("resync"):
+                    self.seq = None
+                    continue
+                for change in feed["changes"]:
+                    # Side collections other than the one mirroring the
+                    # source's records (e.g. baggage's bags by tag) are skipped
+                    if change.get("collection", self.source) != self.source:
+                        continue
+                    self.view.apply(self.source, change["op"], change["id"], change.get("record"))
+                    self.applied += 1
+                self.seq = feed["seq"]
+                self.last_error = None
+                backoff = 1.0
+            except (ServiceError, OSError, ValueError, KeyError) as e:
+                self.last_error = str(e)
+                logger.warning("Itinerary source %s unavailable: %s", self.source, e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def status(self) -> Dict:
+        return {"source": self.source, "url": self.base_url, "seq": self.seq,
+                "applied": self.applied, "last_error": self.last_error}
+
+
+def replay(view: ItineraryView, path: str) -> int:
+    """Apply changes from an NDJSON replay file"""
+    count = 0
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            view.apply(change["source"], change.get("op", "update"), change.get("id"), change.get("record"))
+            count += 1
+    logger.info("Replayed %d itinerary changes from %s", count, path)
+    return count
+
+
+itinerary_view: Optional[ItineraryView] = None
+followers = []
+
+
+def setup_itineraries_routes():
+    """Add itineraries-specific routes and start feeding the view"""
+    global itinerary_view
+    itinerary_view = ItineraryView(base_service.store)
+    base_service.register_memory('itineraries.view', itinerary_view)
+
+    if ITINERARY_REPLAY_FILE:
+        replay(itinerary_view, ITINERARY_REPLAY_FILE)
+    else:
+        for pair in filter(None, ITINERARY_SOURCES.split(',')):
+            source, url = pair.split('=', 1)
+            follower = ChangeFeedFollower(itinerary_view, source.strip(), url.strip())
+            followers.append(follower)
+            follower.start()
+
+    @app.route('/itineraries/passenger/<passenger_id>', methods=['GET'])
+    def get_passenger_itineraries(passenger_id):
+        """All itineraries for a passenger"""
+        if not base_service.store:
+            return jsonify({"error": "Service not initialized"}), 500
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: itinerary_view.for_passenger(passenger_id),
+        )
+
+    @app.route('/itineraries/sources', methods=['GET'])
+    def get_sources():
+        """Upstream change feed positions and errors"""
+        return jsonify([follower.status() for follower in followers]), 200
+
+
+if __name__ == '__main__':
+    init_store(os.getenv('DATA_FILE', '/api/api.json'), 'booking_id', 'Itineraries')
+    setup_itineraries_routes()
+    # The view is derived from the upstream feeds, so it takes no writes
+    create_rest_api('itineraries', read_only=True)
+
+    logger.info("Starting Itineraries service on port 3000")
+    logger.info("Endpoints: /itineraries/<booking_id>, /itineraries/passenger/<passenger_id>")
+
+    serve(port=3000)
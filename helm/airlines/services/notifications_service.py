@@ -2,7 +2,7 @@
 """Notifications Service - In-memory stateful API with notification templates"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
 import base_service
 
@@ -15,9 +15,10 @@ def setup_notifications_routes():
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
 
     @app.route('/notifications/send', methods=['POST'])
     def send_notification():
@@ -46,9 +47,13 @@ def setup_notifications_routes():
             "bag_tag": bag_tag,
         }
 
-        history = raw.setdefault('history', {})
-        history.setdefault(recipient or 'unknown', []).append(result)
-        base_service.store.raw_data = raw
+        store = base_service.store
+        history = store.collection('history')
+        recipient_id = recipient or 'unknown'
+        with store.lock:
+            entries = list(history.get(recipient_id, [])) + [result]
+            history[recipient_id] = entries
+            store.touch(recipient_id, "update", entries, collection='history')
 
         return jsonify(result), 201
 
@@ -57,10 +62,11 @@ def setup_notifications_routes():
         """Get notification history for a recipient"""
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
-        raw = base_service.store.raw_data or {}
-        history = raw.get('history', {})
-        items = history.get(recipient_id, [])
-        return jsonify(items), 200
+        history = base_service.store.collection('history')
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: history.get(recipient_id, []),
+        )
 
 if __name__ == '__main__':
     # Initialize the store
@@ -79,4 +85,4 @@ if __name__ == '__main__':
     logger.info(f"Endpoints: /notifications, /notifications/send, /notifications/history/<recipient_id>")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -2,22 +2,345 @@
 """Passengers Service - In-memory stateful API with search"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
 import base_service
+import gc
+import heapq
+import os
+import re
+import threading
+import unicodedata
+
+# Default and largest number of ranked results for ?q= searches, and how
+# many typos a search term may contain
+PASSENGER_SEARCH_LIMIT = int(os.getenv('PASSENGER_SEARCH_LIMIT', '10'))
+PASSENGER_SEARCH_MAX_LIMIT = int(os.getenv('PASSENGER_SEARCH_MAX_LIMIT', '100'))
+PASSENGER_SEARCH_MAX_EDITS = int(os.getenv('PASSENGER_SEARCH_MAX_EDITS', '1'))
+
+# Indexed fields and their ranking weight. Tokens from fields weighted at
+# least FUZZY_MIN_WEIGHT (the names) are also matched with typos; email and
+# document tokens are mostly unique, so they only match exactly or by prefix.
+FIELD_WEIGHTS = {
+    "last_name": 4,
+    "first_name": 3,
+    "email": 2,
+    "passport_number": 1,
+    "frequent_flyer_number": 1,
+}
+DOCUMENT_FIELDS = ("passport_number", "frequent_flyer_number")
+FUZZY_MIN_WEIGHT = 3
+FUZZY_MIN_LENGTH = 4
+# Document number parts shorter than this (country codes, "FF") aren't indexed
+DOCUMENT_MIN_PART = 4
+
+# Match quality of a search term against a token
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+# Letters NFKD doesn't decompose into a base letter plus accents
+_FOLD = str.maketrans({"ø": "o", "ł": "l", "đ": "d", "ð": "d", "æ": "ae", "œ": "oe", "ı": "i", "þ": "th"})
+_WORD = re.compile(r'[^\W_]+')
+
+
+@lru_cache(maxsize=65536)
+def fold(text: str) -> str:
+    """Case- and accent-insensitive form of text ("Müller" -> "muller")"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).translate(_FOLD)
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(fold(text))
+
+
+def record_tokens(record: Dict) -> Dict[str, int]:
+    """Searchable tokens of a passenger and the best field weight of each"""
+    tokens: Dict[str, int] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = record.get(field)
+        if not isinstance(value, str) or not value:
+            continue
+        if field == "email":
+            value = value.split('@', 1)[0]
+        words = tokenize(value)
+        if field in DOCUMENT_FIELDS:
+            # "US-8821947" is found as "us8821947", "US8821" or "8821947"
+            words = [''.join(words)] + [w for w in words if len(w) >= DOCUMENT_MIN_PART]
+        for token in words:
+            if token and tokens.get(token, 0) < weight:
+                tokens[token] = weight
+    return tokens
+
+
+def _deletes(token: str, edits: int) -> set:
+    """token with up to `edits` characters removed (including token itself)"""
+    variants = frontier = {token}
+    for _ in range(edits):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        variants = variants | frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+class PassengerIndex:
+    """Type-ahead index over passenger names, emails and document numbers.
+
+    Tokens are accent-folded and lower-cased. The vocabulary is kept sorted,
+    so a prefix is a bisect to a contiguous range of tokens, and each token
+    has a compact posting array of (doc << 3 | field weight). Name tokens
+    also go into a symmetric-delete map (every token with up to
+    PASSENGER_SEARCH_MAX_EDITS characters dropped), which finds candidates
+    within that many typos with a few dict lookups before an exact
+    edit-distance check.
+
+    A query is driven by its most selective term: exact token matches first,
+    then prefix completions in vocabulary order, then typo matches, checking
+    the other terms against each passenger's own tokens and stopping once
+    `limit` passengers are found. The index follows the store's change
+    notifications, so CRUD and bulk writes update it in place.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.docs: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.doc_tokens: List[Optional[Dict[str, int]]] = []
+        self.postings: Dict[str, array] = {}
+        self.vocab: List[str] = []
+        # token -> postings from fuzzy-matchable fields, and delete variant -> tokens
+        self.fuzzy_refs: Dict[str, int] = {}
+        self.variants: Dict[str, set] = {}
+        # The bulk build allocates millions of small objects and no cycles,
+        # so pause the cyclic collector instead of letting it rescan them
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with self.lock:
+                for passenger_id, record in list(store.data.items()):
+                    self._add(passenger_id, record, bulk=True)
+                self.vocab = sorted(self.postings)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        store.subscribe(self._on_change)
+
+    def _on_change(self, change: Dict):
+        passenger_id = change.get("id")
+        if passenger_id is None:
+            return
+        record = change.get("record") if change["op"] != "delete" else None
+        with self.lock:
+            doc = self.docs.get(passenger_id)
+            if doc is not None and isinstance(record, dict) and record_tokens(record) == self.doc_tokens[doc]:
+                return
+            self._remove(passenger_id)
+            if record is not None:
+                self._add(passenger_id, record, doc=doc)
+
+    def _add(self, passenger_id: str, record: Dict, bulk: bool = False, doc: Optional[int] = None):
+        if not isinstance(record, dict):
+            return
+        tokens = record_tokens(record)
+        if doc is None:
+            doc = len(self.ids)
+            self.ids.append(None)
+            self.doc_tokens.append(None)
+        self.docs[passenger_id] = doc
+        self.ids[doc] = passenger_id
+        self.doc_tokens[doc] = tokens
+        for token, weight in tokens.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array('q')
+                if not bulk:
+                    insort(self.vocab, token)
+            postings.append(doc << 3 | weight)
+            if weight >= FUZZY_MIN_WEIGHT and len(token) >= FUZZY_MIN_LENGTH:
+                refs = self.fuzzy_refs.get(token, 0)
+                self.fuzzy_refs[token] = refs + 1
+                if not refs:
+                    for variant in _deletes(token, PASSENGER_SEARCH_MAX_EDITS):
+                        self.variants.setdefault(variant, set()).add(token)
+
+    def _remove(self, passenger_id: str):
+        doc = self.docs.pop(passenger_id, None)
+        if doc is None:
+            return
+        tokens = self.doc_tokens[doc]
+        self.ids[doc] = self.doc_tokens[doc] = None
+        for token, weight in tokens.items():
+            postings = self.postings[token]
+            postings.remove(doc << 3 | weight)
+            if not postings:
+                del self.postings[token]
+                del self.vocab[bisect_left(self.vocab, token)]
+            if weight >= FUZZY_MIN_WEIGHT and len(token) >= FUZZY_MIN_LENGTH:
+                refs = self.fuzzy_refs[token] - 1
+                if refs:
+                    self.fuzzy_refs[token] = refs
+                    continue
+                del self.fuzzy_refs[token]
+                for variant in _deletes(token, PASSENGER_SEARCH_MAX_EDITS):
+                    tokens_for_variant = self.variants.get(variant)
+                    if tokens_for_variant is not None:
+                        tokens_for_variant.discard(token)
+                        if not tokens_for_variant:
+                            del self.variants[variant]
+
+    def _near(self, term: str) -> Dict[str, int]:
+        """Vocabulary tokens within the typo budget of term -> distance"""
+        edits = PASSENGER_SEARCH_MAX_EDITS if len(term) >= FUZZY_MIN_LENGTH else 0
+        if not edits:
+            return {}
+        near = {}
+        for variant in _deletes(term, edits):
+            for token in self.variants.get(variant, ()):
+                if token not in near:
+                    distance = edit_distance(term, token, edits)
+                    if 0 < distance <= edits:
+                        near[token] = distance
+        return near
+
+    def _stream(self, term: str, lo: int, hi: int, near: Dict[str, int]):
+        """(token, quality) for a term, best matches first"""
+        if term in self.postings:
+            yield term, EXACT
+        for i in range(lo, hi):
+            if self.vocab[i] != term:
+                yield self.vocab[i], PREFIX
+        for token in sorted(near, key=lambda t: (near[t], t)):
+            yield token, FUZZY
+
+    def search(self, query: str, limit: int, fuzzy: str = "auto",
+               accept: Optional[Callable[[List[Dict]], List[Dict]]] = None) -> List[Dict]:
+        """Top `limit` passengers matching every term of query.
+
+        fuzzy is "auto" (typo matches only for terms with no exact or prefix
+        match), "true" or "false". accept filters candidate records, e.g.
+        with the compiled filters from the rest of the query string.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        data = self.store.data
+        with self.lock:
+            matchers = []
+            for term in terms:
+                lo = bisect_left(self.vocab, term)
+                hi = bisect_left(self.vocab, term + '\U0010ffff', lo)
+                near = self._near(term) if fuzzy == "true" or (fuzzy == "auto" and lo == hi) else {}
+                if lo == hi and not near:
+                    return []
+                matchers.append((term, lo, hi, near))
+
+            # Drive with the term matching the fewest tokens; check the rest per passenger
+            driver = min(matchers, key=lambda m: m[2] - m[1] + len(m[3]))
+            others = [m for m in matchers if m is not driver]
+            # Best score the other terms can add, to stop once no token left
+            # in the driver's stream can reach the current top `limit`
+            others_best = len(others) * (EXACT * 8 + 7)
+            seen = set()
+            top = []  # min-heap of (score, -found, record); earlier finds win ties
+            for token, quality in self._stream(*driver):
+                if len(top) >= limit and quality * 8 + 7 + others_best <= top[0][0]:
+                    break
+                for code in self.postings.get(token, ()):
+                    doc = code >> 3
+                    if doc in seen:
+                        continue
+                    seen.add(doc)
+                    score = quality * 8 + (code & 7)
+                    tokens = self.doc_tokens[doc]
+                    for term, _, _, near in others:
+                        best = 0
+                        for candidate, weight in tokens.items():
+                            if candidate == term:
+                                match = EXACT
+                            elif candidate.startswith(term):
+                                match = PREFIX
+                            elif candidate in near:
+                                match = FUZZY
+                            else:
+                                continue
+                            best = max(best, match * 8 + weight)
+                        if not best:
+                            break
+                        score += best
+                    else:
+                        if len(top) >= limit and score <= top[0][0]:
+                            continue
+                        record = data.get(self.ids[doc])
+                        if record is not None and (accept is None or accept([record])):
+                            entry = (score, -len(seen), record)
+                            if len(top) < limit:
+                                heapq.heappush(top, entry)
+                            else:
+                                heapq.heappushpop(top, entry)
+        return [record for _, _, record in sorted(top, key=lambda e: e[:2], reverse=True)]
+
+passenger_index: Optional[PassengerIndex] = None
+
 
 def setup_passengers_routes():
     """Add passengers-specific routes"""
+    global passenger_index
+    passenger_index = PassengerIndex(base_service.store)
+    base_service.register_memory('passengers.search_index', passenger_index)
+
     @app.route('/passengers/search', methods=['GET'])
     def search_passengers():
-        """Search passengers by name, email, nationality, etc."""
+        """Search passengers by name, email, nationality, etc.
+
+        ?q= runs a ranked prefix/typo-tolerant search over names, emails and
+        document numbers (top ?limit=, ?fuzzy=auto|true|false); any other
+        parameters filter the results as usual.
+        """
         if not base_service.store:
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
+        query = filters.pop('q', None)
+        if query is None:
+            return conditional_jsonify(
+                base_service.store.collection_etag(),
+                lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+            )
 
-        return jsonify(results), 200
+        try:
+            limit = min(max(int(filters.pop('limit', PASSENGER_SEARCH_LIMIT)), 1), PASSENGER_SEARCH_MAX_LIMIT)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        fuzzy = filters.pop('fuzzy', 'auto').lower()
+        if fuzzy not in ('auto', 'true', 'false'):
+            return jsonify({"error": "fuzzy must be auto, true or false"}), 400
+        accept = base_service.store.queries.matcher(filters) if filters else None
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: passenger_index.search(query, limit, fuzzy, accept),
+        )
 
 if __name__ == '__main__':
     init_store('/api/api.json', 'passenger_id', 'Passengers')
@@ -30,4 +353,4 @@ if __name__ == '__main__':
     logger.info(f"Endpoints: /passengers, /passengers/<id>, /passengers/search")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
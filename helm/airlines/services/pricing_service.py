@@ -1,13 +1,370 @@
 #!/usr/bin/env python3
-"""Pricing Service - In-memory stateful API with flight pricing lookup"""
+"""Pricing Service - In-memory stateful API with flight pricing lookup
+
+Besides the static fare table, a FareEngine keeps dynamic fares per flight
+and cabin. Seat inventory comes from the flights service change feed; the
+whole network is repriced in one columnar pass from load factor and time
+to departure, and quotes are served from the last pass.
+"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
+from service_client import ServiceError, client
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
 import base_service
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Flights service whose change feed carries seats_available; empty prices
+# from the fare table alone
+FARE_INVENTORY_URL = os.getenv('FARE_INVENTORY_URL', os.getenv('FLIGHTS_SERVICE_URL', 'http://flights-app:3000'))
+FARE_CHANGES_WAIT = float(os.getenv('FARE_CHANGES_WAIT', '25'))
+# Inventory changes are batched for FARE_REPRICE_DELAY seconds before a
+# reprice; without changes the network is still repriced every
+# FARE_REPRICE_INTERVAL seconds as departures draw closer
+FARE_REPRICE_DELAY = float(os.getenv('FARE_REPRICE_DELAY', '0.2'))
+FARE_REPRICE_INTERVAL = float(os.getenv('FARE_REPRICE_INTERVAL', '60'))
+
+CLASSES = ("economy", "premium_economy", "business", "first")
+# Cabin fares relative to economy, for records that only have base_fare
+CLASS_MULTIPLIERS = {"economy": 1.0, "premium_economy": 1.5, "business": 3.0, "first": 5.0}
+
+# Fare buckets: a flight moves up one bucket each time its load factor
+# passes a step. Booking codes per cabin, cheapest first.
+LOAD_STEPS = (0.5, 0.7, 0.85, 0.95)
+BUCKET_MULTIPLIERS = (1.0, 1.15, 1.35, 1.6, 2.0)
+BUCKET_CODES = {
+    "economy": "VQMBY",
+    "premium_economy": "NLEHW",
+    "business": "IDZCJ",
+    "first": "RAPGF",
+}
+# Hours to departure steps and their multipliers, closest first. Flights
+# with no known departure are not adjusted for time, and flights with no
+# inventory stay in the first bucket.
+HOURS_STEPS = (48, 168, 504, 1440)
+TIME_MULTIPLIERS = (1.5, 1.3, 1.15, 1.0, 0.9)
+NO_DEPARTURE = float('inf')
+
+# Seats per aircraft family, matching the flights service cabin layouts
+AIRCRAFT_SEATS = (
+    (r'A380', 526),
+    (r'A3(19|20|21)|B73|B75', 172),
+)
+WIDEBODY_SEATS = 396
+
+
+def seat_capacity(flight: Dict) -> int:
+    if flight.get('capacity'):
+        return int(flight['capacity'])
+    aircraft = (flight.get('aircraft') or '').upper()
+    for pattern, seats in AIRCRAFT_SEATS:
+        if re.match(pattern, aircraft):
+            return seats
+    return WIDEBODY_SEATS
+
+
+def departure_epoch(value) -> float:
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return NO_DEPARTURE
+
+
+def _number(value) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+class FarePass:
+    """Result of one network reprice; immutable once published"""
+
+    def __init__(self, generation: int, rows: Dict[str, int], load: List[Optional[float]], buckets: List[int],
+                 hours: List[float], fares: Dict[str, List[float]], taxes: array, priced_at: float):
+        self.generation = generation
+        self.rows = rows
+        self.load = load
+        self.buckets = buckets
+        self.hours = hours
+        self.fares = fares
+        self.taxes = taxes
+        self.priced_at = priced_at
+
+    def quote(self, flight_id: str, travel_class: str) -> Optional[Dict]:
+        row = self.rows.get(flight_id)
+        if row is None or travel_class not in self.fares:
+            return None
+        fare = self.fares[travel_class][row]
+        taxes = self.taxes[row]
+        load = self.load[row]
+        hours = self.hours[row]
+        return {
+            "flight_id": flight_id,
+            "class": travel_class,
+            "fare_bucket": BUCKET_CODES[travel_class][self.buckets[row]],
+            "base_fare": fare,
+            "taxes": taxes,
+            "total": round(fare + taxes, 2),
+            "load_factor": None if load is None else round(load, 3),
+            "hours_to_departure": None if hours == NO_DEPARTURE else round(hours, 1),
+        }
+
+
+class FareEngine:
+    """Dynamic fares for every flight, kept as columns and repriced in bulk.
+
+    One row per flight in parallel arrays (cabin base fares, taxes, seat
+    capacity, seats available, departure time), filled from the pricing
+    store and the flights change feed. reprice() turns the columns into
+    fares with a handful of list comprehensions over whole columns and
+    publishes the result as a FarePass, so quotes are a dict lookup and
+    an index into the last pass; readers never wait on a reprice.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.flights: Dict[str, Dict] = {}
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.base = {cls: array('d') for cls in CLASSES}
+        self.taxes = array('d')
+        self.capacity = array('d')
+        self.available = array('d')
+        self.departs = array('d')
+        self.current = FarePass(0, {}, [], [], [], {cls: [] for cls in CLASSES}, array('d'), 0.0)
+        self.last_reprice_ms = 0.0
+        self.dirty = threading.Event()
+        self.follower: Optional[InventoryFollower] = None
+        with store.lock:
+            for flight_id in list(store.data):
+                self._set_row(flight_id)
+            store.subscribe(self._on_price_change)
+
+    def _row_values(self, flight_id: str):
+        """(cabin base fares, taxes, capacity, available, departs) or None if unpriceable"""
+        record = self.store.data.get(flight_id)
+        record = record if isinstance(record, dict) else {}
+        flight = self.flights.get(flight_id, {})
+        base_fare = _number(record.get('base_fare')) or _number(flight.get('base_fare'))
+        fares = {}
+        for cls in CLASSES:
+            fare = _number(record.get(cls))
+            if fare is None and base_fare is not None:
+                fare = base_fare * CLASS_MULTIPLIERS[cls]
+            if fare is None:
+                return None
+            fares[cls] = fare
+        taxes = _number(record.get('taxes'))
+        if taxes is None:
+            taxes = float((self.store.raw_data or {}).get('taxes_fees', {}).get('domestic', 50))
+        seats = _number(flight.get('seats_available'))
+        return (fares, taxes, float(seat_capacity(flight)), -1.0 if seats is None else seats,
+                departure_epoch(flight['departure_time']) if flight.get('departure_time') else NO_DEPARTURE)
+
+    def _set_row(self, flight_id: str):
+        """Insert, update or (swap-)remove the row of one flight; caller holds self.lock or is init"""
+        values = self._row_values(flight_id)
+        row = self.rows.get(flight_id)
+        if values is None:
+            if row is not None:
+                last = len(self.ids) - 1
+                moved = self.ids[last]
+                for column in (*self.base.values(), self.taxes, self.capacity, self.available, self.departs):
+                    column[row] = column[last]
+                    column.pop()
+                self.ids[row] = moved
+                self.rows[moved] = row
+                self.ids.pop()
+                del self.rows[flight_id]
+            return
+        fares, taxes, capacity, available, departs = values
+        if row is None:
+            self.rows[flight_id] = len(self.ids)
+            self.ids.append(flight_id)
+            for cls in CLASSES:
+                self.base[cls].append(fares[cls])
+            self.taxes.append(taxes)
+            self.capacity.append(capacity)
+            self.available.append(available)
+            self.departs.append(departs)
+        else:
+            for cls in CLASSES:
+                self.base[cls][row] = fares[cls]
+            self.taxes[row] = taxes
+            self.capacity[row] = capacity
+            self.available[row] = available
+            self.departs[row] = departs
+
+    def _on_price_change(self, change: Dict):
+        # Runs under the store lock
+        with self.lock:
+            self._set_row(change["id"])
+        self.dirty.set()
+
+    def apply_flight(self, op: str, flight_id: Optional[str], record: Optional[Dict]):
+        """Fold one flights change into the inventory columns"""
+        if not flight_id:
+            return
+        with self.lock:
+            if op == "delete" or record is None:
+                self.flights.pop(flight_id, None)
+            else:
+                self.flights[flight_id] = record
+            self._set_row(flight_id)
+        self.dirty.set()
+
+    def reset_flights(self, records: Dict[str, Dict]):
+        """Replace the inventory with a full flights snapshot"""
+        with self.lock:
+            self.flights = dict(records)
+            for flight_id in set(self.ids) | set(records):
+                self._set_row(flight_id)
+        self.dirty.set()
+
+    def reprice(self) -> FarePass:
+        """Reprice the whole network in one pass over the columns"""
+        started = time.perf_counter()
+        now = time.time()
+        with self.lock:
+            load = [None if a < 0 else min(1.0, max(0.0, 1.0 - a / c)) if c else 1.0
+                    for a, c in zip(self.available, self.capacity)]
+            hours = [NO_DEPARTURE if d == NO_DEPARTURE else (d - now) / 3600.0 for d in self.departs]
+            buckets = [0 if x is None else bisect_right(LOAD_STEPS, x) for x in load]
+            times = [1.0 if h == NO_DEPARTURE else TIME_MULTIPLIERS[bisect_right(HOURS_STEPS, h)] for h in hours]
+            factors = [BUCKET_MULTIPLIERS[b] * t for b, t in zip(buckets, times)]
+            fares = {cls: [round(b * f, 2) for b, f in zip(self.base[cls], factors)] for cls in CLASSES}
+            result = FarePass(self.current.generation + 1, dict(self.rows), load, buckets, hours, fares,
+                              array('d', self.taxes), now)
+        self.current = result
+        self.last_reprice_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    def quote(self, flight_id: str, travel_class: str) -> Optional[Dict]:
+        return self.current.quote(flight_id, travel_class)
+
+    def run(self):
+        """Reprice after each burst of changes, and at least every FARE_REPRICE_INTERVAL"""
+        while True:
+            if self.dirty.wait(FARE_REPRICE_INTERVAL):
+                time.sleep(FARE_REPRICE_DELAY)
+            self.dirty.clear()
+            try:
+                self.reprice()
+            except Exception:
+                logger.exception("Fare reprice failed")
+
+    def start(self, inventory_url: str):
+        self.reprice()
+        threading.Thread(target=self.run, name="fare-reprice", daemon=True).start()
+        if inventory_url:
+            self.follower = InventoryFollower(self, inventory_url)
+            self.follower.start()
+
+    def status(self) -> Dict:
+        current = self.current
+        return {
+            "flights": len(current.rows),
+            "generation": current.generation,
+            "priced_at": datetime.fromtimestamp(current.priced_at).isoformat() if current.priced_at else None,
+            "last_reprice_ms": round(self.last_reprice_ms, 2),
+            "pending": self.dirty.is_set(),
+            "inventory": self.follower.status() if self.follower else None,
+        }
+
+
+class InventoryFollower(threading.Thread):
+    """Long-polls the flights change feed into the fare engine.
+
+    Starts from a full snapshot and resnapshots whenever the flights
+    service signals resync, including after a restart under a new epoch.
+    """
+
+    def __init__(self, engine: FareEngine, base_url: str):
+        super().__init__(name="fare-inventory", daemon=True)
+        self.engine = engine
+        self.base_url = base_url.rstrip('/')
+        self.seq: Optional[int] = None
+        self.epoch: Optional[str] = None
+        self.applied = 0
+        self.last_error: Optional[str] = None
+
+    def _get(self, path: str, timeout: float):
+        # Feed positions change constantly, so bypass the client's GET cache
+        url = f"{self.base_url}/flights{path}"
+        response = client.request('GET', url, timeout=timeout)
+        if not response.ok:
+            raise ServiceError(url, response)
+        return response.json()
+
+    def run(self):
+        backoff = 1.0
+        while True:
+            try:
+                if self.seq is None:
+                    position = self._get('/changes', 10)
+                    records = self._get('', 30)
+                    self.engine.reset_flights({r['flight_id']: r for r in records if r.get('flight_id')})
+                    self.seq, self.epoch = position["seq"], position.get("epoch")
+                    logger.info("Fare inventory snapshot: %d flights at seq %d", len(records), self.seq)
+                query = urllib.parse.urlencode({"since": self.seq, "epoch": self.epoch or '',
+                                                "wait": FARE_CHANGES_WAIT})
+                feed = self._get(f'/changes?{query}', FARE_CHANGES_WAIT + 10)
+                if feed.get("resync"):
+                    self.seq = None
+                    continue
+                for change in feed["changes"]:
+                    self.engine.apply_flight(change["op"], change["id"], change.get("record"))
+                    self.applied += 1
+                self.seq = feed["seq"]
+                self.last_error = None
+                backoff = 1.0
+            except (ServiceError, OSError, ValueError, KeyError) as e:
+                self.last_error = str(e)
+                logger.warning("Fare inventory unavailable: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def status(self) -> Dict:
+        return {"url": self.base_url, "seq": self.seq, "applied": self.applied, "last_error": self.last_error}
+
+
+fare_engine: Optional[FareEngine] = None
+
 
 def setup_pricing_routes():
-    """Add pricing-specific routes"""
+    """Add pricing-specific routes and start the fare engine"""
+    global fare_engine
+    fare_engine = FareEngine(base_service.store)
+    fare_engine.start(FARE_INVENTORY_URL)
+    base_service.register_memory('pricing.fare_engine', fare_engine)
+
+    @app.route('/pricing/fares', methods=['GET'])
+    def get_fare_engine():
+        """Fare engine state: flights priced, last reprice and inventory feed"""
+        return jsonify(fare_engine.status()), 200
+
+    @app.route('/pricing/fares/<flight_id>', methods=['GET'])
+    def get_flight_fares(flight_id):
+        """Current dynamic fare in every cabin of a flight"""
+        current = fare_engine.current
+        if flight_id not in current.rows:
+            return jsonify({"error": "Not found"}), 404
+        return conditional_jsonify(
+            f"{base_service.store.epoch}-f{current.generation}",
+            lambda: {"flight_id": flight_id,
+                     "fares": {cls: current.quote(flight_id, cls) for cls in CLASSES}},
+        )
+
     @app.route('/pricing/search', methods=['GET'])
     def search_pricing():
         """Search pricing by any field"""
@@ -15,9 +372,10 @@ def setup_pricing_routes():
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
 
     @app.route('/pricing/<flight_id>', methods=['GET'])
     def get_flight_pricing(flight_id):
@@ -28,7 +386,7 @@ def setup_pricing_routes():
         # Look up pricing by flight_id
         pricing = base_service.store.get_by_id(flight_id)
         if pricing:
-            return jsonify(pricing), 200
+            return conditional_jsonify(base_service.store.record_etag(flight_id), lambda: pricing)
 
         return jsonify({"error": "Not found"}), 404
 
@@ -46,6 +404,13 @@ def setup_pricing_routes():
         pricing_table = base_service.store.data or {}
         taxes_fees = (base_service.store.raw_data or {}).get('taxes_fees', {})
 
+        # Only flights with inventory or a departure time are priced
+        # dynamically; the rest keep the fare table's plain total
+        quote = fare_engine.quote(flight_id, travel_class) if flight_id else None
+        if quote and (quote['load_factor'] is not None or quote['hours_to_departure'] is not None):
+            return jsonify({'base_fare': quote['base_fare'], 'taxes': quote['taxes'], 'total': quote['total'],
+                            'fare_bucket': quote['fare_bucket'], 'load_factor': quote['load_factor']}), 201
+
         result = None
         # Try flight-specific pricing first
         if flight_id and flight_id in pricing_table:
@@ -75,10 +440,8 @@ if __name__ == '__main__':
     create_rest_api('pricing', versions=['v1', 'v2'])
 
     # Start the server
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info(f"Starting Pricing service on port 3000")
-    logger.info(f"Endpoints: /pricing, /pricing/<flight_id>, /pricing/calculate")
+    logger.info(f"Endpoints: /pricing, /pricing/<flight_id>, /pricing/calculate, /pricing/fares/<flight_id>")
     logger.info(f"Loaded {len(base_service.store.data)} initial pricing records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
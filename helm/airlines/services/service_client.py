@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+HTTP client for calls between airline services
+
+Keeps pooled keep-alive connections per upstream, runs fan-out calls
+concurrently with per-call timeouts, coalesces identical in-flight GETs
+and caches GET responses briefly (revalidating with ETags once stale), so
+composite endpoints cost roughly one round trip to the slowest upstream.
+"""
+
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+CLIENT_POOL_SIZE = int(os.getenv('CLIENT_POOL_SIZE', '8'))
+CLIENT_WORKERS = int(os.getenv('CLIENT_WORKERS', '16'))
+CLIENT_TIMEOUT = float(os.getenv('CLIENT_TIMEOUT', '5'))
+CLIENT_CACHE_TTL = float(os.getenv('CLIENT_CACHE_TTL', '1'))
+CLIENT_CACHE_SIZE = int(os.getenv('CLIENT_CACHE_SIZE', '256'))
+
+
+class ServiceResponse:
+    """Status, lower-cased headers and raw body of an upstream response"""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port)"""
+
+    def __init__(self, max_idle: int):
+        self.max_idle = max_idle
+        self.idle: Dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: tuple, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """Return (connection, reused)"""
+        with self.lock:
+            conns = self.idle.get(key)
+            conn = conns.pop() if conns else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return cls(host, port, timeout=timeout), False
+
+    def release(self, key: tuple, conn: http.client.HTTPConnection):
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+
+class ServiceClient:
+    """Pooled, coalescing, briefly caching HTTP client for sibling services"""
+
+    def __init__(self, pool_size: int = CLIENT_POOL_SIZE, workers: int = CLIENT_WORKERS,
+                 cache_ttl: float = CLIENT_CACHE_TTL, cache_size: int = CLIENT_CACHE_SIZE):
+        self.pool = ConnectionPool(pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service-client")
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, Tuple[float, ServiceResponse]]" = OrderedDict()
+        self.inflight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None, timeout: float = CLIENT_TIMEOUT) -> ServiceResponse:
+        """Send one request over a pooled connection.
+
+        A reused connection the server has since closed is retried once on a
+        fresh one. Protocol errors surface as ConnectionError, so callers
+        only need to handle OSError.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme or 'http', parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        for attempt in range(2):
+            conn, reused = self.pool.acquire(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except http.client.HTTPException as e:
+                conn.close()
+                raise ConnectionError(f"{url}: {e!r}") from e
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self.pool.release(key, conn)
+            return ServiceResponse(resp.status, {k.lower(): v for k, v in resp.getheaders()}, data)
+
+    def get(self, url: str, timeout: float = CLIENT_TIMEOUT) -> ServiceResponse:
+        """GET with a short-lived cache and coalescing of identical calls"""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get(url)
+            if cached and cached[0] > now:
+                self.cache.move_to_end(url)
+                return cached[1]
+            future = self.inflight.get(url)
+            leader = future is None
+            if leader:
+                future = self.inflight[url] = Future()
+        if not leader:
+            return future.result(timeout=timeout)
+
+        try:
+            headers = {}
+            if cached and 'etag' in cached[1].headers:
+                headers['If-None-Match'] = cached[1].headers['etag']
+            response = self.request('GET', url, headers=headers, timeout=timeout)
+            if response.status == 304 and cached:
+                response = cached[1]
+            if response.ok and self.cache_ttl > 0:
+                with self.lock:
+                    self.cache[url] = (time.monotonic() + self.cache_ttl, response)
+                    self.cache.move_to_end(url)
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(url, None)
+
+    def get_json(self, url: str, timeout: float = CLIENT_TIMEOUT) -> Any:
+        """GET and decode JSON; raises ServiceError on non-2xx"""
+        response = self.get(url, timeout)
+        if not response.ok:
+            raise ServiceError(url, response)
+        return response.json()
+
+    def post_json(self, url: str, payload: Any, timeout: float = CLIENT_TIMEOUT) -> ServiceResponse:
+        """POST a JSON body (never cached or coalesced)"""
+        return self.request('POST', url, body=json.dumps(payload).encode(),
+                            headers={'Content-Type': 'application/json'}, timeout=timeout)
+
+    def fan_out(self, calls: Dict[str, Callable[[], Any]], timeout: float = CLIENT_TIMEOUT) -> Dict[str, Any]:
+        """Run calls concurrently and wait at most `timeout` for all of them.
+
+        Returns name -> result, or name -> exception for calls that failed
+        or didn't finish in time.
+        """
+        futures = {name: self.executor.submit(call) for name, call in calls.items()}
+        wait(futures.values(), timeout=timeout)
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                results[name] = TimeoutError(f"{name} timed out after {timeout}s")
+            elif future.exception() is not None:
+                results[name] = future.exception()
+            else:
+                results[name] = future.result()
+        return results
+
+
+class ServiceError(Exception):
+    """Non-2xx response from an upstream service"""
+
+    def __init__(self, url: str, response: ServiceResponse):
+        super().__init__(f"{url} returned {response.status}")
+        self.url = url
+        self.response = response
+
+
+# Shared client for all routes in this process
+client = ServiceClient()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Replay a simulated day of flight operations against the airline services
+
+Builds a schedule from --seed alone: a fleet of SIM-* flights, bookings
+arriving ahead of each departure, check-ins from 24h out, bags added at
+check-in and scanned through security, loading and arrival, flight status
+changes (delays, boarding, departure, arrival) and the passenger
+notifications that go with them. The same seed and options always give
+the same schedule (its digest is printed).
+
+The schedule is played open-loop: each request is sent at its scheduled
+time whether or not earlier ones have completed, and latency is measured
+from that scheduled time, so a stalled server shows up as latency instead
+of quietly lowering the offered load (no coordinated omission). Only
+loopback targets are accepted.
+
+Usage:
+  python simulate_flight_ops.py --target http://127.0.0.1:3000 --rate 200
+  python simulate_flight_ops.py --service flights=http://127.0.0.1:3001 \
+      --service bookings=http://127.0.0.1:3002 ... --flights 50 --rate 500
+"""
+
+import argparse
+import asyncio
+import hashlib
+import ipaddress
+import json
+import random
+import socket
+import time
+import urllib.parse
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+SERVICES = ("flights", "bookings", "checkin", "baggage", "notifications")
+AIRPORTS = ("IST", "JFK", "LHR", "CDG", "FRA", "DXB", "SIN", "NRT", "LAX", "ORD")
+AIRCRAFT = (("A320", 172), ("B737-800", 172), ("B777-300ER", 396), ("A350-900", 396), ("A380", 526))
+CABINS = (("economy", 0.82), ("premium_economy", 0.08), ("business", 0.08), ("first", 0.02))
+
+
+class Event(NamedTuple):
+    at: float  # simulated minutes from the start
+    kind: str
+    method: str
+    service: str
+    path: str
+    body: Optional[Dict]
+    # (booking_id, bag index) for bag scans, whose tag comes from an earlier response
+    bag: Optional[Tuple[str, int]] = None
+
+
+def iso(start: float, minutes: float) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start + minutes * 60))
+
+
+def build_schedule(seed: int, flights: int, hours: float, load: float) -> Tuple[Dict[str, List[Dict]], List[Event]]:
+    """Records to create before the simulated window opens, per service, and
+    every event inside it.
+
+    The setup holds the SIM flights plus the bookings and check-ins that
+    happened before the window, so later events never refer to a booking
+    that was not created.
+    """
+    rng = random.Random(seed)
+    # Simulated clock anchored to a fixed date so the schedule is reproducible
+    epoch = 1767225600.0  # 2026-01-01T00:00:00Z
+    horizon = hours * 60
+    fleet, events = [], []
+
+    for n in range(flights):
+        flight_id = f"SIM-{n + 1:04d}"
+        aircraft, seats = rng.choice(AIRCRAFT)
+        origin, destination = rng.sample(AIRPORTS, 2)
+        departure = rng.uniform(90, horizon)
+        block = rng.uniform(90, 720)
+        booked = int(seats * load * rng.uniform(0.7, 1.0))
+        fleet.append({
+            "flight_id": flight_id, "flight_number": flight_id, "origin": origin, "destination": destination,
+            "departure_time": iso(epoch, departure), "arrival_time": iso(epoch, departure + block),
+            "status": "scheduled", "aircraft": aircraft, "seats_available": seats, "base_fare": 400.0,
+            "currency": "USD",
+        })
+
+        delay = rng.uniform(15, 120) if rng.random() < 0.15 else 0.0
+        if delay:
+            events.append(Event(departure - 90, "flight_status", "PATCH", "flights", f"/flights/{flight_id}",
+                                {"status": "delayed", "delay_minutes": round(delay)}))
+        departure += delay
+        events.append(Event(departure - 40, "flight_status", "PATCH", "flights", f"/flights/{flight_id}",
+                            {"status": "boarding"}))
+        events.append(Event(departure, "flight_status", "PATCH", "flights", f"/flights/{flight_id}",
+                            {"status": "departed"}))
+        events.append(Event(departure + block, "flight_status", "PATCH", "flights", f"/flights/{flight_id}",
+                            {"status": "arrived"}))
+
+        notified = []
+        for p in range(booked):
+            booking_id = f"SIM-BK-{n + 1:04d}-{p + 1:03d}"
+            passenger_id = f"SIM-PAX-{rng.randrange(1, 10 * flights * seats):06d}"
+            cabin = rng.choices([c for c, _ in CABINS], [w for _, w in CABINS])[0]
+            booked_at = rng.uniform(-24 * 60, departure - 60)
+            events.append(Event(booked_at, "booking", "POST", "bookings", "/bookings", {
+                "booking_id": booking_id, "passenger_id": passenger_id, "flight_id": flight_id,
+                "cabin": cabin, "cabin_class": cabin, "status": "confirmed", "created_at": iso(epoch, booked_at),
+            }))
+            if rng.random() >= 0.85:
+                continue
+            checkin_at = max(booked_at + 1, rng.uniform(departure - 24 * 60, departure - 45))
+            events.append(Event(checkin_at, "checkin", "POST", "checkin", "/checkin", {
+                "booking_id": booking_id, "passenger_id": passenger_id, "flight_id": flight_id,
+                "seat": f"{rng.randint(1, 40)}{rng.choice('ABCDEF')}", "status": "checked-in",
+                "checked_in_at": iso(epoch, checkin_at),
+            }))
+            if len(notified) < 20:
+                notified.append((booking_id, passenger_id))
+            bags = rng.choice((0, 0, 1, 1, 1, 2))
+            if bags:
+                events.append(Event(checkin_at + 1, "bag_add", "POST", "baggage", "/baggage/add", {
+                    "booking_id": booking_id, "bags": bags, "weight": round(rng.uniform(8, 32), 1),
+                    "location": origin,
+                }))
+            if checkin_at + 1 < 0:
+                # Added before the window opens; there is no tag to scan
+                continue
+            for bag in range(bags):
+                for at, status, location in (
+                        (checkin_at + rng.uniform(15, 40), "security", origin),
+                        (departure - rng.uniform(10, 25), "loaded", origin),
+                        (departure + block + rng.uniform(10, 30), "arrived", destination)):
+                    events.append(Event(at, "bag_scan", "PUT", "baggage", None,
+                                        {"status": status, "location": location}, (booking_id, bag)))
+
+        for at, kind in ((departure - delay - 85, "flight_delay"), (departure - 40, "boarding")):
+            if kind == "flight_delay" and not delay:
+                continue
+            for booking_id, passenger_id in notified:
+                events.append(Event(at + rng.uniform(0, 2), "notification", "POST", "notifications",
+                                    "/notifications/send",
+                                    {"type": kind, "recipient": passenger_id, "booking_id": booking_id}))
+
+    setup: Dict[str, List[Dict]] = {"flights": fleet, "bookings": [], "checkin": []}
+    for event in events:
+        if event.at < 0 and event.kind in ("booking", "checkin"):
+            setup[event.service].append(event.body)
+    events = sorted((e for e in events if 0 <= e.at <= horizon), key=lambda e: e.at)
+    return setup, events
+
+
+def schedule_digest(events: List[Event]) -> str:
+    digest = hashlib.sha256()
+    for event in events:
+        digest.update(json.dumps([round(event.at, 6), event.method, event.path, event.body, event.bag],
+                                 sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def loopback_only(url: str) -> Tuple[str, int]:
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise SystemExit(f"{url}: only http:// targets are supported")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 80)}
+    except OSError as e:
+        raise SystemExit(f"{url}: {e}")
+    if not all(ipaddress.ip_address(a.split('%')[0]).is_loopback for a in addresses):
+        raise SystemExit(f"{url}: refusing a non-loopback target ({', '.join(sorted(addresses))})")
+    return parts.hostname, parts.port or 80
+
+
+class Pool:
+    """Keep-alive connections to one target, at most `size` open at a time"""
+
+    def __init__(self, host: str, port: int, size: int):
+        self.host = host
+        self.port = port
+        self.slots = asyncio.Semaphore(size)
+        self.idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def request(self, method: str, path: str, body: Optional[Dict]) -> Tuple[int, bytes]:
+        payload = json.dumps(body).encode() if body is not None else b''
+        async with self.slots:
+            reader, writer = self.idle.pop() if self.idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                              f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n").encode()
+                             + payload)
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                status = int(lines[0].split(' ')[1])
+                fields = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        fields[name.strip().lower()] = value.strip()
+                data = await reader.readexactly(int(fields.get('content-length', 0)))
+            except BaseException:
+                writer.close()
+                raise
+            if fields.get('connection', '').lower() == 'close' or lines[0].startswith('HTTP/1.0'):
+                writer.close()
+            else:
+                self.idle.append((reader, writer))
+            return status, data
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.skipped = 0
+        self.max_send_lag = 0.0
+
+    def record(self, kind: str, latency: float, ok: bool):
+        self.latencies.setdefault(kind, []).append(latency)
+        if not ok:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def play(events: List[Event], pools: Dict[str, Pool], speedup: float, recorder: Recorder):
+    loop = asyncio.get_running_loop()
+    bag_tags: Dict[str, List[str]] = {}
+    start = loop.time() + 0.2
+
+    async def fire(event: Event, intended: float):
+        path = event.path
+        if event.bag is not None:
+            tags = bag_tags.get(event.bag[0], [])
+            if event.bag[1] >= len(tags):
+                # The bag was never added (its add failed or is still in flight)
+                recorder.skipped += 1
+                return
+            path = f"/baggage/track/{tags[event.bag[1]]}"
+        try:
+            status, data = await pools[event.service].request(event.method, path, event.body)
+            ok = status < 400
+            if ok and event.kind == "bag_add":
+                bag_tags[event.body["booking_id"]] = [b["bag_tag"] for b in json.loads(data)["baggage"]]
+        except (OSError, asyncio.IncompleteReadError, ValueError, KeyError):
+            ok = False
+        recorder.record(event.kind, loop.time() - intended, ok)
+
+    tasks = []
+    for event in events:
+        intended = start + event.at * 60 / speedup
+        delay = intended - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            recorder.max_send_lag = max(recorder.max_send_lag, -delay)
+        tasks.append(asyncio.ensure_future(fire(event, intended)))
+    await asyncio.gather(*tasks)
+    return loop.time() - start
+
+
+async def create_setup(pools: Dict[str, Pool], setup: Dict[str, List[Dict]]):
+    """Upsert the fleet, then the bookings and check-ins made before the window"""
+    for service, records in setup.items():
+        if not records:
+            continue
+        operations = [{"op": "upsert", "record": record} for record in records]
+        status, data = await pools[service].request('POST', f'/{service}/_bulk', {"operations": operations})
+        if status >= 400:
+            raise SystemExit(f"Creating the SIM {service} failed with {status}: {data[:200]!r}")
+
+
+def percentile(values: List[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def report(recorder: Recorder, elapsed: float):
+    print(f"{'event':<14}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+          f"{'p99.9 ms':>10}{'max ms':>10}")
+    everything = []
+    for kind in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[kind])
+        everything += values
+        print(f"{kind:<14}{len(values):>8}{recorder.errors.get(kind, 0):>8}{percentile(values, 0.5):>10.2f}"
+              f"{percentile(values, 0.9):>10.2f}{percentile(values, 0.99):>10.2f}"
+              f"{percentile(values, 0.999):>10.2f}{values[-1] * 1000:>10.2f}")
+    everything.sort()
+    if everything:
+        print(f"{'all':<14}{len(everything):>8}{sum(recorder.errors.values()):>8}"
+              f"{percentile(everything, 0.5):>10.2f}{percentile(everything, 0.9):>10.2f}"
+              f"{percentile(everything, 0.99):>10.2f}{percentile(everything, 0.999):>10.2f}"
+              f"{everything[-1] * 1000:>10.2f}")
+    print(f"{len(everything) / elapsed:.0f} req/s achieved over {elapsed:.1f}s; "
+          f"{recorder.skipped} bag scans skipped; scheduler fell behind by at most "
+          f"{recorder.max_send_lag * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--target', default='http://127.0.0.1:3000',
+                        help='base URL for every service (e.g. a host_service.py process)')
+    parser.add_argument('--service', action='append', default=[], metavar='NAME=URL',
+                        help=f'per-service base URL, overriding --target ({", ".join(SERVICES)})')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--flights', type=int, default=20)
+    parser.add_argument('--hours', type=float, default=6, help='simulated window')
+    parser.add_argument('--load', type=float, default=0.8, help='booked share of seats')
+    parser.add_argument('--rate', type=float, default=100, help='average requests per second offered')
+    parser.add_argument('--connections', type=int, default=64, help='per service')
+    parser.add_argument('--dry-run', action='store_true', help='print the schedule summary and exit')
+    args = parser.parse_args()
+
+    setup, events = build_schedule(args.seed, args.flights, args.hours, args.load)
+    if not events:
+        raise SystemExit("The schedule is empty; raise --flights or --hours")
+    # Accelerate the simulated clock so the schedule averages --rate
+    speedup = args.hours * 3600 * args.rate / len(events) if args.rate > 0 else 1.0
+    kinds: Dict[str, int] = {}
+    for event in events:
+        kinds[event.kind] = kinds.get(event.kind, 0) + 1
+    print(f"seed {args.seed}: {len(setup['flights'])} flights, {len(setup['bookings'])} bookings and "
+          f"{len(setup['checkin'])} check-ins before the window, {len(events)} events over {args.hours:g}h simulated "
+          f"({', '.join(f'{k} {n}' for k, n in sorted(kinds.items()))}); schedule {schedule_digest(events)}")
+    print(f"clock x{speedup:.0f}: {args.hours * 3600 / speedup:.1f}s at {args.rate:g} req/s offered")
+    if args.dry_run:
+        return
+
+    urls = {name: args.target for name in SERVICES}
+    for override in args.service:
+        name, _, url = override.partition('=')
+        if name not in urls or not url:
+            raise SystemExit(f"--service {override}: expected NAME=URL with NAME one of {', '.join(SERVICES)}")
+        urls[name] = url
+
+    async def run():
+        pools = {name: Pool(*loopback_only(url), args.connections) for name, url in urls.items()}
+        await create_setup(pools, setup)
+        recorder = Recorder()
+        elapsed = await play(events, pools, speedup, recorder)
+        report(recorder, elapsed)
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
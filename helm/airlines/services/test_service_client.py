@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Tests for service_client against a local stub service.
+
+Run with `python -m pytest test_service_client.py` (or plain unittest)
+from this directory.
+"""
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from service_client import ServiceClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/slow answers after a delay, /hang after longer than any test
+    timeout, and /etag serves a body with an ETag, answering a matching
+    If-None-Match with 304"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.hits.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/hang':
+            time.sleep(1.0)
+        if self.path == '/slow':
+            time.sleep(0.2)
+        if self.path == '/etag' and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = b'{"path": "%s"}' % self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/etag':
+            self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServiceClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.hits = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def hits(self, path):
+        return [h for h in self.server.hits if h[0] == path]
+
+    def test_identical_gets_in_flight_are_coalesced(self):
+        client = ServiceClient(cache_ttl=0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.get_json(f"{self.base}/slow")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [{"path": "/slow"}] * 8)
+        self.assertEqual(len(self.hits('/slow')), 1)
+
+    def test_request_timeout_raises_oserror(self):
+        client = ServiceClient()
+        started = time.monotonic()
+        with self.assertRaises(OSError):
+            client.request('GET', f"{self.base}/hang", timeout=0.2)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_fan_out_reports_calls_past_the_deadline(self):
+        client = ServiceClient()
+        results = client.fan_out({
+            "fast": lambda: client.get_json(f"{self.base}/etag"),
+            "hung": lambda: client.get_json(f"{self.base}/hang"),
+        }, timeout=0.3)
+        self.assertEqual(results["fast"], {"path": "/etag"})
+        self.assertIsInstance(results["hung"], TimeoutError)
+
+    def test_stale_cache_entry_is_revalidated_with_etag(self):
+        client = ServiceClient(cache_ttl=0.1)
+        first = client.get(f"{self.base}/etag")
+        cached = client.get(f"{self.base}/etag")
+        self.assertIs(cached, first)
+        self.assertEqual(self.hits('/etag'), [('/etag', None)])
+
+        time.sleep(0.15)
+        revalidated = client.get(f"{self.base}/etag")
+        self.assertEqual(self.hits('/etag'), [('/etag', None), ('/etag', '"v1"')])
+        self.assertEqual(revalidated.status, 200)
+        self.assertEqual(revalidated.json(), {"path": "/etag"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@
 """Tickets Service - In-memory stateful API with search"""
 import sys
 sys.path.append('/app')
-from base_service import app, init_store, create_rest_api
+from base_service import app, init_store, create_rest_api, conditional_jsonify, serve
 from flask import jsonify, request
 import base_service
 
@@ -15,9 +15,10 @@ def setup_tickets_routes():
             return jsonify({"error": "Service not initialized"}), 500
 
         filters = request.args.to_dict()
-        results = base_service.store.search(**filters) if filters else list(base_service.store.data.values())
-
-        return jsonify(results), 200
+        return conditional_jsonify(
+            base_service.store.collection_etag(),
+            lambda: base_service.store.search(**filters) if filters else list(base_service.store.data.values()),
+        )
 
 if __name__ == '__main__':
     init_store('/api/api.json', 'ticket_id', 'Tickets')
@@ -30,4 +31,4 @@ if __name__ == '__main__':
     logger.info(f"Endpoints: /tickets, /tickets/<id>, /tickets/search")
     logger.info(f"Loaded {len(base_service.store.data)} initial records")
 
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    serve(port=3000)
@@ -272,7 +272,8 @@ Keycloak is at keycloak.{global.domain} (not under the airlines. subdomain).
 {{/*
 Flask stateful service deployment template.
 Creates: 2x ConfigMap (code + data) + Deployment + Service for a Python Flask CRUD service.
-Service code is loaded from services/{name}_service.py + services/base_service.py.
+Service code is loaded from services/{name}_service.py + services/base_service.py,
+plus services/service_client.py for calls to sibling services.
 Seed data is loaded from files/data/{name}.json.
 
 Usage:
@@ -283,6 +284,10 @@ When `versions` is passed, the template mounts one ConfigMap per version at
 /public/{version}/ (each ConfigMap expected to be named {name}-openapi-{version}),
 matching base_service.py's per-version spec-serving behaviour. Without
 `versions`, a single ConfigMap {name}-openapi is mounted at /public/.
+
+Services listed in .Values.replication.followers run as one write leader
+(reachable as {name}-leader) plus that many read followers, all behind
+the {name}-app Service.
 */}}
 {{- define "airlines.flaskService" -}}
 ---
@@ -296,6 +301,8 @@ metadata:
 data:
   base_service.py: |
 {{ .root.Files.Get "services/base_service.py" | indent 4 }}
+  service_client.py: |
+{{ .root.Files.Get "services/service_client.py" | indent 4 }}
   service.py: |
 {{ .root.Files.Get (printf "services/%s_service.py" .name) | indent 4 }}
 ---
@@ -309,24 +316,84 @@ metadata:
 data:
   api.json: |
 {{ .root.Files.Get (printf "files/data/%s.json" .name) | indent 4 }}
+{{- $followers := int (index (default dict (default dict .root.Values.replication).followers) .name | default 0) }}
+{{- if $followers }}
+{{ include "airlines.flaskDeployment" (dict "root" .root "name" .name "versions" .versions "role" "leader" "replicas" 1) }}
+{{ include "airlines.flaskDeployment" (dict "root" .root "name" .name "versions" .versions "role" "follower" "replicas" $followers) }}
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: {{ .name }}-leader
+  labels:
+    {{- include "airlines.labels" .root | nindent 4 }}
+    component: {{ .name }}
+spec:
+  type: ClusterIP
+  ports:
+    - port: 3000
+      targetPort: 3000
+      protocol: TCP
+      name: http
+  selector:
+    app: {{ .name }}-app
+    role: leader
+{{- else }}
+{{ include "airlines.flaskDeployment" (dict "root" .root "name" .name "versions" .versions "role" "" "replicas" 1) }}
+{{- end }}
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: {{ .name }}-app
+  labels:
+    {{- include "airlines.labels" .root | nindent 4 }}
+    component: {{ .name }}
+spec:
+  type: ClusterIP
+  ports:
+    - port: 3000
+      targetPort: 3000
+      protocol: TCP
+      name: http
+  selector:
+    app: {{ .name }}-app
+{{- end -}}
+
+{{/*
+Deployment for a Flask service (used by airlines.flaskService).
+role is "" for a single standalone pod ({name}-app), or "leader"/"follower"
+when the service is replicated via .Values.replication.followers
+({name}-leader and {name}-follower). A Deployment's selector is immutable,
+so replicated roles get their own Deployments rather than adding `role`
+to {name}-app's selector; turning followers on or off replaces the
+Deployments instead of failing the upgrade.
+*/}}
+{{- define "airlines.flaskDeployment" -}}
 ---
 apiVersion: apps/v1
 kind: Deployment
 metadata:
-  name: {{ .name }}-app
+  name: {{ .name }}-{{ .role | default "app" }}
   labels:
     {{- include "airlines.labels" .root | nindent 4 }}
     component: {{ .name }}
 spec:
-  replicas: 1
+  replicas: {{ .replicas }}
   selector:
     matchLabels:
       app: {{ .name }}-app
+      {{- if .role }}
+      role: {{ .role }}
+      {{- end }}
   template:
     metadata:
       labels:
         app: {{ .name }}-app
         component: {{ .name }}
+        {{- if .role }}
+        role: {{ .role }}
+        {{- end }}
     spec:
       initContainers:
         - name: install-deps
@@ -342,6 +409,14 @@ spec:
           env:
             - name: PYTHONPATH
               value: /deps:/app
+            {{- if .role }}
+            - name: REPLICATION_ROLE
+              value: {{ .role }}
+            {{- end }}
+            {{- if eq .role "follower" }}
+            - name: LEADER_URL
+              value: http://{{ .name }}-leader:3000
+            {{- end }}
           ports:
             - containerPort: 3000
               name: http
@@ -388,23 +463,6 @@ spec:
           configMap:
             name: {{ .name }}-openapi
         {{- end }}
----
-apiVersion: v1
-kind: Service
-metadata:
-  name: {{ .name }}-app
-  labels:
-    {{- include "airlines.labels" .root | nindent 4 }}
-    component: {{ .name }}
-spec:
-  type: ClusterIP
-  ports:
-    - port: 3000
-      targetPort: 3000
-      protocol: TCP
-      name: http
-  selector:
-    app: {{ .name }}-app
 {{- end -}}
 
 {{/*
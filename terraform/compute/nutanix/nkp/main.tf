@@ -149,7 +149,7 @@ resource "null_resource" "nkp_create_cluster" {
   provisioner "remote-exec" {
     when = destroy
     inline = [
-      "python3 -m pip install 'ntnx-vmm-py-client<4.2' 'ntnx-volumes-py-client<4.2' requests --quiet --break-system-packages",
+      "python3 -m pip install 'ntnx-vmm-py-client<4.2' 'ntnx-volumes-py-client<4.2' 'ntnx-prism-py-client<4.2' requests --quiet --break-system-packages",
       "NUTANIX_ENDPOINT=${self.triggers.nutanix_endpoint} NUTANIX_PORT=${self.triggers.nutanix_port} NUTANIX_USERNAME=${self.triggers.nutanix_username} NUTANIX_PASSWORD=${nonsensitive(self.triggers.nutanix_password)} python3 cleanup_nutanix_resources.py --vm-pattern '^(?!.*-bastion$).*${self.triggers.cluster_name}.*' --storage-container ${self.triggers.storage_container}"
     ]
   }
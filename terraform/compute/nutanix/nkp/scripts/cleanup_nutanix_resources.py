@@ -5,14 +5,9 @@ import argparse
 import urllib3
 import logging
 import time
-
-# Import Nutanix SDKs
-import ntnx_vmm_py_client
-import ntnx_volumes_py_client
-from ntnx_vmm_py_client import ApiClient as VmmApiClient
-from ntnx_vmm_py_client import Configuration as VmmConfiguration
-from ntnx_volumes_py_client import ApiClient as VolumesApiClient
-from ntnx_volumes_py_client import Configuration as VolumesConfiguration
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Suppress warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -21,6 +16,20 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger()
 
+# Prism Central v4 list endpoints return at most 100 entities per page
+PAGE_SIZE = 100
+
+# Task polling: first delay, backoff factor, longest delay and overall limit (seconds)
+TASK_POLL_INITIAL = 1.0
+TASK_POLL_FACTOR = 1.5
+TASK_POLL_MAX = 15.0
+TASK_TIMEOUT = float(os.getenv("CLEANUP_TASK_TIMEOUT", "600"))
+
+# Anything else (QUEUED, RUNNING, CANCELING, ...) is still in progress
+TASK_DONE = {"SUCCEEDED"}
+TASK_FAILED = {"FAILED", "CANCELED"}
+
+
 def get_env_var(name):
     value = os.getenv(name)
     if not value:
@@ -28,200 +37,426 @@ def get_env_var(name):
         sys.exit(1)
     return value
 
-# Configuration
-PC_IP = get_env_var("NUTANIX_ENDPOINT")
-PC_PORT = os.getenv("NUTANIX_PORT", "9440")
-PC_USERNAME = get_env_var("NUTANIX_USERNAME")
-PC_PASSWORD = get_env_var("NUTANIX_PASSWORD")
-
-def get_vmm_client():
-    config = VmmConfiguration()
-    config.host = PC_IP
-    config.port = PC_PORT
-    config.username = PC_USERNAME
-    config.password = PC_PASSWORD
-    config.verify_ssl = False
-    return VmmApiClient(configuration=config)
-
-def get_volumes_client():
-    config = VolumesConfiguration()
-    config.host = PC_IP
-    config.port = PC_PORT
-    config.username = PC_USERNAME
-    config.password = PC_PASSWORD
-    config.verify_ssl = False
-    return VolumesApiClient(configuration=config)
-
-def get_storage_container_id_by_name(client, name):
-    api = ntnx_vmm_py_client.StorageContainerApi(api_client=client)
-    try:
-        response = api.list_storage_containers()
-        containers = response.data if response and response.data else []
-        for container in containers:
-            if container.name == name:
-                return container.ext_id
-    except Exception as e:
-        logger.error(f"Failed to list storage containers: {e}")
-        sys.exit(1)
-    logger.error(f"Storage container '{name}' not found.")
-    sys.exit(1)
 
-def cleanup_volume_groups(dry_run, storage_container_id):
-    logger.info("\\n--- Phase 1: Cleaning up Volume Groups ---")
-    logger.info(f"Filtering by storage container ID: {storage_container_id}")
-    client = get_volumes_client()
-    api = ntnx_volumes_py_client.VolumeGroupsApi(api_client=client)
+class NutanixApis:
+    """The SDK API objects the cleanup drives.
 
-    try:
-        # Paginate through ALL VGs - max limit is 100
-        vgs = []
-        page = 0
-        page_size = 100
-        while True:
-            response = api.list_volume_groups(_limit=page_size, _page=page)
-            batch = response.data if response and response.data else []
-            vgs.extend(batch)
-            if len(batch) < page_size:
-                break
-            page += 1
-        logger.info(f"Fetched {len(vgs)} total Volume Groups")
-    except Exception as e:
-        logger.error(f"Failed to list volume groups: {e}")
-        sys.exit(1)
+    Everything below talks to Prism Central only through these, so the
+    in-memory fake in fake_nutanix.py can stand in for the SDK to exercise
+    the cleanup without a cluster.
+    """
 
-    # Filter VGs ONLY by storage container - check each VG's disks
-    matching_vgs = []
-    logger.info("Checking each VG's storage container...")
-    for vg in vgs:
-        try:
-            disks_resp = api.list_volume_disks_by_volume_group_id(vg.ext_id)
-            disks = disks_resp.data if disks_resp and disks_resp.data else []
-            
-            # Include VG if ANY disk is in the target container
-            for disk in disks:
-                if hasattr(disk, 'storage_container_id') and disk.storage_container_id == storage_container_id:
-                    matching_vgs.append(vg)
-                    break
-        except Exception as disk_err:
-            logger.warning(f"Could not check disks for {vg.name}: {disk_err}")
-    
-    logger.info(f"Found {len(matching_vgs)} matching Volume Groups in nkp-storage container.")
-
-    for vg in matching_vgs:
-        logger.info(f"Processing Volume Group: {vg.name} ({vg.ext_id})")
-        if dry_run:
-            logger.info(f"[DRY RUN] Would detach and delete Volume Group: {vg.name}")
+    def __init__(self, vms, volume_groups, tasks, vm_attachment):
+        self.vms = vms
+        self.volume_groups = volume_groups
+        self.tasks = tasks
+        self.vm_attachment = vm_attachment
+
+
+def connect(host, port, username, password):
+    """Build SDK clients for VMM, Volumes and Prism (tasks)"""
+    import ntnx_prism_py_client
+    import ntnx_vmm_py_client
+    import ntnx_volumes_py_client
+
+    def client(sdk):
+        config = sdk.Configuration()
+        config.host = host
+        config.port = port
+        config.username = username
+        config.password = password
+        config.verify_ssl = False
+        return sdk.ApiClient(configuration=config)
+
+    def vm_attachment(vm_ext_id):
+        body = ntnx_volumes_py_client.VmAttachment()
+        body.ext_id = vm_ext_id
+        return body
+
+    return NutanixApis(
+        vms=ntnx_vmm_py_client.VmApi(api_client=client(ntnx_vmm_py_client)),
+        volume_groups=ntnx_volumes_py_client.VolumeGroupsApi(api_client=client(ntnx_volumes_py_client)),
+        tasks=ntnx_prism_py_client.TasksApi(api_client=client(ntnx_prism_py_client)),
+        vm_attachment=vm_attachment,
+    )
+
+
+def list_all(fetch, *args):
+    """Page through a v4 list call until a short page comes back"""
+    items = []
+    page = 0
+    while True:
+        response = fetch(*args, _page=page, _limit=PAGE_SIZE)
+        batch = response.data if response and response.data else []
+        items.extend(batch)
+        if len(batch) < PAGE_SIZE:
+            return items
+        page += 1
+
+
+def run_concurrently(func, items, workers):
+    """Apply func to items on a bounded pool.
+
+    Returns (results, failures): item -> result for the calls that returned
+    and item -> exception for those that raised.
+    """
+    results, failures = {}, {}
+    if not items:
+        return results, failures
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as pool:
+        futures = {pool.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                failures[item] = e
+    return results, failures
+
+
+def _state(value):
+    # SDK enums come back as plain strings or as "TaskStatus.X"-style objects
+    return str(value).rsplit(".", 1)[-1].upper() if value is not None else None
+
+
+def task_id(response):
+    """ext_id of the task a mutating call started, if it returned one"""
+    data = getattr(response, "data", None)
+    return getattr(data, "ext_id", None)
+
+
+def wait_for_tasks(apis, task_ids, timeout=TASK_TIMEOUT):
+    """Poll tasks with exponential backoff until all of them finish.
+
+    Returns task id -> None on success or an error message on failure or
+    timeout, so a whole batch is waited on in one loop instead of sleeping
+    a fixed time per item.
+    """
+    pending = {t for t in task_ids if t}
+    outcome = {}
+    delay = TASK_POLL_INITIAL
+    deadline = time.monotonic() + timeout
+    while pending:
+        for ext_id in list(pending):
+            try:
+                task = apis.tasks.get_task_by_id(ext_id).data
+            except Exception as e:
+                logger.warning(f"  Could not poll task {ext_id}: {e}")
+                continue
+            status = _state(getattr(task, "status", None))
+            if status in TASK_DONE:
+                outcome[ext_id] = None
+            elif status in TASK_FAILED:
+                messages = [getattr(m, "message", str(m)) for m in (getattr(task, "error_messages", None) or [])]
+                outcome[ext_id] = f"task {status}: {'; '.join(messages) or 'no details'}"
+            else:
+                continue
+            pending.discard(ext_id)
+        if not pending:
+            break
+        if time.monotonic() >= deadline:
+            for ext_id in pending:
+                outcome[ext_id] = f"task did not finish within {timeout:.0f}s"
+            break
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * TASK_POLL_FACTOR, TASK_POLL_MAX)
+    return outcome
+
+
+def wait_for_task(apis, ext_id, what):
+    """Wait for one task; raises if it failed"""
+    if not ext_id:
+        return
+    error = wait_for_tasks(apis, [ext_id]).get(ext_id)
+    if error:
+        raise RuntimeError(f"{what}: {error}")
+
+
+def _is_gone(error):
+    # The SDKs raise ApiException carrying the HTTP status
+    return getattr(error, 'status', None) == 404
+
+
+class CleanupPlan:
+    """Discovered cleanup work and its progress, persisted as JSON.
+
+    Items are stored in dependency order (volume groups before VMs) and
+    each one's status is written back as soon as it changes, so a re-run
+    resumes only what is left instead of rediscovering the inventory.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, vm_pattern, storage_container, storage_container_id=None, items=None):
+        self.path = path
+        self.vm_pattern = vm_pattern
+        self.storage_container = storage_container
+        self.storage_container_id = storage_container_id
+        self.items = items or []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != cls.VERSION:
+            raise ValueError(f"unsupported plan version {data.get('version')}")
+        return cls(path, data["vm_pattern"], data["storage_container"],
+                   data.get("storage_container_id"), data["items"])
+
+    def matches(self, vm_pattern, storage_container):
+        return self.vm_pattern == vm_pattern and self.storage_container == storage_container
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {
+                "version": self.VERSION,
+                "vm_pattern": self.vm_pattern,
+                "storage_container": self.storage_container,
+                "storage_container_id": self.storage_container_id,
+                "items": self.items,
+            }
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def update(self, item, **fields):
+        """Record progress on one item and persist it"""
+        with self.lock:
+            item.update(fields)
+        self.save()
+
+    def remaining(self, kind):
+        return [i for i in self.items if i["kind"] == kind and i["status"] != "done"]
+
+    def summary(self):
+        counts = {}
+        for item in self.items:
+            key = f"{item['kind']} {item['status']}"
+            counts[key] = counts.get(key, 0) + 1
+        return ", ".join(f"{n} {k}" for k, n in sorted(counts.items())) or "nothing to do"
+
+
+def discover_volume_groups(apis, storage_container_id, workers):
+    """Volume groups with a disk in the storage container, plus their attachments"""
+    api = apis.volume_groups
+    vgs = list_all(api.list_volume_groups)
+    logger.info(f"Fetched {len(vgs)} total Volume Groups")
+
+    # Filter VGs ONLY by storage container - include a VG if ANY disk is in it
+    def inspect(vg):
+        disks = list_all(api.list_volume_disks_by_volume_group_id, vg.ext_id)
+        if not any(getattr(disk, 'storage_container_id', None) == storage_container_id for disk in disks):
+            return None
+        attachments = list_all(api.list_vm_attachments_by_volume_group_id, vg.ext_id)
+        vm_ids = [getattr(a, 'vm_ext_id', None) or getattr(a, 'ext_id', None) for a in attachments]
+        return [v for v in vm_ids if v]
+
+    logger.info(f"Checking each VG's storage container ({workers} workers)...")
+    by_id = {vg.ext_id: vg for vg in vgs}
+    checked, check_errors = run_concurrently(lambda ext_id: inspect(by_id[ext_id]), list(by_id), workers)
+    for ext_id, disk_err in check_errors.items():
+        logger.warning(f"Could not check disks for {by_id[ext_id].name}: {disk_err}")
+    items = [{"kind": "volume_group", "ext_id": vg.ext_id, "name": vg.name, "attachments": checked[vg.ext_id],
+              "detached": [], "status": "pending"} for vg in vgs if checked.get(vg.ext_id) is not None]
+    logger.info(f"Found {len(items)} matching Volume Groups in nkp-storage container.")
+    return items
+
+
+def discover_vms(apis, pattern):
+    """VMs whose name matches the pattern, with their ETag and power state"""
+    vm_regex = re.compile(pattern)
+    vms = list_all(apis.vms.list_vms)
+    logger.info(f"Fetched {len(vms)} total VMs")
+    items = []
+    for vm in vms:
+        if not vm.name or not vm_regex.match(vm.name):
             continue
+        reserved = getattr(vm, '_reserved', None) or {}
+        items.append({"kind": "vm", "ext_id": vm.ext_id, "name": vm.name, "etag": reserved.get('ETag'),
+                      "power_state": _state(getattr(vm, 'power_state', None)), "status": "pending"})
+    logger.info(f"Found {len(items)} matching VMs.")
+    return items
+
+
+def build_plan(apis, path, vm_pattern, storage_container, storage_container_id, workers):
+    items = discover_volume_groups(apis, storage_container_id, workers) + discover_vms(apis, vm_pattern)
+    return CleanupPlan(path, vm_pattern, storage_container, storage_container_id, items)
+
+
+def cleanup_volume_groups(apis, plan, workers):
+    logger.info("\n--- Phase 1: Cleaning up Volume Groups ---")
+    api = apis.volume_groups
+
+    items = {i["ext_id"]: i for i in plan.remaining("volume_group")}
+
+    def delete_vg(ext_id):
+        item = items[ext_id]
+        logger.info(f"Processing Volume Group: {item['name']} ({item['ext_id']})")
+        # First, detach from all VMs and wait for the detaches to land.
+        # Each finished detach is recorded, so a re-run only retries the rest.
+        if item["status"] == "pending":
+            detached = list(item.get("detached", []))
+            tasks, errors = {}, []
+            for vm_ext_id in item["attachments"]:
+                if vm_ext_id in detached:
+                    continue
+                logger.info(f"  Detaching {item['name']} from VM {vm_ext_id}...")
+                try:
+                    task = task_id(api.detach_vm(item["ext_id"], apis.vm_attachment(vm_ext_id)))
+                except Exception as detach_err:
+                    if not _is_gone(detach_err):
+                        errors.append(f"detach from {vm_ext_id}: {detach_err}")
+                        continue
+                    task = None
+                if task:
+                    tasks[task] = vm_ext_id
+                else:
+                    detached.append(vm_ext_id)
+            for task, error in wait_for_tasks(apis, list(tasks)).items():
+                if error:
+                    errors.append(f"detach from {tasks[task]} ({task}): {error}")
+                else:
+                    detached.append(tasks[task])
+            plan.update(item, detached=detached)
+            if errors:
+                raise RuntimeError("; ".join(errors))
+            plan.update(item, status="detached")
 
+        # Now delete VG
         try:
-            # First, detach from all VMs
-            try:
-                attachments_resp = api.list_vm_attachments_by_volume_group_id(vg.ext_id)
-                attachments = attachments_resp.data if attachments_resp and attachments_resp.data else []
-                
-                for attachment in attachments:
-                    vm_ext_id = attachment.vm_ext_id if hasattr(attachment, 'vm_ext_id') else None
-                    if not vm_ext_id and hasattr(attachment, 'ext_id'):
-                        vm_ext_id = attachment.ext_id
-                    
-                    if vm_ext_id:
-                        logger.info(f"  Detaching VG from VM {vm_ext_id}...")
-                        detach_body = ntnx_volumes_py_client.VmAttachment()
-                        detach_body.ext_id = vm_ext_id
-                        api.detach_vm(vg.ext_id, detach_body)
-                        logger.info(f"  Detached successfully")
-            except Exception as detach_err:
-                logger.warning(f"  Could not list/detach attachments: {detach_err}")
-            
-            # Now delete VG
-            api.delete_volume_group_by_id(vg.ext_id)
-            logger.info(f"Successfully initiated deletion for {vg.name}")
+            wait_for_task(apis, task_id(api.delete_volume_group_by_id(item["ext_id"])), "delete")
         except Exception as e:
-            logger.error(f"Failed to delete Volume Group {vg.name}: {e}")
-            sys.exit(1)
+            if not _is_gone(e):
+                raise
+        plan.update(item, status="done", error=None)
+        logger.info(f"Deleted Volume Group {item['name']}")
+
+    _, failures = run_concurrently(delete_vg, list(items), workers)
+    for ext_id, e in failures.items():
+        logger.error(f"Failed to delete Volume Group {items[ext_id]['name']}: {e}")
+        plan.update(items[ext_id], error=str(e))
+
+
+def _fetch_vm(api, ext_id):
+    """Current VM state and the ETag to send as If-Match"""
+    response = api.get_vm_by_id(ext_id)
+    vm_data = response.data
+    etag = None
+    if hasattr(vm_data, '_reserved') and vm_data._reserved:
+        etag = vm_data._reserved.get('ETag')
+    return vm_data, etag
+
+
+def _if_match(item, etag):
+    """The ETag to send; a call without one would be unconditional, so refuse it"""
+    if not etag:
+        raise RuntimeError(f"no ETag returned for VM {item['name']}, not sending the request unconditionally")
+    return etag
 
-def cleanup_vms(dry_run, pattern):
+
+def cleanup_vms(apis, plan, workers):
     logger.info("\n--- Phase 2: Cleaning up VMs ---")
-    client = get_vmm_client()
-    api = ntnx_vmm_py_client.VmApi(api_client=client)
-    vm_regex = re.compile(pattern)
+    api = apis.vms
 
-    try:
-        response = api.list_vms()
-        vms = response.data if response and response.data else []
-    except Exception as e:
-        logger.error(f"Failed to list VMs: {e}")
-        sys.exit(1)
+    # A VM still attached to a volume group we failed to detach waits for the next run
+    blocked = {vm_id: vg["name"] for vg in plan.remaining("volume_group") if vg["status"] == "pending"
+               for vm_id in vg["attachments"] if vm_id not in vg.get("detached", [])}
+    items = {}
+    for item in plan.remaining("vm"):
+        if item["ext_id"] in blocked:
+            logger.warning(f"Skipping VM {item['name']}: volume group {blocked[item['ext_id']]} is still attached")
+            plan.update(item, error=f"volume group {blocked[item['ext_id']]} still attached")
+        else:
+            items[item["ext_id"]] = item
+
+    # Power off every running VM at once, then wait on all the tasks together.
+    # The plan's ETag is tried first; a stale one is refreshed and retried.
+    def power_off(ext_id):
+        item = items[ext_id]
+        if item["power_state"] == 'OFF':
+            return None
+        logger.info(f"  Powering off {item['name']} (last seen: {item['power_state']})...")
+        etag = item["etag"]
+        try:
+            if etag is None:
+                # The list call returned no ETag, so fetch the VM for one
+                vm_data, etag = _fetch_vm(api, item["ext_id"])
+                if _state(getattr(vm_data, 'power_state', None)) == 'OFF':
+                    return None
+            return task_id(api.power_off_vm(item["ext_id"], if_match=_if_match(item, etag)))
+        except Exception as e:
+            if _is_gone(e):
+                return None
+            vm_data, etag = _fetch_vm(api, item["ext_id"])
+            if _state(getattr(vm_data, 'power_state', None)) == 'OFF':
+                return None
+            return task_id(api.power_off_vm(item["ext_id"], if_match=_if_match(item, etag)))
 
-    matching_vms = [vm for vm in vms if vm_regex.match(vm.name)]
-    logger.info(f"Found {len(matching_vms)} matching VMs.")
+    started, power_errors = run_concurrently(power_off, list(items), workers)
+    for ext_id, power_err in power_errors.items():
+        logger.warning(f"  Power off failed for {items[ext_id]['name']}: {power_err}")
+    power_tasks = [task for task in started.values() if task]
+    if power_tasks:
+        logger.info(f"Waiting for {len(power_tasks)} power-off tasks...")
+    outcome = wait_for_tasks(apis, power_tasks)
+    for ext_id, task in started.items():
+        error = outcome.get(task)
+        if error:
+            logger.warning(f"  Power off of {items[ext_id]['name']} failed: {error}")
+        else:
+            plan.update(items[ext_id], power_state='OFF', etag=None)
 
-    for vm in matching_vms:
-        logger.info(f"Processing VM: {vm.name} ({vm.ext_id})")
-        if dry_run:
-            logger.info(f"[DRY RUN] Would power off and delete VM: {vm.name}")
-            continue
+    max_retries = 5
 
-        max_retries = 5
+    def delete_vm(ext_id):
+        item = items[ext_id]
         for attempt in range(max_retries):
             try:
-                # Fetch VM to get fresh ETag and current state
-                single_vm_resp = api.get_vm_by_id(vm.ext_id)
-                vm_data = single_vm_resp.data
-                etag = None
-                if hasattr(vm_data, '_reserved') and vm_data._reserved:
-                    etag = vm_data._reserved.get('ETag')
-                
-                # Force power off first if VM is ON
-                power_state = vm_data.power_state if hasattr(vm_data, 'power_state') else None
-                if power_state and str(power_state).upper() != 'OFF':
-                    logger.info(f"  Powering off VM (current state: {power_state})...")
-                    try:
-                        if etag:
-                            client.add_default_header('If-Match', etag)
-                        api.power_off_vm(vm.ext_id)
-                        logger.info(f"  Power off initiated, waiting 10s...")
-                        time.sleep(10)
-                        # Refresh ETag after power off
-                        single_vm_resp = api.get_vm_by_id(vm.ext_id)
-                        vm_data = single_vm_resp.data
-                        if hasattr(vm_data, '_reserved') and vm_data._reserved:
-                            etag = vm_data._reserved.get('ETag')
-                    except Exception as power_err:
-                        logger.warning(f"  Power off failed: {power_err}")
-                
-                if etag:
-                    client.add_default_header('If-Match', etag)
-                
-                api.delete_vm_by_id(vm.ext_id)
-                logger.info(f"Successfully initiated deletion for {vm.name}")
-                
-                # Remove header for next iteration
-                if hasattr(client, '_ApiClient__default_headers') and 'If-Match' in client._ApiClient__default_headers:
-                    del client._ApiClient__default_headers['If-Match']
-                
-                # Success - break retry loop
+                # Powering off changes the ETag, so only reuse the plan's if untouched
+                etag = item["etag"]
+                if etag is None or attempt:
+                    _, etag = _fetch_vm(api, item["ext_id"])
+                wait_for_task(apis, task_id(api.delete_vm_by_id(item["ext_id"], if_match=_if_match(item, etag))),
+                              "delete")
                 break
-
             except Exception as e:
-                # Cleanup headers
-                if hasattr(client, '_ApiClient__default_headers') and 'If-Match' in client._ApiClient__default_headers:
-                    del client._ApiClient__default_headers['If-Match']
-
+                if _is_gone(e):
+                    break
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 5
-                    logger.warning(f"Failed to delete VM {vm.name} (Attempt {attempt+1}/{max_retries}): {e}. Retrying in {wait_time}s...")
+                    logger.warning(f"Failed to delete VM {item['name']} (Attempt {attempt+1}/{max_retries}): {e}. Retrying in {wait_time}s...")
                     time.sleep(wait_time)
                 else:
-                    logger.error(f"Failed to delete VM {vm.name} after {max_retries} attempts: {e}")
-                    sys.exit(1)
+                    raise
+        plan.update(item, status="done", error=None)
+        logger.info(f"Deleted VM {item['name']}")
+
+    _, failures = run_concurrently(delete_vm, list(items), workers)
+    for ext_id, e in failures.items():
+        logger.error(f"Failed to delete VM {items[ext_id]['name']} after {max_retries} attempts: {e}")
+        plan.update(items[ext_id], error=str(e))
 
-def get_storage_container_id(container_name):
+
+def execute_plan(apis, plan, workers):
+    """Run the remaining items; returns True when nothing is left"""
+    logger.info(f"Executing plan: {plan.summary()}")
+    # Order: VGs FIRST, then VMs.
+    cleanup_volume_groups(apis, plan, workers)
+    cleanup_vms(apis, plan, workers)
+    logger.info(f"Plan status: {plan.summary()}")
+    return not plan.remaining("volume_group") and not plan.remaining("vm")
+
+
+def get_storage_container_id(container_name, host, port, username, password):
     """Look up storage container ID by name using v2 API"""
     import requests
-    url = f"https://{PC_IP}:{PC_PORT}/PrismGateway/services/rest/v2.0/storage_containers"
+    url = f"https://{host}:{port}/PrismGateway/services/rest/v2.0/storage_containers"
     try:
-        response = requests.get(url, auth=(PC_USERNAME, PC_PASSWORD), verify=False)
+        response = requests.get(url, auth=(username, password), verify=False)
         response.raise_for_status()
         data = response.json()
         for container in data.get('entities', []):
@@ -230,29 +465,76 @@ def get_storage_container_id(container_name):
     except Exception as e:
         logger.error(f"Failed to lookup storage container '{container_name}': {e}")
         sys.exit(1)
-    
+
     logger.error(f"Storage container '{container_name}' not found.")
     sys.exit(1)
 
+
+
 def main():
     parser = argparse.ArgumentParser(description="Cleanup Nutanix NKP Resources using SDK")
-    parser.add_argument("--dry-run", action="store_true", help="Simulate deletion")
+    parser.add_argument("--dry-run", action="store_true", help="Show the plan without deleting anything")
     parser.add_argument("--vm-pattern", default=".*(nkp|nai|transit)-cluster.*", help="Regex for VMs")
     parser.add_argument("--vg-pattern", default=".*pvc-.*", help="Regex for Volume Groups")
     parser.add_argument("--storage-container", default="nkp-storage", help="Storage container name to filter VGs")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CLEANUP_WORKERS", "8")),
+                        help="Concurrent Prism Central calls (disk checks, detaches, deletes)")
+    parser.add_argument("--plan-file", default=os.getenv("CLEANUP_PLAN_FILE", "cleanup_nutanix_plan.json"),
+                        help="Where discovery writes the plan and execution records progress")
+    parser.add_argument("--plan-only", action="store_true", help="Discover and write the plan, then stop")
+    parser.add_argument("--replan", action="store_true", help="Ignore an existing plan file and rediscover")
 
     args = parser.parse_args()
 
-    print(f"Connecting to {PC_IP}...")
-    
-    # Look up storage container ID by name
-    storage_container_id = get_storage_container_id(args.storage_container)
-    logger.info(f"Using storage container '{args.storage_container}' (ID: {storage_container_id})")
-    
-    # Order: VGs FIRST, then VMs.
-    cleanup_volume_groups(args.dry_run, storage_container_id)
-    cleanup_vms(args.dry_run, args.vm_pattern)
-    
+    pc_ip = get_env_var("NUTANIX_ENDPOINT")
+    pc_port = os.getenv("NUTANIX_PORT", "9440")
+    pc_username = get_env_var("NUTANIX_USERNAME")
+    pc_password = get_env_var("NUTANIX_PASSWORD")
+
+    print(f"Connecting to {pc_ip}...")
+    apis = connect(pc_ip, pc_port, pc_username, pc_password)
+
+    # Resume an unfinished plan for the same targets instead of rediscovering
+    plan = None
+    if not args.replan and not args.plan_only and os.path.exists(args.plan_file):
+        try:
+            plan = CleanupPlan.load(args.plan_file)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable plan {args.plan_file}: {e}")
+        if plan and not plan.matches(args.vm_pattern, args.storage_container):
+            logger.info(f"Plan {args.plan_file} was made for other targets, rediscovering")
+            plan = None
+        elif plan:
+            logger.info(f"Resuming plan {args.plan_file}: {plan.summary()}")
+
+    if plan is None:
+        # Look up storage container ID by name
+        storage_container_id = get_storage_container_id(args.storage_container, pc_ip, pc_port, pc_username, pc_password)
+        logger.info(f"Using storage container '{args.storage_container}' (ID: {storage_container_id})")
+        try:
+            plan = build_plan(apis, None if args.dry_run else args.plan_file, args.vm_pattern,
+                              args.storage_container, storage_container_id, args.workers)
+        except Exception as e:
+            logger.error(f"Failed to list resources: {e}")
+            sys.exit(1)
+        plan.save()
+        logger.info(f"Plan: {plan.summary()}")
+
+    if args.dry_run:
+        for item in plan.items:
+            if item["status"] != "done":
+                action = "detach and delete Volume Group" if item["kind"] == "volume_group" else "power off and delete VM"
+                logger.info(f"[DRY RUN] Would {action}: {item['name']} ({item['ext_id']})")
+        return
+    if args.plan_only:
+        logger.info(f"Plan written to {args.plan_file}")
+        return
+
+    if not execute_plan(apis, plan, args.workers):
+        logger.error(f"\nCleanup incomplete; progress saved to {args.plan_file}. Re-run to resume.")
+        sys.exit(1)
+
+    os.remove(args.plan_file)
     logger.info("\nCleanup sequence completed successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""In-memory stand-in for the Prism Central v4 SDK APIs the cleanup uses.
+
+FakePrismCentral.apis() returns a NutanixApis that cleanup_nutanix_resources
+drives exactly like the real SDK clients: paginated lists, tasks that run
+for a few polls, If-Match checks against per-VM ETags and 404s for entities
+that are gone. Running this file cleans up a generated inventory and checks
+nothing matching is left, without a cluster:
+
+    python fake_nutanix.py --vms 300 --volume-groups 500
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import cleanup_nutanix_resources as cleanup
+
+STORAGE_CONTAINER_ID = "fake-nkp-storage"
+
+
+class FakeApiException(Exception):
+    """Mirrors the SDKs' ApiException, which carries the HTTP status"""
+
+    def __init__(self, status, reason):
+        super().__init__(f"({status}) {reason}")
+        self.status = status
+
+
+def _response(data):
+    return SimpleNamespace(data=data)
+
+
+def _page(items, _page=0, _limit=cleanup.PAGE_SIZE):
+    return _response(items[_page * _limit:(_page + 1) * _limit])
+
+
+class FakeTasks:
+    """Tasks finish after `polls` status reads; failing ones end FAILED and
+    cancelled ones pass through CANCELING before CANCELED."""
+
+    def __init__(self, polls=2):
+        self.polls = polls
+        self.tasks = {}
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def start(self, outcome="SUCCEEDED", on_success=None):
+        with self.lock:
+            ext_id = f"task-{next(self.ids)}"
+            self.tasks[ext_id] = {"reads": 0, "outcome": outcome, "on_success": on_success}
+        return _response(SimpleNamespace(ext_id=ext_id))
+
+    def get_task_by_id(self, ext_id):
+        with self.lock:
+            task = self.tasks.get(ext_id)
+            if task is None:
+                raise FakeApiException(404, f"task {ext_id} not found")
+            task["reads"] += 1
+            if task["reads"] <= self.polls:
+                status = "RUNNING"
+            elif task["outcome"] == "CANCELED" and task["reads"] <= self.polls * 2:
+                status = "CANCELING"
+            else:
+                status = task["outcome"]
+                if status == "SUCCEEDED" and task["on_success"]:
+                    task.pop("on_success")()
+        errors = [SimpleNamespace(message=f"task {status.lower()}")] if status in cleanup.TASK_FAILED else []
+        return _response(SimpleNamespace(status=status, error_messages=errors))
+
+
+class FakeVolumeGroups:
+    def __init__(self, tasks, groups, disks, attachments):
+        self.tasks = tasks
+        self.groups = groups
+        self.disks = disks
+        self.attachments = attachments
+        self.lock = threading.Lock()
+
+    def _require(self, ext_id):
+        if ext_id not in self.groups:
+            raise FakeApiException(404, f"volume group {ext_id} not found")
+
+    def list_volume_groups(self, **paging):
+        return _page(list(self.groups.values()), **paging)
+
+    def list_volume_disks_by_volume_group_id(self, ext_id, **paging):
+        self._require(ext_id)
+        return _page(self.disks[ext_id], **paging)
+
+    def list_vm_attachments_by_volume_group_id(self, ext_id, **paging):
+        self._require(ext_id)
+        return _page([SimpleNamespace(ext_id=vm) for vm in sorted(self.attachments[ext_id])], **paging)
+
+    def detach_vm(self, ext_id, body):
+        self._require(ext_id)
+        return self.tasks.start(on_success=lambda: self.attachments[ext_id].discard(body.ext_id))
+
+    def delete_volume_group_by_id(self, ext_id):
+        self._require(ext_id)
+        if self.attachments[ext_id]:
+            raise FakeApiException(409, f"volume group {ext_id} is still attached")
+
+        def delete():
+            with self.lock:
+                self.groups.pop(ext_id, None)
+        return self.tasks.start(on_success=delete)
+
+
+class FakeVms:
+    """VMs whose ETag changes on every mutation. Every `etagless`-th VM is
+    listed without one, as Prism Central sometimes does."""
+
+    def __init__(self, tasks, vms, etagless=0):
+        self.tasks = tasks
+        self.vms = vms
+        self.etagless = etagless
+        self.versions = {ext_id: 0 for ext_id in vms}
+        self.lock = threading.Lock()
+
+    def _require(self, ext_id, if_match):
+        if ext_id not in self.vms:
+            raise FakeApiException(404, f"vm {ext_id} not found")
+        if if_match != self._etag(ext_id):
+            raise FakeApiException(412, f"stale or missing If-Match for vm {ext_id}")
+
+    def _etag(self, ext_id):
+        return f"{ext_id}-v{self.versions[ext_id]}"
+
+    def _view(self, ext_id, listed=False):
+        vm = self.vms[ext_id]
+        hidden = listed and self.etagless and int(ext_id.rsplit("-", 1)[-1]) % self.etagless == 0
+        reserved = {} if hidden else {"ETag": self._etag(ext_id)}
+        return SimpleNamespace(ext_id=ext_id, name=vm.name, power_state=vm.power_state, _reserved=reserved)
+
+    def list_vms(self, **paging):
+        with self.lock:
+            return _page([self._view(ext_id, listed=True) for ext_id in self.vms], **paging)
+
+    def get_vm_by_id(self, ext_id):
+        with self.lock:
+            if ext_id not in self.vms:
+                raise FakeApiException(404, f"vm {ext_id} not found")
+            return _response(self._view(ext_id))
+
+    def power_off_vm(self, ext_id, if_match=None):
+        with self.lock:
+            self._require(ext_id, if_match)
+
+        def power_off():
+            with self.lock:
+                self.vms[ext_id].power_state = "OFF"
+                self.versions[ext_id] += 1
+        return self.tasks.start(on_success=power_off)
+
+    def delete_vm_by_id(self, ext_id, if_match=None):
+        with self.lock:
+            self._require(ext_id, if_match)
+            if self.vms[ext_id].power_state != "OFF":
+                raise FakeApiException(409, f"vm {ext_id} is powered on")
+
+        def delete():
+            with self.lock:
+                self.vms.pop(ext_id, None)
+        return self.tasks.start(on_success=delete)
+
+
+class FakePrismCentral:
+    """A generated NKP-style inventory: half the volume groups live in the
+    target container and some are attached to the cluster's VMs."""
+
+    def __init__(self, vms=150, volume_groups=250, other_vms=20, etagless=7, task_polls=2):
+        self.tasks = FakeTasks(task_polls)
+        vm_records = {}
+        for i in range(vms + other_vms):
+            name = f"nkp-cluster-md-{i}" if i < vms else f"unrelated-{i}"
+            vm_records[f"vm-{i}"] = SimpleNamespace(name=name, power_state="ON")
+        groups, disks, attachments = {}, {}, {}
+        for i in range(volume_groups):
+            ext_id = f"vg-{i}"
+            groups[ext_id] = SimpleNamespace(ext_id=ext_id, name=f"pvc-{i}")
+            container = STORAGE_CONTAINER_ID if i % 2 == 0 else "other-container"
+            disks[ext_id] = [SimpleNamespace(storage_container_id=container)]
+            attachments[ext_id] = {f"vm-{i % vms}"} if vms and i % 5 == 0 else set()
+        self.vms = FakeVms(self.tasks, vm_records, etagless)
+        self.volume_groups = FakeVolumeGroups(self.tasks, groups, disks, attachments)
+
+    def apis(self):
+        return cleanup.NutanixApis(
+            vms=self.vms,
+            volume_groups=self.volume_groups,
+            tasks=self.tasks,
+            vm_attachment=lambda vm_ext_id: SimpleNamespace(ext_id=vm_ext_id),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the NKP cleanup against a fake Prism Central")
+    parser.add_argument("--vms", type=int, default=150, help="VMs matching the cluster pattern")
+    parser.add_argument("--volume-groups", type=int, default=250, help="Volume groups, half in the target container")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent calls, as for the real cleanup")
+    args = parser.parse_args()
+
+    cleanup.TASK_POLL_INITIAL, cleanup.TASK_POLL_MAX = 0.01, 0.05
+    fake = FakePrismCentral(args.vms, args.volume_groups)
+    apis = fake.apis()
+    pattern = ".*(nkp|nai|transit)-cluster.*"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plan_file = os.path.join(tmp, "plan.json")
+        started = time.monotonic()
+        plan = cleanup.build_plan(apis, plan_file, pattern, "nkp-storage", STORAGE_CONTAINER_ID, args.workers)
+        plan.save()
+        done = cleanup.execute_plan(apis, plan, args.workers)
+        elapsed = time.monotonic() - started
+
+    left_vms = [vm.name for vm in fake.vms.vms.values() if vm.name.startswith("nkp-cluster")]
+    left_vgs = [ext_id for ext_id, disks in fake.volume_groups.disks.items()
+                if ext_id in fake.volume_groups.groups and disks[0].storage_container_id == STORAGE_CONTAINER_ID]
+    cleanup.logger.info(f"\nFake cleanup finished in {elapsed:.2f}s: {len(left_vms)} VMs and "
+                        f"{len(left_vgs)} volume groups left")
+    if not done or left_vms or left_vgs:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()